@@ -0,0 +1,92 @@
+"""
+compare.py — Diff two benchmark result files and flag regressions
+
+    python -m benchmarks.compare baseline.json candidate.json --threshold 10
+
+Throughput (`*_per_sec`) and recall (`recall_at_*`) metrics regress when they
+drop, latency metrics (`*_ms`, `*seconds`) when they rise, by more than
+`--threshold` percent.
+Exits with status 1 if any metric regressed.
+"""
+
+import argparse
+import json
+import sys
+from typing import Dict, Iterator, Tuple
+
+
+def flatten(results, prefix: str = "") -> Iterator[Tuple[str, float]]:
+    """
+    Yields (dotted.path, value) for every numeric leaf. Search entries are keyed
+    by backend and corpus size rather than list position.
+    """
+    if isinstance(results, dict):
+        for key, value in results.items():
+            yield from flatten(value, f"{prefix}.{key}" if prefix else key)
+    elif isinstance(results, list):
+        for i, item in enumerate(results):
+            label = f"{item['backend']}@{item['size']}" if isinstance(item, dict) and "size" in item else str(i)
+            yield from flatten(item, f"{prefix}.{label}")
+    elif isinstance(results, (int, float)) and not isinstance(results, bool):
+        yield prefix, float(results)
+
+
+def direction(metric: str) -> int:
+    """
+    +1 if higher is better, -1 if lower is better, 0 if the metric is informational.
+    """
+    name = metric.rsplit(".", 1)[-1]
+    if name.endswith("_per_sec") or name.startswith("recall_at_"):
+        return 1
+    if name.endswith("_ms") or name.endswith("seconds"):
+        return -1
+    return 0
+
+
+def compare(baseline: Dict, candidate: Dict, threshold: float) -> Tuple[list, list]:
+    base = dict(flatten(baseline["results"]))
+    cand = dict(flatten(candidate["results"]))
+    rows, regressions = [], []
+    for metric in sorted(base.keys() & cand.keys()):
+        better = direction(metric)
+        if not better or not base[metric]:
+            continue
+        change = (cand[metric] - base[metric]) / base[metric] * 100.0
+        regressed = better * change < -threshold
+        rows.append((metric, base[metric], cand[metric], change, regressed))
+        if regressed:
+            regressions.append(metric)
+    return rows, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare two ResearchMate benchmark runs")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Allowed change in percent before flagging")
+    args = parser.parse_args(argv)
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+
+    for label, doc in (("baseline", baseline), ("candidate", candidate)):
+        env = doc.get("environment", {})
+        print(f"{label:<10} {env.get('commit')}  {env.get('timestamp')}  model={env.get('model')}  cpus={env.get('cpu_count')}")
+
+    rows, regressions = compare(baseline, candidate, args.threshold)
+    width = max([len(r[0]) for r in rows] + [6])
+    print(f"\n{'metric':<{width}}  {'baseline':>12}  {'candidate':>12}  {'change':>8}")
+    for metric, old, new, change, regressed in rows:
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{metric:<{width}}  {old:>12.4g}  {new:>12.4g}  {change:>+7.1f}%{flag}")
+
+    if regressions:
+        print(f"\n{len(regressions)} metric(s) regressed by more than {args.threshold:.0f}%")
+        sys.exit(1)
+    print("\nNo regressions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,460 @@
+"""
+run.py — Reproducible ResearchMate benchmarks
+
+Runs offline against a stub embedder and the fixture PDFs in data/papers, and
+writes one JSON document of results that `benchmarks/compare.py` can diff
+across runs:
+
+    python -m benchmarks.run                                  # all suites
+    python -m benchmarks.run --suites search --sizes 1000,100000 --backend faiss
+    python -m benchmarks.run --real-model --output before.json
+
+Suites:
+    ingest   papers/s and chunks/s through `app.ingest_queries`, cold and with
+             the text already in a (temporary) paper catalog
+    extract  pages/s through `pdf_parser.extract_text_from_pdf`
+    embed    texts/s through `embedder.get_embeddings`, `embedder.embed_batch`
+             and the Gemini `embeddings.get_embeddings` batching path
+    search   p50/p95/p99 `VectorStore.search` latency at each corpus size
+    quantize recall@k against exact search, latency and in-memory bytes per
+             vector for each `LocalCollection` quantization at each corpus size
+    shard    `ShardedVectorStore` search latency and batch queries/s for each
+             shard count (--shard-counts) at each corpus size
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# Benchmarks must not read or pollute the shared on-disk caches
+os.environ["EMBEDDING_CACHE"] = "0"
+os.environ["SUMMARY_CACHE"] = "0"
+os.environ["CATALOG"] = "0"
+
+import numpy as np
+
+from benchmarks.stubs import HashingEmbedder, StubGenai
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+FIXTURE_DIR = REPO_ROOT / "data" / "papers"
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+SUITES = ("ingest", "extract", "embed", "search", "quantize", "shard")
+DEFAULT_SIZES = (1000, 100000, 1000000)
+
+_VOCAB = (
+    "transformer attention diffusion denoising retrieval embedding benchmark dataset graph neural network "
+    "reinforcement policy gradient contrastive language model vision image segmentation detection token "
+    "sparse dense quantization pruning distillation federated privacy robustness adversarial causal "
+    "bayesian inference optimization convergence kernel spectral generative latent variational"
+).split()
+
+
+def percentiles(samples_ms: List[float]) -> Dict[str, float]:
+    values = np.asarray(samples_ms, dtype=np.float64)
+    return {
+        "p50_ms": float(np.percentile(values, 50)),
+        "p95_ms": float(np.percentile(values, 95)),
+        "p99_ms": float(np.percentile(values, 99)),
+        "mean_ms": float(values.mean()),
+    }
+
+
+def fixture_pdfs(directory: Path = FIXTURE_DIR) -> List[Path]:
+    """
+    PDF files in `directory` that actually start with the PDF magic bytes.
+    """
+    pdfs = []
+    for path in sorted(directory.glob("*.pdf")):
+        with open(path, "rb") as f:
+            if f.read(5) == b"%PDF-":
+                pdfs.append(path)
+    return pdfs
+
+
+def synthetic_text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(_VOCAB) for _ in range(words)) + "."
+
+
+@contextlib.contextmanager
+def working_directory(path: Path):
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+def bench_extract(pdfs: List[Path], repeat: int) -> Dict:
+    from PyPDF2 import PdfReader
+
+    from src.pdf_parser import extract_text_from_pdf
+
+    pages = sum(len(PdfReader(str(p)).pages) for p in pdfs)
+    started = time.perf_counter()
+    chars = 0
+    for _ in range(repeat):
+        for pdf in pdfs:
+            chars += len(extract_text_from_pdf(str(pdf)))
+    elapsed = time.perf_counter() - started
+    return {
+        "files": len(pdfs) * repeat,
+        "pages": pages * repeat,
+        "seconds": elapsed,
+        "pages_per_sec": pages * repeat / elapsed if elapsed else 0.0,
+        "chars_per_sec": chars / elapsed if elapsed else 0.0,
+    }
+
+
+@contextlib.contextmanager
+def temporary_catalog(path: Path):
+    """
+    Enables the paper catalog, backed by a fresh file at `path`, for the duration.
+    """
+    import src.catalog as catalog
+
+    previous = catalog._catalog
+    os.environ["CATALOG"] = "1"
+    catalog._catalog = catalog.PaperCatalog(path)
+    try:
+        yield
+    finally:
+        catalog._catalog.close()
+        catalog._catalog = previous
+        os.environ["CATALOG"] = "0"
+
+
+def bench_ingest(pdfs: List[Path], papers: int, backend: str, workdir: Path) -> Dict:
+    """
+    Cold ingest (every PDF extracted), plus a "warm_catalog" ingest into a new
+    store whose papers' text an earlier run already catalogued.
+    """
+    result = _ingest(pdfs, papers, backend, workdir / "cold")
+    with temporary_catalog(workdir / "catalog.sqlite3"):
+        _ingest(pdfs, papers, backend, workdir / "catalog-fill")
+        result["warm_catalog"] = _ingest(pdfs, papers, backend, workdir / "warm-catalog")
+    return result
+
+
+def _ingest(pdfs: List[Path], papers: int, backend: str, workdir: Path) -> Dict:
+    import src.collector as collector
+    from src.app import ingest_queries
+    from src.pipeline import PipelineConfig
+
+    def fake_iter_papers(queries, max_results=5, **kwargs):
+        # Local papers with the PDF already on disk, so the download stage is a no-op
+        for i in range(max_results):
+            pdf = pdfs[i % len(pdfs)]
+            yield {
+                "id": f"bench-{i}",
+                "title": f"Benchmark paper {i} ({pdf.stem})",
+                "abstract": "",
+                "authors": "Bench Author",
+                "url": str(pdf),
+                "pdf_url": None,
+                "pdf_path": str(pdf),
+                "source": "bench",
+                "year": 2024,
+            }
+
+    original = collector.iter_papers
+    collector.iter_papers = fake_iter_papers
+    workdir.mkdir(parents=True, exist_ok=True)
+    try:
+        with working_directory(workdir), contextlib.redirect_stdout(sys.stderr):
+            started = time.perf_counter()
+            report = ingest_queries(["benchmark"], max_papers=papers, config=PipelineConfig(), backend=backend)
+            elapsed = time.perf_counter() - started
+    finally:
+        collector.iter_papers = original
+    return {
+        "papers": report.papers,
+        "chunks": report.chunks,
+        "seconds": elapsed,
+        "docs_per_sec": report.papers / elapsed if elapsed else 0.0,
+        "chunks_per_sec": report.chunks / elapsed if elapsed else 0.0,
+        "stage_utilization": {s.name: s.utilization(report.elapsed) for s in report.stages},
+    }
+
+
+def bench_embed(texts: int, seed: int) -> Dict:
+    from src import embedder, embeddings
+
+    rng = random.Random(seed)
+    corpus = [synthetic_text(rng, rng.randint(20, 200)) for _ in range(texts)]
+    results = {}
+
+    started = time.perf_counter()
+    for text in corpus[:min(texts, 1000)]:
+        embedder.get_embeddings(text)
+    elapsed = time.perf_counter() - started
+    results["local_single"] = {"texts": min(texts, 1000), "seconds": elapsed,
+                               "embeddings_per_sec": min(texts, 1000) / elapsed}
+
+    started = time.perf_counter()
+    embedder.embed_batch(corpus)
+    elapsed = time.perf_counter() - started
+    results["local_batch"] = {"texts": texts, "seconds": elapsed, "embeddings_per_sec": texts / elapsed}
+
+    # Gemini path with a stub client: measures batching/concurrency overhead, not the API
+    stub = StubGenai()
+    previous = embeddings._genai
+    embeddings._genai = stub
+    try:
+        started = time.perf_counter()
+        embeddings.get_embeddings(corpus)
+        elapsed = time.perf_counter() - started
+    finally:
+        embeddings._genai = previous
+    results["gemini_stub"] = {"texts": texts, "requests": stub.requests, "seconds": elapsed,
+                              "embeddings_per_sec": texts / elapsed}
+    return results
+
+
+def build_store(size: int, backend: str, dim: int, workdir: Path, seed: int, write_batch: int = 5000):
+    from src.vectorstore import VectorStore
+
+    rng = np.random.default_rng(seed)
+    text_rng = random.Random(seed)
+    vs = VectorStore(persist_directory=str(workdir / f"store-{backend}-{size}"), backend=backend)
+    for start in range(0, size, write_batch):
+        n = min(write_batch, size - start)
+        vectors = rng.standard_normal((n, dim), dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        vs.collection.upsert(
+            ids=[f"doc-{start + i}#0" for i in range(n)],
+            embeddings=vectors,
+            documents=[synthetic_text(text_rng, 12) for _ in range(n)],
+            metadatas=[{"paper_id": f"doc-{start + i}", "year": 2000 + (start + i) % 25} for i in range(n)],
+        )
+    vs.persist()
+    return vs
+
+
+def bench_search(sizes: List[int], backend: str, queries: int, top_k: int, dim: int, workdir: Path, seed: int) -> List[Dict]:
+    results = []
+    text_rng = random.Random(seed + 1)
+    for size in sizes:
+        started = time.perf_counter()
+        vs = build_store(size, backend, dim, workdir, seed)
+        build_seconds = time.perf_counter() - started
+
+        # Distinct query strings so neither the query-embedding nor the result cache hits
+        texts = [f"{synthetic_text(text_rng, 8)} #{i}" for i in range(queries + 5)]
+        for text in texts[:5]:
+            vs.search(text, top_k=top_k)
+        samples = []
+        for text in texts[5:]:
+            t0 = time.perf_counter()
+            vs.search(text, top_k=top_k)
+            samples.append((time.perf_counter() - t0) * 1000)
+        results.append({
+            "backend": vs.backend,
+            "size": size,
+            "queries": queries,
+            "top_k": top_k,
+            "build_seconds": build_seconds,
+            **percentiles(samples),
+        })
+        print(f"search {vs.backend} n={size}: p50={results[-1]['p50_ms']:.2f}ms "
+              f"p99={results[-1]['p99_ms']:.2f}ms", file=sys.stderr)
+        del vs
+    return results
+
+
+def clustered_vectors(rng: np.random.Generator, n: int, dim: int, clusters: int = 256) -> np.ndarray:
+    """
+    Unit vectors drawn around random topic centers, closer to real embedding
+    geometry than isotropic noise (which is the worst case for quantization).
+    """
+    centers = rng.standard_normal((clusters, dim), dtype=np.float32)
+    vectors = centers[rng.integers(0, clusters, n)] + 0.6 * rng.standard_normal((n, dim), dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def bench_quantize(sizes: List[int], queries: int, top_k: int, dim: int, workdir: Path, seed: int,
+                   write_batch: int = 50000) -> List[Dict]:
+    from src.local_index import LocalCollection
+    from src.quantization import QUANTIZATIONS
+
+    results = []
+    for size in sizes:
+        rng = np.random.default_rng(seed)
+        vectors = clustered_vectors(rng, size, dim)
+        picks = rng.choice(size, queries, replace=False)
+        query_vectors = vectors[picks] + 0.1 * rng.standard_normal((queries, dim), dtype=np.float32)
+
+        truth = None
+        for kind in (None,) + QUANTIZATIONS:
+            collection = LocalCollection(workdir / f"quantize-{size}", kind or "exact", "numpy", quantization=kind)
+            started = time.perf_counter()
+            for start in range(0, size, write_batch):
+                end = min(size, start + write_batch)
+                collection.upsert([f"doc-{i}" for i in range(start, end)], vectors[start:end])
+            build_seconds = time.perf_counter() - started
+
+            collection.query_arrays(query_vectors[:5], top_k)
+            found, samples = [], []
+            for q in query_vectors:
+                t0 = time.perf_counter()
+                ids, _ = collection.query_arrays(q, top_k)
+                samples.append((time.perf_counter() - t0) * 1000)
+                found.append(set(ids[0]))
+            if truth is None:
+                truth = found
+            footprint = collection.footprint()
+            resident = footprint["code_bytes"] or footprint["vector_bytes"]
+            results.append({
+                "backend": f"numpy-{kind or 'float32'}",
+                "size": size,
+                "top_k": top_k,
+                "rerank": collection.rerank if kind else 0,
+                "build_seconds": build_seconds,
+                f"recall_at_{top_k}": float(np.mean([len(f & t) / top_k for f, t in zip(found, truth)])),
+                "bytes_per_vector": resident / size,
+                "memory_reduction": footprint["vector_bytes"] / resident,
+                **percentiles(samples),
+            })
+            print(f"quantize {results[-1]['backend']} n={size}: recall@{top_k}={results[-1][f'recall_at_{top_k}']:.3f} "
+                  f"p50={results[-1]['p50_ms']:.2f}ms {resident / size:.0f} B/vector", file=sys.stderr)
+            del collection
+    return results
+
+
+def bench_shard(sizes: List[int], shard_counts: List[int], backend: str, queries: int, top_k: int, dim: int,
+                workdir: Path, seed: int, write_batch: int = 20000) -> List[Dict]:
+    from src.sharding import ShardedVectorStore
+
+    results = []
+    text_rng = random.Random(seed + 2)
+    for size in sizes:
+        rng = np.random.default_rng(seed)
+        vectors = clustered_vectors(rng, size, dim)
+        for shards in shard_counts:
+            vs = ShardedVectorStore(str(workdir / f"shard-{backend}-{size}-{shards}"), shards, backend)
+            started = time.perf_counter()
+            for start in range(0, size, write_batch):
+                end = min(size, start + write_batch)
+                vs.upsert_embeddings(
+                    [""] * (end - start), vectors[start:end],
+                    [{"paper_id": f"doc-{i}"} for i in range(start, end)], [f"doc-{i}#0" for i in range(start, end)],
+                )
+            vs.persist()
+            build_seconds = time.perf_counter() - started
+
+            texts = [f"{synthetic_text(text_rng, 8)} #{i}" for i in range(queries + 5)]
+            for text in texts[:5]:
+                vs.search(text, top_k=top_k)
+            samples = []
+            for text in texts[5:]:
+                t0 = time.perf_counter()
+                vs.search(text, top_k=top_k)
+                samples.append((time.perf_counter() - t0) * 1000)
+            t0 = time.perf_counter()
+            vs.search_batch(texts, top_k=top_k)
+            batch_seconds = time.perf_counter() - t0
+            results.append({
+                "backend": f"{backend}-x{shards}",
+                "size": size,
+                "shards": shards,
+                "top_k": top_k,
+                "build_seconds": build_seconds,
+                "batch_queries_per_sec": len(texts) / batch_seconds,
+                **percentiles(samples),
+            })
+            print(f"shard {backend} x{shards} n={size}: p50={results[-1]['p50_ms']:.2f}ms "
+                  f"batch={results[-1]['batch_queries_per_sec']:.0f} q/s", file=sys.stderr)
+            vs.close()
+    return results
+
+
+def environment(args) -> Dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                                capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "model": "real" if args.real_model else "stub",
+        "args": vars(args),
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="ResearchMate benchmarks")
+    parser.add_argument("--suites", default=",".join(SUITES), help=f"Comma-separated subset of {','.join(SUITES)}")
+    parser.add_argument("--sizes", default=",".join(str(s) for s in DEFAULT_SIZES), help="Corpus sizes for the search suite")
+    parser.add_argument("--backend", default="numpy", choices=["chroma", "numpy", "faiss", "hnsw"])
+    parser.add_argument("--queries", type=int, default=200, help="Timed searches per corpus size")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--shard-counts", default="1,2,4,8", help="Shard counts for the shard suite")
+    parser.add_argument("--papers", type=int, default=20, help="Papers pushed through the ingest suite")
+    parser.add_argument("--texts", type=int, default=5000, help="Texts embedded by the embed suite")
+    parser.add_argument("--extract-repeat", type=int, default=3, help="Passes over the fixture PDFs")
+    parser.add_argument("--fixtures", default=str(FIXTURE_DIR), help="Directory of fixture PDFs")
+    parser.add_argument("--real-model", action="store_true", help="Use the real SentenceTransformer instead of the stub")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="Results file (default: benchmarks/results/<timestamp>.json)")
+    args = parser.parse_args(argv)
+
+    from src import embedder
+
+    suites = [s.strip() for s in args.suites.split(",") if s.strip()]
+    unknown = set(suites) - set(SUITES)
+    if unknown:
+        parser.error(f"unknown suites: {', '.join(sorted(unknown))}")
+    if not args.real_model:
+        embedder.set_model(HashingEmbedder())
+    dim = embedder.get_model().get_sentence_embedding_dimension()
+
+    pdfs = fixture_pdfs(Path(args.fixtures))
+    if not pdfs and ({"ingest", "extract"} & set(suites)):
+        parser.error(f"no fixture PDFs found in {args.fixtures}")
+
+    results: Dict = {}
+    with tempfile.TemporaryDirectory(prefix="researchmate-bench-") as tmp:
+        workdir = Path(tmp)
+        if "extract" in suites:
+            results["extract"] = bench_extract(pdfs, args.extract_repeat)
+        if "ingest" in suites:
+            results["ingest"] = bench_ingest(pdfs, args.papers, args.backend, workdir)
+        if "embed" in suites:
+            results["embed"] = bench_embed(args.texts, args.seed)
+        if "search" in suites:
+            sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+            results["search"] = bench_search(sizes, args.backend, args.queries, args.top_k, dim, workdir, args.seed)
+        if "quantize" in suites:
+            sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+            results["quantize"] = bench_quantize(sizes, args.queries, args.top_k, dim, workdir, args.seed)
+        if "shard" in suites:
+            sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+            counts = [int(s) for s in args.shard_counts.split(",") if s.strip()]
+            results["shard"] = bench_shard(sizes, counts, args.backend, args.queries, args.top_k, dim, workdir,
+                                           args.seed)
+    embedder.stop_pool()
+
+    document = {"environment": environment(args), "results": results}
+    output = Path(args.output) if args.output else RESULTS_DIR / f"{time.strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(document, indent=2))
+    print(json.dumps(results, indent=2))
+    print(f"Results written to {output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+stubs.py — Offline stand-ins used by the benchmark harness
+
+`HashingEmbedder` replaces the SentenceTransformer model (through
+`src.embedder.set_model`) with a deterministic feature-hashing encoder, so
+benchmarks run without downloading weights and measure the pipeline rather
+than the model. `StubGenai` does the same for the Gemini client behind
+`src.embeddings`, with an optional simulated request latency.
+"""
+
+import re
+import time
+import zlib
+from typing import List, Sequence
+
+import numpy as np
+
+_WORD = re.compile(r"\w+")
+
+# Matches all-MiniLM-L6-v2, so index sizes are realistic
+DEFAULT_DIM = 384
+
+
+class HashingEmbedder:
+    """
+    Bag-of-words feature hashing into `dim` buckets, L2-normalized.
+    """
+
+    def __init__(self, dim: int = DEFAULT_DIM):
+        self.dim = dim
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dim
+
+    def encode(self, texts: Sequence[str], batch_size: int = 32, **kwargs) -> np.ndarray:
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for word in _WORD.findall(text.lower()):
+                out[i, zlib.crc32(word.encode()) % self.dim] += 1.0
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        return out / np.maximum(norms, 1e-12)
+
+
+class StubGenai:
+    """
+    Minimal `google.generativeai` replacement exposing `embed_content`.
+    """
+
+    def __init__(self, dim: int = 768, latency: float = 0.0):
+        self.encoder = HashingEmbedder(dim)
+        self.latency = latency
+        self.requests = 0
+
+    def embed_content(self, model: str, content) -> dict:
+        self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+        texts: List[str] = [content] if isinstance(content, str) else list(content)
+        vectors = self.encoder.encode(texts).tolist()
+        return {"embedding": vectors[0] if isinstance(content, str) else vectors}
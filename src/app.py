@@ -1,54 +1,95 @@
 import argparse
 import logging
-from src.collector import collect_papers
-from src.vectorstore import VectorStore
-from src.embedder import get_embeddings  # ✅ Use embedder.py
+import sys
+from contextlib import nullcontext
+
+from src import metrics
+from src.utils import StartupProfiler
+
+# Heavier modules (vectorstore, pipeline, collector) are imported inside the
+# functions that need them, so each mode only pays for what it uses.
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def ingest_queries(queries, max_papers=5):
+def _phase(profiler, name):
+    return profiler.phase(name) if profiler else nullcontext()
+
+def ingest_queries(queries, max_papers=5, config=None, backend=None, shards=None):
     """
     Ingest papers for a list of queries into Chroma vectorstore.
+    Papers are streamed from all sources and queries concurrently through the staged
+    ingest pipeline (download, extract, chunk, embed, write); returns its report.
+    """
+    from src.collector import iter_papers
+    from src.pipeline import run_pipeline
+    from src.sharding import open_store
+
+    vs = open_store(backend=backend, shards=shards)  # Initialize vectorstore once
+    report = run_pipeline(iter_papers(queries, max_results=max_papers), vs, config)
+    logger.info(f"Ingested {report.papers} papers for {len(queries)} queries")
+    print(report.format())
+    return report
+
+def reindex_catalog(config=None, backend=None, statuses=None, shards=None):
+    """
+    Re-chunks and re-embeds every paper in the paper catalog into the vector store,
+    reading the stored text instead of downloading or parsing PDFs (e.g. after
+    changing the chunk size, or to fill a store for a new embedding model).
+    Papers without extracted text are indexed from their abstract.
     """
-    vs = VectorStore()  # Initialize vectorstore once
-
-    for query in queries:
-        logger.info(f"Starting ingestion for query: '{query}'")
-        papers = collect_papers(query, max_results=max_papers)
-        logger.info(f"Collected {len(papers)} papers for query '{query}'")
-
-        # Prepare valid papers (text -> abstract -> title)
-        valid_papers = []
-        for p in papers:
-            text = p.get("text") or p.get("abstract") or p.get("title") or ""
-            if isinstance(text, list):
-                text = " ".join(text)  # flatten list if needed
-            text = text.strip()
-            if text:
-                p["text_to_embed"] = text
-                valid_papers.append(p)
-
-        logger.info(f"Found {len(valid_papers)} valid papers with text/abstract/title")
-        if not valid_papers:
-            logger.warning("No valid papers to embed.")
-            continue
-
-        texts = [p["text_to_embed"] for p in valid_papers]
-        metadatas = [{"title": p.get("title", "No Title"), "url": p.get("url", "No URL")} for p in valid_papers]
-        ids = [f"{query}_{i}" for i in range(len(texts))]
-
-        # Add to vectorstore (add_documents internally calls embedder)
-        vs.add_documents(texts, metadatas, ids=ids)
-        logger.info(f"Ingested {len(valid_papers)} papers for '{query}'")
-
-def query_vectorstore(query, top_k=3):
+    from dataclasses import replace
+
+    from src.catalog import get_catalog
+    from src.pipeline import PipelineConfig, run_pipeline
+    from src.sharding import open_store
+
+    catalog = get_catalog()
+    if catalog is None:
+        raise ValueError("The paper catalog is disabled (CATALOG=0); nothing to reindex.")
+    logger.info(f"Reindexing {len(catalog)} catalogued papers ({catalog.stats()['by_status']})")
+    config = replace(config or PipelineConfig(), fetch_pdfs=False, refresh=True)
+    vs = open_store(backend=backend, shards=shards)
+    report = run_pipeline(catalog.iter_papers(statuses), vs, config)
+    print(report.format())
+    return report
+
+def migrate_collection(model_name, backend=None, batch_size=None, encode_batch=None, num_workers=None,
+                       shards=None):
+    """
+    Re-embeds the active collection with `model_name` into a new versioned
+    collection and flips the alias to it (resuming an interrupted run).
+    Sharded stores are not supported yet, whether sharding comes from `shards`,
+    VECTOR_SHARDS or the layout of the existing store.
+    """
+    from pathlib import Path
+
+    from src.migrate import migrate
+    from src.sharding import SHARDS_FILE, VECTOR_SHARDS
+    from src.vectorstore import VectorStore
+
+    persist_directory = "chroma_db"
+    if (VECTOR_SHARDS if shards is None else shards) > 1 or (Path(persist_directory) / SHARDS_FILE).exists():
+        raise ValueError("migrate mode does not support sharded stores yet.")
+    vs = VectorStore(persist_directory, backend=backend)
+    summary = migrate(vs, model_name, batch_size=batch_size, encode_batch=encode_batch, num_workers=num_workers)
+    print(f"Migrated {summary['source']} -> {summary['target']}: "
+          f"{summary.get('documents', 0)} documents, {summary['embedded']} embedded, {summary['deleted']} deleted")
+    return summary
+
+def query_vectorstore(query, top_k=3, backend=None, profiler=None, mode=None, prefilter=0, where=None, shards=None):
     """
     Search the vectorstore for a query and print top results.
+    `where` is a metadata filter from `src.metadata.build_where`.
     """
     logger.info(f"Querying vectorstore for: {query}")
-    vs = VectorStore()
-    results = vs.search(query, top_k=top_k)
+    with _phase(profiler, "import src.sharding"):
+        from src.sharding import open_store
+    with _phase(profiler, "open vector store"):
+        vs = open_store(backend=backend, shards=shards)
+    with _phase(profiler, "first search (loads embedding model)"):
+        results = vs.search(query, top_k=top_k, group_by_paper=True, mode=mode, prefilter=prefilter,
+                            where=where)
 
     if not results:
         print("⚠️ No results found.")
@@ -58,24 +99,173 @@ def query_vectorstore(query, top_k=3):
     for i, r in enumerate(results, start=1):
         title = r["metadata"].get("title", "No Title")
         url = r["metadata"].get("url", "No URL")
-        print(f"{i}. {title}\n   🔗 {url}\n")
+        year = r["metadata"].get("year")
+        print(f"{i}. {title}" + (f" ({year})" if year else "") + f"\n   🔗 {url}\n")
+
+def batch_query(queries_file, output=None, top_k=3, backend=None, where=None, chunk_size=4096, shards=None):
+    """
+    Searches every line of `queries_file` ("-" for stdin) and streams one JSON line
+    per query to `output` (stdout by default): {"query", "ids", "distances"}.
+    Queries are read and searched `chunk_size` at a time through `VectorStore.search_batch`.
+    """
+    import json
+    from itertools import islice
+
+    import numpy as np
+
+    from src.sharding import open_store
+
+    vs = open_store(backend=backend, shards=shards)
+    source = sys.stdin if queries_file == "-" else open(queries_file, "r", encoding="utf-8")
+    sink = sys.stdout if output in (None, "-") else open(output, "w", encoding="utf-8")
+    total = 0
+    try:
+        lines = (line.strip() for line in source)
+        queries = (q for q in lines if q)
+        while True:
+            chunk = list(islice(queries, chunk_size))
+            if not chunk:
+                break
+            results = vs.search_batch(chunk, top_k=top_k, where=where)
+            for query, ids, distances in zip(chunk, results["ids"], results["distances"]):
+                found = np.isfinite(distances)
+                sink.write(json.dumps({
+                    "query": query,
+                    "ids": ids[found].tolist(),
+                    "distances": distances[found].tolist(),
+                }) + "\n")
+            total += len(chunk)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if sink is not sys.stdout:
+            sink.close()
+    logger.info(f"Searched {total} queries from {queries_file}")
+    return total
 
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument("--mode", choices=["ingest", "query"], required=True)
+    parser.add_argument("--mode", choices=["ingest", "query", "batch-query", "reindex", "migrate"], required=True)
     parser.add_argument("--queries", nargs="+", help="Queries for ingestion mode")
     parser.add_argument("--query", help="Single query for search mode")
+    parser.add_argument("--queries-file", help="File with one query per line for batch-query mode (- for stdin)")
+    parser.add_argument("--output", default=None, help="JSONL results file for batch-query mode (default: stdout)")
+    parser.add_argument("--top-k", type=int, default=3, help="Results per query")
     parser.add_argument("--max", type=int, default=5)
+    parser.add_argument("--backend", choices=["chroma", "numpy", "faiss", "hnsw"], default=None,
+                        help="Vector store backend (default: VECTOR_BACKEND or chroma)")
+    parser.add_argument("--shards", type=int, default=None,
+                        help="Partition the store across N shards searched in parallel (default: VECTOR_SHARDS or 1)")
+    parser.add_argument("--search-mode", choices=["vector", "lexical", "hybrid"], default=None,
+                        help="Dense, BM25 or fused ranking (default: SEARCH_MODE or vector)")
+    parser.add_argument("--prefilter", type=int, default=0,
+                        help="Score vectors only for the top N BM25 candidates (0 = whole collection)")
+    parser.add_argument("--year-from", type=int, default=None, help="Only papers published in or after this year")
+    parser.add_argument("--year-to", type=int, default=None, help="Only papers published in or before this year")
+    parser.add_argument("--source", choices=["arxiv", "semantic_scholar"], default=None, help="Only papers from this source")
+    parser.add_argument("--author", default=None, help="Only papers with an author of this surname")
+    parser.add_argument("--category", default=None, help="Only papers in this category (e.g. cs.LG)")
+    parser.add_argument("--model", default=None, help="Embedding model to re-embed the store with (migrate mode)")
+    parser.add_argument("--migrate-batch", type=int, default=None, help="Documents per migration batch and checkpoint")
+    parser.add_argument("--batch-size", type=int, default=None, help="Texts per model forward pass")
+    parser.add_argument("--embed-workers", type=int, default=None, help="Processes in the embedding pool (0 = in-process)")
+    parser.add_argument("--download-workers", type=int, default=8, help="Concurrent PDF downloads")
+    parser.add_argument("--extract-workers", type=int, default=4, help="Processes extracting PDF text")
+    parser.add_argument("--embed-batch", type=int, default=256, help="Chunks per embedding call")
+    parser.add_argument("--write-batch", type=int, default=512, help="Chunks per vectorstore write")
+    parser.add_argument("--max-pages", type=int, default=None, help="Pages extracted per PDF")
+    parser.add_argument("--extract-timeout", type=int, default=120, help="Seconds allowed per PDF extraction")
+    parser.add_argument("--chunk-tokens", type=int, default=200, help="Maximum tokens per indexed chunk")
+    parser.add_argument("--chunk-overlap", type=int, default=40, help="Tokens shared by consecutive chunks")
+    parser.add_argument("--queue-size", type=int, default=64, help="Items buffered between pipeline stages")
+    parser.add_argument("--no-pdf", action="store_true", help="Skip PDF download/extraction; embed abstracts/titles only")
+    parser.add_argument("--refresh", action="store_true", help="Re-process papers already in the store (re-embeds changed content only)")
+    parser.add_argument("--revalidate-pdfs", action="store_true",
+                        help="Re-check downloaded PDFs with the server (ETag / Last-Modified) and re-extract changed ones")
+    parser.add_argument("--profile-startup", action="store_true", help="Report import and initialization timings")
+    parser.add_argument("--metrics-json", default=None, help="Write timing/counter metrics for this run to a JSON file")
+    parser.add_argument("--profile", nargs="?", const="", default=None, metavar="OUT",
+                        help="Profile this run and print a summary; optionally save the raw profile to OUT")
+    parser.add_argument("--profiler", choices=["cprofile", "pyinstrument"], default="cprofile",
+                        help="Profiler used by --profile (pyinstrument must be installed)")
     args = parser.parse_args()
 
-    if args.mode == "ingest":
-        if not args.queries:
+    profiler = StartupProfiler().install() if args.profile_startup else None
+    run_profile = metrics.profile_run(args.profile or None, args.profiler) if args.profile is not None else nullcontext()
+    try:
+        with run_profile:
+            run_mode(args, profiler)
+    finally:
+        if profiler:
+            profiler.uninstall()
+            print(profiler.report(), file=sys.stderr)
+        if args.metrics_json:
+            metrics.dump_json(args.metrics_json)
+
+def run_mode(args, profiler=None):
+
+    if args.mode in ("ingest", "reindex"):
+        if args.mode == "ingest" and not args.queries:
             raise ValueError("You must provide --queries for ingest mode.")
-        ingest_queries(args.queries, max_papers=args.max)
+        from src.embedder import stop_pool
+        from src.pipeline import PipelineConfig
+
+        try:
+            config = PipelineConfig(
+                download_workers=args.download_workers,
+                extract_workers=args.extract_workers,
+                embed_batch=args.embed_batch,
+                encode_batch=args.batch_size,
+                embed_workers=args.embed_workers,
+                write_batch=args.write_batch,
+                queue_size=args.queue_size,
+                chunk_tokens=args.chunk_tokens,
+                max_pages=args.max_pages,
+                extract_timeout=args.extract_timeout,
+                chunk_overlap=args.chunk_overlap,
+                fetch_pdfs=not args.no_pdf,
+                refresh=args.refresh,
+                revalidate_pdfs=args.revalidate_pdfs,
+            )
+            if args.mode == "reindex":
+                reindex_catalog(config, backend=args.backend, shards=args.shards)
+            else:
+                ingest_queries(args.queries, max_papers=args.max, config=config, backend=args.backend,
+                               shards=args.shards)
+        finally:
+            stop_pool()
     elif args.mode == "query":
         if not args.query:
             raise ValueError("You must provide --query for query mode.")
-        query_vectorstore(args.query)
+        from src.sharding import VECTOR_SHARDS, sharded_search_error
+
+        if (VECTOR_SHARDS if args.shards is None else args.shards) > 1:
+            error = sharded_search_error(args.search_mode, args.prefilter)
+            if error:
+                raise ValueError(f"{error}; use --search-mode vector without --prefilter, or drop --shards.")
+        from src.metadata import build_where
+
+        where = build_where(args.year_from, args.year_to, args.source, args.author, args.category)
+        query_vectorstore(args.query, top_k=args.top_k, backend=args.backend, profiler=profiler,
+                          mode=args.search_mode, prefilter=args.prefilter, where=where, shards=args.shards)
+    elif args.mode == "batch-query":
+        if not args.queries_file:
+            raise ValueError("You must provide --queries-file for batch-query mode.")
+        from src.metadata import build_where
+
+        where = build_where(args.year_from, args.year_to, args.source, args.author, args.category)
+        batch_query(args.queries_file, output=args.output, top_k=args.top_k, backend=args.backend, where=where,
+                    shards=args.shards)
+    elif args.mode == "migrate":
+        if not args.model:
+            raise ValueError("You must provide --model for migrate mode.")
+        from src.embedder import stop_pool
+
+        try:
+            migrate_collection(args.model, backend=args.backend, batch_size=args.migrate_batch,
+                               encode_batch=args.batch_size, num_workers=args.embed_workers, shards=args.shards)
+        finally:
+            stop_pool()
 
 if __name__ == "__main__":
     main()
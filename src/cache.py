@@ -0,0 +1,331 @@
+"""
+cache.py — In-process and on-disk caches shared across ResearchMate
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Hashable, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from src import metrics
+from src.utils import text_hash
+
+logger = logging.getLogger("researchmate.cache")
+
+DEFAULT_EMBEDDING_CACHE_PATH = Path(__file__).parent.parent / "data" / "embedding_cache.sqlite3"
+
+
+class LRUCache:
+    """
+    Thread-safe, size-bounded in-memory LRU cache with hit/miss counters.
+    A `name` also reports hits and misses to `src.metrics`.
+    """
+
+    def __init__(self, max_entries: int = 10000, name: Optional[str] = None):
+        self.max_entries = max_entries
+        self.name = name
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default=None):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                hit, value = True, self._data[key]
+            else:
+                self.misses += 1
+                hit, value = False, default
+        if self.name:
+            metrics.cache_access(self.name, hit)
+        return value
+
+    def put(self, key: Hashable, value) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+class TTLCache(LRUCache):
+    """
+    LRU cache whose entries also expire `ttl` seconds after they were stored.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 300.0, name: Optional[str] = None):
+        super().__init__(max_entries, name)
+        self.ttl = ttl
+
+    def get(self, key: Hashable, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and time.monotonic() - entry[0] <= self.ttl:
+                self._data.move_to_end(key)
+                self.hits += 1
+                hit, value = True, entry[1]
+            else:
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                hit, value = False, default
+        if self.name:
+            metrics.cache_access(self.name, hit)
+        return value
+
+    def put(self, key: Hashable, value) -> None:
+        super().put(key, (time.monotonic(), value))
+
+
+class DiskCache:
+    """
+    SQLite-backed key/value store for bytes with LRU eviction.
+
+    Entries are evicted least-recently-used first once the cache holds more than
+    `max_entries` rows or `max_bytes` of values. A `ttl` (seconds) makes entries
+    older than that count as misses.
+    """
+
+    def __init__(
+        self,
+        path,
+        max_entries: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        ttl: Optional[float] = None,
+        name: Optional[str] = None,
+    ):
+        self.path = Path(path)
+        self.name = name
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL,"
+            " created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries(accessed)")
+        self._conn.commit()
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, bytes]:
+        """
+        Looks up `keys` and returns a dict of the ones found (expired entries excluded).
+        """
+        found = {}
+        if not keys:
+            return found
+        now = time.time()
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                part = list(keys[start:start + 500])
+                marks = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT key, value, created FROM entries WHERE key IN ({marks})", part
+                ).fetchall()
+                for key, value, created in rows:
+                    if self.ttl is not None and now - created > self.ttl:
+                        continue
+                    found[key] = value
+            if found:
+                self._conn.executemany(
+                    "UPDATE entries SET accessed = ? WHERE key = ?", [(now, k) for k in found]
+                )
+                self._conn.commit()
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        if self.name:
+            metrics.cache_access(self.name, True, len(found))
+            metrics.cache_access(self.name, False, len(keys) - len(found))
+        return found
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.get_many([key]).get(key)
+
+    def put_many(self, items: Dict[str, bytes]) -> None:
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO entries (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                [(k, sqlite3.Binary(v), len(v), now, now) for k, v in items.items()],
+            )
+            self._evict()
+            self._conn.commit()
+
+    def put(self, key: str, value: bytes) -> None:
+        self.put_many({key: value})
+
+    def _evict(self) -> None:
+        if self.ttl is not None:
+            self._conn.execute("DELETE FROM entries WHERE created < ?", (time.time() - self.ttl,))
+        if self.max_entries is not None:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY accessed ASC LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+        if self.max_bytes is not None:
+            (total,) = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()
+            if total > self.max_bytes:
+                excess = total - self.max_bytes
+                freed = 0
+                stale = []
+                for key, size in self._conn.execute("SELECT key, size FROM entries ORDER BY accessed ASC"):
+                    stale.append((key,))
+                    freed += size
+                    if freed >= excess:
+                        break
+                self._conn.executemany("DELETE FROM entries WHERE key = ?", stale)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()
+        return count
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding cache keyed by (model name, text hash).
+
+    Lookups go through a warm in-process LRU first and then the on-disk SQLite
+    store; vectors are kept as float32 bytes.
+    """
+
+    def __init__(self, path=None, max_entries: Optional[int] = 500000, warm_entries: int = 20000):
+        self.disk = DiskCache(path or DEFAULT_EMBEDDING_CACHE_PATH, max_entries=max_entries, name="embedding_disk")
+        self.warm = LRUCache(max_entries=warm_entries, name="embedding_warm")
+
+    @staticmethod
+    def key(model_name: str, text: str) -> str:
+        return f"{model_name}:{text_hash(text)}"
+
+    def get_many(self, model_name: str, texts: Sequence[str]) -> Dict[int, np.ndarray]:
+        """
+        Returns {index: vector} for every text in `texts` that is already cached.
+        """
+        keys = [self.key(model_name, t) for t in texts]
+        found = {}
+        cold = {}
+        for i, key in enumerate(keys):
+            vector = self.warm.get(key)
+            if vector is not None:
+                found[i] = vector
+            else:
+                cold.setdefault(key, []).append(i)
+
+        if cold:
+            for key, blob in self.disk.get_many(list(cold)).items():
+                vector = np.frombuffer(blob, dtype=np.float32)
+                self.warm.put(key, vector)
+                for i in cold[key]:
+                    found[i] = vector
+        return found
+
+    def put_many(self, model_name: str, texts: Iterable[str], vectors) -> None:
+        items = {}
+        for text, vector in zip(texts, vectors):
+            vector = np.asarray(vector, dtype=np.float32)
+            key = self.key(model_name, text)
+            self.warm.put(key, vector)
+            items[key] = vector.tobytes()
+        self.disk.put_many(items)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        return {"warm": self.warm.stats(), "disk": self.disk.stats()}
+
+
+_embedding_cache = None
+_embedding_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """
+    Returns the process-wide embedding cache, or None when disabled with EMBEDDING_CACHE=0.
+    """
+    global _embedding_cache
+    if os.getenv("EMBEDDING_CACHE", "1") == "0":
+        return None
+    with _embedding_cache_lock:
+        if _embedding_cache is None:
+            _embedding_cache = EmbeddingCache(
+                path=os.getenv("EMBEDDING_CACHE_PATH") or DEFAULT_EMBEDDING_CACHE_PATH,
+                max_entries=int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "500000")),
+            )
+            logger.info(f"Using embedding cache at {_embedding_cache.disk.path}")
+    return _embedding_cache
+
+
+def lookup_embeddings(model_name: str, texts: List[str], compute) -> List[np.ndarray]:
+    """
+    Returns one vector per text, calling `compute(missing_texts)` only for cache misses.
+
+    `compute` must return one vector per input text; a None entry marks a failed text,
+    which is returned as None and not cached. Without a cache every text is computed.
+    """
+    cache = get_embedding_cache()
+    if cache is None:
+        return list(compute(texts))
+
+    vectors = [None] * len(texts)
+    for i, vector in cache.get_many(model_name, texts).items():
+        vectors[i] = vector
+
+    missing = [i for i, v in enumerate(vectors) if v is None]
+    if missing:
+        # Identical texts within one call are computed once
+        unique = list(dict.fromkeys(texts[i] for i in missing))
+        computed = dict(zip(unique, compute(unique)))
+        ok = {t: v for t, v in computed.items() if v is not None}
+        cache.put_many(model_name, ok.keys(), ok.values())
+        for i in missing:
+            vector = computed.get(texts[i])
+            vectors[i] = None if vector is None else np.asarray(vector, dtype=np.float32)
+        logger.debug(f"Embedding cache: {len(texts) - len(missing)} hits, {len(missing)} misses")
+    return vectors
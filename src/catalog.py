@@ -0,0 +1,297 @@
+"""
+catalog.py — Paper catalog: metadata and extracted text, keyed by canonical paper id
+
+Every collected paper gets one row keyed by its canonical id (`paper_uid`, e.g.
+"arxiv:2302.07261"), holding its metadata and, once its PDF has been parsed,
+the extracted text (zlib-compressed), per-page offsets into that text, content
+hashes of the PDF and the text, and the extraction status:
+
+    pending    collected, not extracted yet
+    extracted  text available, up to `page_limit` pages when extraction was limited
+    partial    extraction stopped early (timeout or error); retried next time
+    failed     the PDF could not be downloaded or parsed; retried next time
+    no_pdf     no PDF available; the abstract is the paper's text
+
+Ingest reads pages from here instead of downloading and parsing the PDF again,
+and `--mode reindex` re-chunks and re-embeds the whole catalog (for a new chunk
+size or embedding model) without touching the network or PyPDF2.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+
+from src import metrics
+from src.utils import paper_uid
+
+logger = logging.getLogger("researchmate.catalog")
+
+DEFAULT_CATALOG_PATH = Path(__file__).parent.parent / "data" / "catalog.sqlite3"
+
+STATUSES = ("pending", "extracted", "partial", "failed", "no_pdf")
+
+# Paper fields kept in their own columns; anything else collected goes in `extra`
+_FIELDS = ("source", "source_id", "arxiv_id", "title", "authors", "abstract", "url", "pdf_url", "year", "category")
+_TRANSIENT = {
+    "uid", "id", "pdf_path", "text", "pages", "chunks", "query",
+    "status", "error", "pdf_hash", "num_pages", "text_hash", "text_chars", "page_limit", "download_error",
+}
+
+_catalog = None
+_catalog_lock = threading.Lock()
+# Catalogs opened by path with `open_catalog`
+_opened: Dict[str, "PaperCatalog"] = {}
+
+
+def get_catalog() -> Optional["PaperCatalog"]:
+    """
+    Returns the process-wide catalog, or None when disabled with CATALOG=0.
+    """
+    global _catalog
+    if os.getenv("CATALOG", "1") == "0":
+        return None
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = PaperCatalog(os.getenv("CATALOG_PATH") or DEFAULT_CATALOG_PATH)
+            logger.info(f"Using paper catalog at {_catalog.path}")
+    return _catalog
+
+
+def open_catalog(path) -> "PaperCatalog":
+    """
+    This process's catalog at `path` (e.g. in an extraction worker), opened on first use.
+    """
+    path = str(path)
+    with _catalog_lock:
+        if path not in _opened:
+            _opened[path] = PaperCatalog(path)
+    return _opened[path]
+
+
+class PagePacker:
+    """
+    Packs page texts, as they arrive, into the catalog's format: one
+    zlib-compressed blob of the joined text plus the character offset at which
+    each page starts (with the total length appended). Only the compressed
+    bytes are kept, so packing a long document does not hold its text.
+    """
+
+    def __init__(self):
+        self.offsets = [0]
+        self._compressor = zlib.compressobj(6)
+        self._parts = []
+        self._hash = hashlib.sha256()
+
+    def add(self, page: str) -> None:
+        data = page.encode("utf-8")
+        self._parts.append(self._compressor.compress(data))
+        self._hash.update(data)
+        self.offsets.append(self.offsets[-1] + len(page))
+
+    def finish(self) -> tuple:
+        """
+        Returns (blob, offsets, text_hash) for the pages added.
+        """
+        self._parts.append(self._compressor.flush())
+        return b"".join(self._parts), self.offsets, self._hash.hexdigest()
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+
+def pack_pages(pages: Sequence[str]) -> tuple:
+    """
+    Packs a list of page texts at once; see `PagePacker`.
+    """
+    packer = PagePacker()
+    for page in pages:
+        packer.add(page)
+    return packer
+
+
+def unpack_pages(blob: bytes, offsets: Sequence[int]) -> List[str]:
+    text = zlib.decompress(blob).decode("utf-8")
+    return [text[start:end] for start, end in zip(offsets, offsets[1:])]
+
+
+class PaperCatalog:
+    """
+    SQLite table of papers with their compressed extracted text.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS papers ("
+            " uid TEXT PRIMARY KEY, source TEXT, source_id TEXT, arxiv_id TEXT, title TEXT, authors TEXT,"
+            " abstract TEXT, url TEXT, pdf_url TEXT, year INTEGER, category TEXT, extra TEXT,"
+            " status TEXT NOT NULL DEFAULT 'pending', error TEXT, pdf_path TEXT, pdf_hash TEXT,"
+            " text BLOB, page_offsets TEXT, num_pages INTEGER, text_hash TEXT, text_chars INTEGER,"
+            " page_limit INTEGER, added REAL NOT NULL, updated REAL NOT NULL)"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(papers)")}
+        if "page_limit" not in columns:
+            self._conn.execute("ALTER TABLE papers ADD COLUMN page_limit INTEGER")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS papers_status ON papers(status)")
+        self._conn.commit()
+
+    # --- writes ------------------------------------------------------------
+
+    def upsert_papers(self, papers: Iterable[Dict]) -> None:
+        """
+        Records (or refreshes) the metadata of collected papers. Extracted text
+        and status are left untouched for papers already in the catalog.
+        """
+        now = time.time()
+        rows = []
+        for paper in papers:
+            row = {field: paper.get(field) for field in _FIELDS}
+            row["source_id"] = paper.get("source_id") or paper.get("id")
+            extra = {k: v for k, v in paper.items() if k not in _FIELDS and k not in _TRANSIENT and v is not None}
+            rows.append((paper.get("uid") or paper_uid(paper), *(row[f] for f in _FIELDS),
+                         json.dumps(extra) if extra else None, now, now))
+        if not rows:
+            return
+        columns = ", ".join(_FIELDS)
+        updates = ", ".join(f"{f} = COALESCE(excluded.{f}, {f})" for f in _FIELDS)
+        with self._lock:
+            self._conn.executemany(
+                f"INSERT INTO papers (uid, {columns}, extra, added, updated)"
+                f" VALUES (?, {', '.join('?' * len(_FIELDS))}, ?, ?, ?)"
+                f" ON CONFLICT(uid) DO UPDATE SET {updates},"
+                f" extra = COALESCE(excluded.extra, extra), updated = excluded.updated",
+                rows,
+            )
+            self._conn.commit()
+
+    def save_pages(self, uid: str, pages, status: str = "extracted", pdf_path: Optional[str] = None,
+                   pdf_hash: Optional[str] = None, error: Optional[str] = None, page_limit: Optional[int] = None) -> None:
+        """
+        Stores the extracted page texts of a paper (a list, or a `PagePacker`
+        they were streamed into) compressed, with its status. `page_limit`
+        records the page cap the text was extracted under, if it hit one.
+        """
+        if status not in STATUSES:
+            raise ValueError(f"Unknown status '{status}', expected one of {STATUSES}")
+        packer = pages if isinstance(pages, PagePacker) else pack_pages(pages)
+        blob, offsets, digest = packer.finish()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE papers SET status = ?, error = ?, pdf_path = COALESCE(?, pdf_path),"
+                " pdf_hash = COALESCE(?, pdf_hash), text = ?, page_offsets = ?, num_pages = ?, text_hash = ?,"
+                " text_chars = ?, page_limit = ?, updated = ? WHERE uid = ?",
+                (status, error, pdf_path, pdf_hash, sqlite3.Binary(blob), json.dumps(offsets), len(packer),
+                 digest, offsets[-1], page_limit, time.time(), uid),
+            )
+            self._conn.commit()
+        metrics.inc("catalog_text_bytes_total", len(blob))
+
+    def set_status(self, uid: str, status: str, error: Optional[str] = None) -> None:
+        if status not in STATUSES:
+            raise ValueError(f"Unknown status '{status}', expected one of {STATUSES}")
+        with self._lock:
+            self._conn.execute(
+                "UPDATE papers SET status = ?, error = ?, updated = ? WHERE uid = ?", (status, error, time.time(), uid)
+            )
+            self._conn.commit()
+
+    # --- reads -------------------------------------------------------------
+
+    def get_pages(self, uid: str, statuses: Sequence[str] = ("extracted",)) -> Optional[List[str]]:
+        """
+        Page texts of a paper whose extraction status is in `statuses`, else None.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT text, page_offsets FROM papers WHERE uid = ? AND text IS NOT NULL"
+                f" AND status IN ({','.join('?' * len(statuses))})",
+                (uid, *statuses),
+            ).fetchone()
+        metrics.cache_access("catalog", row is not None)
+        if row is None:
+            return None
+        return unpack_pages(row[0], json.loads(row[1]))
+
+    def get(self, uid: str) -> Optional[Dict]:
+        """
+        A paper's metadata and status (without its text).
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                f"SELECT uid, {', '.join(_FIELDS)}, extra, status, error, pdf_path, pdf_hash, num_pages, text_hash,"
+                f" text_chars, page_limit FROM papers WHERE uid = ?",
+                (uid,),
+            )
+            row = cursor.fetchone()
+            names = [d[0] for d in cursor.description]
+        return self._paper(dict(zip(names, row))) if row else None
+
+    def iter_papers(self, statuses: Optional[Sequence[str]] = None, with_pages: bool = True,
+                    batch_size: int = 500) -> Iterator[Dict]:
+        """
+        Yields every catalogued paper (optionally only those in `statuses`) as a
+        collector-style paper dict with its `uid` and, when extracted, `pages`.
+        """
+        condition = f"AND status IN ({','.join('?' * len(statuses))})" if statuses else ""
+        params = list(statuses or [])
+        text_columns = ", text, page_offsets" if with_pages else ""
+        last = ""
+        while True:
+            with self._lock:
+                cursor = self._conn.execute(
+                    f"SELECT uid, {', '.join(_FIELDS)}, extra, status, pdf_path, num_pages{text_columns}"
+                    f" FROM papers WHERE uid > ? {condition} ORDER BY uid LIMIT ?",
+                    (last, *params, batch_size),
+                )
+                rows = cursor.fetchall()
+                names = [d[0] for d in cursor.description]
+            if not rows:
+                return
+            for row in rows:
+                record = dict(zip(names, row))
+                blob, offsets = record.pop("text", None), record.pop("page_offsets", None)
+                paper = self._paper(record)
+                if blob is not None and record["status"] in ("extracted", "partial"):
+                    paper["pages"] = unpack_pages(blob, json.loads(offsets))
+                yield paper
+            last = rows[-1][0]
+
+    def stats(self) -> Dict:
+        """
+        Paper counts by status and the stored text size, compressed and not.
+        """
+        with self._lock:
+            by_status = dict(self._conn.execute("SELECT status, COUNT(*) FROM papers GROUP BY status").fetchall())
+            compressed, chars = self._conn.execute(
+                "SELECT COALESCE(SUM(LENGTH(text)), 0), COALESCE(SUM(text_chars), 0) FROM papers"
+            ).fetchone()
+        return {"papers": sum(by_status.values()), "by_status": by_status,
+                "text_bytes": compressed, "text_chars": chars}
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM papers").fetchone()[0]
+
+    @staticmethod
+    def _paper(record: Dict) -> Dict:
+        extra = record.pop("extra", None)
+        paper = dict(json.loads(extra)) if extra else {}
+        paper.update({k: v for k, v in record.items() if v is not None})
+        paper["id"] = paper.get("source_id")
+        return paper
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,169 @@
+"""
+chunker.py — Split extracted paper text into token-bounded, section-aware chunks
+
+Text arrives page by page (see `pdf_parser.iter_pdf_pages`) and is cut into
+overlapping chunks that fit the embedding model's input window. A detected
+section heading always starts a new chunk, so chunks do not straddle sections,
+and the bibliography is skipped by default.
+"""
+
+import re
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence
+
+# all-MiniLM-L6-v2 truncates at 256 word pieces; leave headroom for sub-word splits
+DEFAULT_MAX_TOKENS = 200
+DEFAULT_OVERLAP = 40
+
+_TOKEN = re.compile(r"\w+|[^\w\s]")
+_WORD = re.compile(r"\S+")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9(\[])")
+
+_KNOWN_SECTIONS = (
+    "abstract", "introduction", "related work", "background", "preliminaries", "method", "methods",
+    "methodology", "approach", "experiments", "experiment", "experimental setup", "evaluation",
+    "results", "discussion", "analysis", "limitations", "conclusion", "conclusions", "future work",
+    "references", "bibliography", "acknowledgments", "acknowledgements", "appendix",
+)
+# "3 Method", "4.2 Training details", "IV. Results"; the section number is short,
+# so years ("2019 Workshop on ...") and long footnote markers do not match
+_NUMBERED_HEADING = re.compile(r"^(?:\d{1,2}(?:\.\d{1,2}){0,3}\.?|[IVX]{1,4}\.)\s+([A-Z][A-Za-z0-9 ,:&\-]{2,60})$")
+_HEADING_MAX_WORDS = 8
+# A title does not end on these; a wrapped line of body text often does
+_TRAILING_BODY_WORDS = {
+    "a", "an", "and", "are", "as", "at", "by", "for", "from", "in", "is", "of", "on", "or", "the", "to", "was",
+    "were", "with",
+}
+# Numbered affiliation, footnote and venue lines ("2 Department of Physics, ...")
+_NON_HEADING_WORDS = {
+    "university", "department", "institute", "laboratory", "school", "college", "inc", "corp", "workshop",
+    "conference", "proceedings", "journal", "vol", "pp", "email", "http", "https", "www", "corresponding",
+    "contribution", "we", "our", "thank", "thanks",
+}
+
+
+def count_tokens(text: str) -> int:
+    """
+    Cheap token estimate: words and punctuation marks each count as one token.
+    """
+    return len(_TOKEN.findall(text))
+
+
+def tokenizer_counter(tokenizer) -> Callable[[str], int]:
+    """
+    Wraps a Hugging Face tokenizer (e.g. `get_model().tokenizer`) as an exact token counter.
+    """
+    return lambda text: len(tokenizer.tokenize(text))
+
+
+def detect_heading(line: str) -> Optional[str]:
+    """
+    Returns the normalized section name if `line` looks like a section heading.
+    """
+    line = line.strip()
+    if not line or len(line) > 80:
+        return None
+    m = _NUMBERED_HEADING.match(line)
+    name = (m.group(1) if m else line).strip().rstrip(".:").lower()
+    if name in _KNOWN_SECTIONS or (m and _looks_like_title(name)):
+        return name
+    return None
+
+
+def _looks_like_title(name: str) -> bool:
+    words = re.findall(r"[a-z0-9]+", name)
+    return (
+        0 < len(words) <= _HEADING_MAX_WORDS
+        and words[-1] not in _TRAILING_BODY_WORDS
+        and not any(w in _NON_HEADING_WORDS for w in words)
+    )
+
+
+def _split_long(sentence: str, max_tokens: int, counter: Callable[[str], int]) -> List[str]:
+    words = _WORD.findall(sentence)
+    pieces, current = [], []
+    for word in words:
+        current.append(word)
+        if counter(" ".join(current)) > max_tokens and len(current) > 1:
+            current.pop()
+            pieces.append(" ".join(current))
+            current = [word]
+    if current:
+        pieces.append(" ".join(current))
+    return pieces
+
+
+def iter_chunks(
+    pages: Iterable[str],
+    max_tokens: int = DEFAULT_MAX_TOKENS,
+    overlap: int = DEFAULT_OVERLAP,
+    counter: Callable[[str], int] = count_tokens,
+    skip_sections: Sequence[str] = ("references", "bibliography"),
+) -> Iterator[Dict]:
+    """
+    Streams chunks out of an iterable of page texts.
+
+    Each chunk is a dict with `text`, `index`, `page` (1-based page the chunk starts on)
+    and `section` (last heading seen, or "" before the first one). Consecutive chunks in
+    the same section share about `overlap` tokens of trailing sentences.
+    """
+    index = 0
+    section = ""
+    skipping = False
+    window: List[tuple] = []  # (sentence, tokens)
+    window_tokens = 0
+    start_page = 1
+
+    def emit():
+        nonlocal index
+        chunk = {"text": " ".join(s for s, _ in window), "index": index, "page": start_page, "section": section}
+        index += 1
+        return chunk
+
+    def carry_overlap():
+        kept, kept_tokens = [], 0
+        for sentence, tokens in reversed(window):
+            if kept_tokens + tokens > overlap:
+                break
+            kept.insert(0, (sentence, tokens))
+            kept_tokens += tokens
+        return kept, kept_tokens
+
+    for page_no, page in enumerate(pages, start=1):
+        for line in (page or "").splitlines():
+            heading = detect_heading(line)
+            if heading:
+                if window:
+                    yield emit()
+                window, window_tokens = [], 0
+                section = heading
+                skipping = heading in skip_sections
+                continue
+            if skipping:
+                continue
+            for sentence in _SENTENCE_END.split(line.strip()):
+                if not sentence:
+                    continue
+                tokens = counter(sentence)
+                parts = [(sentence, tokens)] if tokens <= max_tokens else [
+                    (p, counter(p)) for p in _split_long(sentence, max_tokens, counter)
+                ]
+                for part, part_tokens in parts:
+                    if window and window_tokens + part_tokens > max_tokens:
+                        yield emit()
+                        window, window_tokens = carry_overlap()
+                        while window and window_tokens + part_tokens > max_tokens:
+                            window_tokens -= window.pop(0)[1]
+                    if not window:
+                        start_page = page_no
+                    window.append((part, part_tokens))
+                    window_tokens += part_tokens
+
+    if window:
+        yield emit()
+
+
+def chunk_text(text: str, max_tokens: int = DEFAULT_MAX_TOKENS, overlap: int = DEFAULT_OVERLAP) -> List[str]:
+    """
+    Splits a single string into overlapping token-bounded chunks. Returns [] for empty text.
+    """
+    return [c["text"] for c in iter_chunks([text or ""], max_tokens, overlap)]
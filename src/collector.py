@@ -4,63 +4,166 @@ collector.py — Collect research papers from arXiv & Semantic Scholar
 
 import feedparser
 import requests
-import urllib.parse
 import logging
-from typing import List, Dict
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from requests.adapters import HTTPAdapter
+
+from src import metrics
+from src.utils import parse_arxiv_id, retry
 
 logger = logging.getLogger("src.collector")
 
+# Endpoints can be pointed at a local stub server through the environment, or per
+# call with `base_url` / `base_urls`
+ARXIV_API_URL = os.getenv("ARXIV_BASE", "http://export.arxiv.org/api/query")
+SEMANTIC_SCHOLAR_API_URL = os.getenv(
+    "SEMANTIC_SCHOLAR_BASE", "https://api.semanticscholar.org/graph/v1/paper/search"
+)
+
+# Minimum seconds between requests to each source (arXiv asks for one every 3s)
+RATE_LIMITS = {
+    "arxiv": float(os.getenv("ARXIV_MIN_INTERVAL", "3.0")),
+    "semantic_scholar": float(os.getenv("SEMANTIC_SCHOLAR_MIN_INTERVAL", "1.0")),
+}
+
+# Results requested per page when paging past the first response
+PAGE_SIZES = {"arxiv": 100, "semantic_scholar": 100}
+
+SOURCES = ("arxiv", "semantic_scholar")
+
+
+class RateLimiter:
+    """
+    Spaces calls at least `min_interval` seconds apart across all threads.
+    """
+
+    def __init__(self, min_interval: float):
+        self.min_interval = min_interval
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.min_interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+_sessions: Dict[str, requests.Session] = {}
+_limiters: Dict[str, RateLimiter] = {}
+_registry_lock = threading.Lock()
+
+
+def get_session(source: str) -> requests.Session:
+    """
+    Returns the pooled keep-alive session shared by every request to `source`.
+    """
+    with _registry_lock:
+        if source not in _sessions:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            if source == "semantic_scholar" and os.getenv("SEMANTIC_SCHOLAR_API_KEY"):
+                session.headers["x-api-key"] = os.getenv("SEMANTIC_SCHOLAR_API_KEY")
+            _sessions[source] = session
+        return _sessions[source]
+
+
+def get_rate_limiter(source: str) -> RateLimiter:
+    with _registry_lock:
+        if source not in _limiters:
+            _limiters[source] = RateLimiter(RATE_LIMITS.get(source, 0.0))
+        return _limiters[source]
+
+
+@retry(requests.RequestException, tries=3, delay=2.0)
+def _fetch(source: str, url: str, params: Dict) -> requests.Response:
+    with metrics.span("rate_limit_wait", source=source):
+        get_rate_limiter(source).wait()
+    with metrics.span("http_fetch", source=source):
+        resp = get_session(source).get(url, params=params, timeout=15)
+    metrics.inc("http_responses_total", source=source, status=resp.status_code)
+    if resp.status_code == 429 or resp.status_code >= 500:
+        resp.raise_for_status()
+    return resp
+
+
 # --- Helper: Search arXiv ---
-def search_arxiv(query: str, max_results: int = 5) -> List[Dict]:
-    logger.info(f"Searching arXiv for query: '{query}'")
+def search_arxiv(query: str, max_results: int = 5, start: int = 0, base_url: Optional[str] = None) -> List[Dict]:
+    logger.info(f"Searching arXiv for query: '{query}' (start={start})")
 
-    base_url = "http://export.arxiv.org/api/query"
-    encoded_query = urllib.parse.quote(query)
-    url = f"{base_url}?search_query=all:{encoded_query}&start=0&max_results={max_results}"
+    params = {"search_query": f"all:{query}", "start": start, "max_results": max_results}
+    try:
+        resp = _fetch("arxiv", base_url or ARXIV_API_URL, params)
+        resp.raise_for_status()
+    except Exception as e:
+        logger.warning(f"arXiv fetch failed: {e}")
+        return []
 
-    feed = feedparser.parse(url)
+    feed = feedparser.parse(resp.content)
     papers = []
 
     for entry in feed.entries:
         pdf_url = None
-        for link in entry.links:
+        for link in entry.get("links", []):
             if link.get("title") == "pdf" or link.get("type") == "application/pdf":
                 pdf_url = link.get("href")
                 break
 
+        published = entry.get("published", "")
         papers.append({
-            "id": entry.get("id", "")[-10:],
+            # Versioned arXiv id ("2302.07261v2", "math/0204289v1"), not a fixed-width slice of the URL
+            "id": entry.get("id", "").rsplit("/abs/", 1)[-1],
+            "arxiv_id": parse_arxiv_id(entry.get("id")),
             "title": entry.get("title", "No title"),
-            "authors": ", ".join(a.name for a in entry.authors),
-            "pdf_url": pdf_url
+            "abstract": " ".join(entry.get("summary", "").split()),
+            "authors": ", ".join(a.name for a in entry.get("authors", [])),
+            "url": entry.get("id"),
+            "pdf_url": pdf_url,
+            "year": int(published[:4]) if published[:4].isdigit() else None,
+            "category": (entry.get("arxiv_primary_category") or {}).get("term"),
         })
 
     return papers
 
 
 # --- Helper: Search Semantic Scholar ---
-def search_semantic_scholar(query: str, max_results: int = 5) -> List[Dict]:
-    logger.info(f"Searching Semantic Scholar for query: '{query}'")
+def search_semantic_scholar(query: str, max_results: int = 5, offset: int = 0, base_url: Optional[str] = None) -> List[Dict]:
+    logger.info(f"Searching Semantic Scholar for query: '{query}' (offset={offset})")
 
-    API_URL = "https://api.semanticscholar.org/graph/v1/paper/search"
     params = {
         "query": query,
+        "offset": offset,
         "limit": max_results,
-        "fields": "title,authors,url,isOpenAccess,openAccessPdf"
+        "fields": "title,abstract,authors,url,externalIds,isOpenAccess,openAccessPdf,year,fieldsOfStudy"
     }
 
     papers = []
     try:
-        resp = requests.get(API_URL, params=params, timeout=10)
+        resp = _fetch("semantic_scholar", base_url or SEMANTIC_SCHOLAR_API_URL, params)
         if resp.status_code == 200:
             data = resp.json()
             for paper in data.get("data", []):
-                pdf_url = paper.get("openAccessPdf", {}).get("url")
+                pdf_url = (paper.get("openAccessPdf") or {}).get("url")
                 papers.append({
                     "id": paper.get("paperId"),
+                    "arxiv_id": parse_arxiv_id((paper.get("externalIds") or {}).get("ArXiv")),
                     "title": paper.get("title"),
+                    "abstract": paper.get("abstract") or "",
                     "authors": ", ".join(a["name"] for a in paper.get("authors", [])),
-                    "pdf_url": pdf_url
+                    "url": paper.get("url"),
+                    "pdf_url": pdf_url,
+                    "year": paper.get("year"),
+                    "category": (paper.get("fieldsOfStudy") or [None])[0],
                 })
     except Exception as e:
         logger.warning(f"Semantic Scholar fetch failed: {e}")
@@ -68,14 +171,104 @@ def search_semantic_scholar(query: str, max_results: int = 5) -> List[Dict]:
     return papers
 
 
+SEARCHERS = {"arxiv": search_arxiv, "semantic_scholar": search_semantic_scholar}
+
+
+def iter_source(
+    source: str,
+    query: str,
+    max_results: int = 5,
+    page_size: Optional[int] = None,
+    base_url: Optional[str] = None,
+) -> Iterator[List[Dict]]:
+    """
+    Pages through `source` for `query` and yields each page of papers, stopping
+    after `max_results` papers or when the source runs out of results.
+    `base_url` overrides the source's endpoint.
+    """
+    search = SEARCHERS[source]
+    page_size = min(page_size or PAGE_SIZES[source], max_results)
+    fetched = 0
+    while fetched < max_results:
+        page = search(query, min(page_size, max_results - fetched), fetched, base_url)
+        if not page:
+            break
+        fetched += len(page)
+        yield page
+        if len(page) < page_size:
+            break
+
+
+def iter_papers(
+    queries: Iterable[str],
+    max_results: int = 5,
+    sources: Iterable[str] = SOURCES,
+    max_workers: int = 8,
+    page_size: Optional[int] = None,
+    buffer_size: int = 256,
+    base_urls: Optional[Dict[str, str]] = None,
+) -> Iterator[Dict]:
+    """
+    Fans out over every (source, query) pair concurrently and yields papers as soon
+    as their page arrives. Each paper is tagged with the `query` and `source` it came from.
+    `base_urls` maps a source to an endpoint overriding its default.
+
+    The internal buffer is bounded, so a slow consumer holds back the fetch threads.
+    """
+    tasks = [(source, query) for query in queries for source in sources]
+    if not tasks:
+        return
+
+    out = queue.Queue(maxsize=buffer_size)
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                out.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def run(source, query):
+        try:
+            for page in iter_source(source, query, max_results, page_size, (base_urls or {}).get(source)):
+                metrics.inc("papers_collected_total", len(page), source=source)
+                for paper in page:
+                    paper["query"] = query
+                    paper["source"] = source
+                    if not put(paper):
+                        return
+        except Exception as e:
+            logger.warning(f"{source} collection failed for '{query}': {e}")
+        finally:
+            put(done)
+
+    executor = ThreadPoolExecutor(max_workers=min(max_workers, len(tasks)), thread_name_prefix="collector")
+    try:
+        for source, query in tasks:
+            executor.submit(run, source, query)
+        remaining = len(tasks)
+        while remaining:
+            item = out.get()
+            if item is done:
+                remaining -= 1
+                continue
+            yield item
+    finally:
+        stop.set()
+        executor.shutdown(wait=False)
+
+
 # --- Main Function ---
+@metrics.timed()
 def collect_papers(query: str, max_results: int = 5) -> List[Dict]:
     """
     Collect papers from arXiv and Semantic Scholar for a given query.
     """
-    arxiv_papers = search_arxiv(query, max_results)
-    semantic_papers = search_semantic_scholar(query, max_results)
-    all_papers = arxiv_papers + semantic_papers
+    all_papers = list(iter_papers([query], max_results))
 
     logger.info(f"Collected {len(all_papers)} papers for query '{query}'")
     return all_papers
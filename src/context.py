@@ -0,0 +1,183 @@
+"""
+context.py — Pack retrieved chunks into a token-budgeted prompt context
+
+Retrieved hits are re-ranked with maximal marginal relevance (MMR) over the
+embeddings the store already holds (relevance comes from the cross-encoder
+score when the hits were re-ranked by `src.reranker`), so near-duplicate chunks (overlapping
+windows, the same abstract from two sources) are dropped rather than sent twice.
+Chunks are then added best-first until the budget runs out; a chunk that does
+not fit whole is cut down to its most query-relevant sentences.
+"""
+
+import logging
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.chunker import count_tokens
+
+logger = logging.getLogger("researchmate.context")
+
+DEFAULT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+# Chunks at least this cosine-similar to one already selected are treated as duplicates
+DEDUP_THRESHOLD = 0.95
+# Trade-off between relevance (1.0) and diversity (0.0) in MMR selection
+MMR_LAMBDA = 0.7
+# Do not bother adding a trimmed chunk with less room than this
+MIN_CHUNK_TOKENS = 24
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+_WORD = re.compile(r"\w+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from how in into is it of on or that the this to what which with".split()
+)
+
+
+@dataclass
+class PackedContext:
+    text: str
+    tokens: int
+    budget: int
+    ids: List[str] = field(default_factory=list)
+    duplicates: int = 0
+    trimmed: int = 0
+    dropped: int = 0
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def mmr_order(
+    query_embedding: np.ndarray,
+    embeddings: np.ndarray,
+    lambda_mult: float = MMR_LAMBDA,
+    dedup_threshold: float = DEDUP_THRESHOLD,
+    relevance: Optional[Sequence[float]] = None,
+) -> Tuple[List[int], int]:
+    """
+    Orders candidates by maximal marginal relevance and drops near-duplicates.
+    `relevance` overrides the query-embedding cosine similarity as relevance score.
+
+    Returns (selected indices in order, number of duplicates dropped).
+    """
+    vectors = _normalize(np.asarray(embeddings, dtype=np.float32))
+    if relevance is None:
+        query = _normalize(np.asarray(query_embedding, dtype=np.float32).reshape(1, -1))[0]
+        relevance = vectors @ query
+    else:
+        relevance = np.asarray(relevance, dtype=np.float32)
+    similarity = vectors @ vectors.T
+
+    selected: List[int] = []
+    remaining = list(range(len(vectors)))
+    duplicates = 0
+    while remaining:
+        if selected:
+            redundancy = similarity[np.ix_(remaining, selected)].max(axis=1)
+        else:
+            redundancy = np.zeros(len(remaining), dtype=np.float32)
+        best = int(np.argmax(lambda_mult * relevance[remaining] - (1 - lambda_mult) * redundancy))
+        candidate = remaining.pop(best)
+        if selected and redundancy[best] >= dedup_threshold:
+            duplicates += 1
+            continue
+        selected.append(candidate)
+    return selected, duplicates
+
+
+def _terms(text: str) -> set:
+    return {w for w in _WORD.findall(text.lower()) if w not in _STOPWORDS}
+
+
+def trim_to_budget(text: str, query: str, budget: int, counter: Callable[[str], int] = count_tokens) -> str:
+    """
+    Keeps the sentences of `text` that share the most terms with `query` (in their
+    original order) until `budget` tokens are used. Returns "" if nothing fits.
+    """
+    sentences = [s for s in _SENTENCE_END.split(text.strip()) if s]
+    query_terms = _terms(query)
+    ranked = sorted(
+        range(len(sentences)),
+        key=lambda i: (-len(_terms(sentences[i]) & query_terms), i),
+    )
+    keep, used = [], 0
+    for i in ranked:
+        tokens = counter(sentences[i])
+        if used + tokens <= budget:
+            keep.append(i)
+            used += tokens
+    return " ".join(sentences[i] for i in sorted(keep))
+
+
+def _label(number: int, hit: Dict) -> str:
+    meta = hit.get("metadata") or {}
+    title = meta.get("title") or hit.get("id", "")
+    section = meta.get("section")
+    return f"[{number}] {title}" + (f" ({section})" if section else "")
+
+
+def build_context(
+    query: str,
+    hits: Sequence[Dict],
+    token_budget: int = DEFAULT_TOKEN_BUDGET,
+    query_embedding: Optional[np.ndarray] = None,
+    counter: Callable[[str], int] = count_tokens,
+    lambda_mult: float = MMR_LAMBDA,
+    dedup_threshold: float = DEDUP_THRESHOLD,
+) -> PackedContext:
+    """
+    Packs search hits (as returned by `VectorStore.search`) into at most
+    `token_budget` tokens of labelled context.
+
+    When hits carry an "embedding" and `query_embedding` is given, they are
+    ordered by MMR and near-duplicates are dropped; otherwise search order is kept.
+    Hits that all carry a cross-encoder "rerank_score" use it as MMR relevance.
+    """
+    order = list(range(len(hits)))
+    duplicates = 0
+    if query_embedding is not None and hits and all(h.get("embedding") is not None for h in hits):
+        relevance = [h["rerank_score"] for h in hits] if all("rerank_score" in h for h in hits) else None
+        order, duplicates = mmr_order(
+            query_embedding, np.vstack([h["embedding"] for h in hits]), lambda_mult, dedup_threshold, relevance
+        )
+
+    parts, ids = [], []
+    used = trimmed = dropped = 0
+    for i in order:
+        hit = hits[i]
+        label = _label(len(parts) + 1, hit)
+        room = token_budget - used - counter(label)
+        if room < MIN_CHUNK_TOKENS:
+            dropped += 1
+            continue
+        text = hit.get("document") or ""
+        tokens = counter(text)
+        if tokens > room:
+            text = trim_to_budget(text, query, room, counter)
+            if not text:
+                dropped += 1
+                continue
+            tokens = counter(text)
+            trimmed += 1
+        parts.append(f"{label}\n{text}")
+        ids.append(hit.get("id"))
+        used += counter(label) + tokens
+
+    logger.info(
+        f"Packed {len(parts)} of {len(hits)} chunks into {used}/{token_budget} tokens "
+        f"({duplicates} duplicates, {trimmed} trimmed, {dropped} dropped)"
+    )
+    return PackedContext(
+        text="\n\n".join(parts),
+        tokens=used,
+        budget=token_budget,
+        ids=ids,
+        duplicates=duplicates,
+        trimmed=trimmed,
+        dropped=dropped,
+    )
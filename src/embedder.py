@@ -3,25 +3,144 @@ embedder.py — Handles text embeddings for ResearchMate
 """
 
 import logging
-from typing import List
-from sentence_transformers import SentenceTransformer
+import os
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from src import metrics
+from src.cache import lookup_embeddings
 
 logger = logging.getLogger("researchmate.embedder")
 
 # Initialize a transformer model for embedding (you can change model if needed)
-# 'all-MiniLM-L6-v2' is small, fast, and works great for semantic search
-_model = None
+# 'all-MiniLM-L6-v2' is small, fast, and works great for semantic search.
+# Stores remember the model they were built with (see src.vectorstore), so this
+# only picks the model for new stores; use `--mode migrate` to switch an existing one.
+MODEL_NAME = os.getenv("EMBED_MODEL", "all-MiniLM-L6-v2")
+_models: Dict[str, object] = {}
+_pool = None
+
+# Batching defaults, overridable from the environment or per call
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "0"))
+
+# Below this many texts a multi-process pool costs more than it saves
+MIN_TEXTS_FOR_POOL = 256
+
+
+def get_model(name: Optional[str] = None):
+    """
+    Returns the embedding model `name` (default MODEL_NAME), loading it on first use.
+    """
+    name = name or MODEL_NAME
+    if name not in _models:
+        # Imported here: sentence_transformers pulls in torch, which dominates startup
+        from sentence_transformers import SentenceTransformer
+
+        logger.info(f"Loading embedding model: {name}")
+        _models[name] = SentenceTransformer(name)
+    return _models[name]
+
+
+def set_model(model, name: Optional[str] = None):
+    """
+    Installs an already-constructed embedding model under `name` (default: in
+    place of the default one). Anything with the SentenceTransformer `encode` /
+    `get_sentence_embedding_dimension` interface works, e.g. a fast deterministic
+    stub for offline benchmarks.
+    """
+    if not name or name == MODEL_NAME:
+        stop_pool()
+    _models[name or MODEL_NAME] = model
+
+
+def model_dimension(name: Optional[str] = None) -> int:
+    return get_model(name).get_sentence_embedding_dimension()
+
+
+def get_pool(num_workers: int):
+    """
+    Start (once) a multi-process encode pool for the default model with
+    `num_workers` CPU workers.
+    """
+    global _pool
+    if _pool is None:
+        logger.info(f"Starting embedding pool with {num_workers} workers")
+        _pool = get_model().start_multi_process_pool(target_devices=["cpu"] * num_workers)
+    return _pool
+
+
+def stop_pool():
+    """
+    Stop the multi-process encode pool if one is running.
+    """
+    global _pool
+    if _pool is not None:
+        get_model().stop_multi_process_pool(_pool)
+        _pool = None
+
+
+def _encode(texts: List[str], batch_size: int, num_workers: int, sort_by_length: bool,
+            model_name: str = MODEL_NAME) -> np.ndarray:
+    model = get_model(model_name)
+    if sort_by_length:
+        order = np.argsort([-len(t) for t in texts], kind="stable")
+        ordered = [texts[i] for i in order]
+    else:
+        order = None
+        ordered = texts
+
+    if num_workers > 1 and len(ordered) >= MIN_TEXTS_FOR_POOL and model_name == MODEL_NAME:
+        vectors = model.encode_multi_process(ordered, get_pool(num_workers), batch_size=batch_size)
+    else:
+        vectors = model.encode(ordered, batch_size=batch_size, convert_to_numpy=True, show_progress_bar=False)
+
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if order is not None:
+        restored = np.empty_like(vectors)
+        restored[order] = vectors
+        vectors = restored
+    return vectors
+
+
+def embed_batch(
+    texts: Iterable[str],
+    batch_size: Optional[int] = None,
+    num_workers: Optional[int] = None,
+    sort_by_length: bool = True,
+    use_cache: bool = True,
+    model_name: Optional[str] = None,
+) -> np.ndarray:
+    """
+    Embeds many texts at once and returns a contiguous float32 matrix of shape (n, dim).
+
+    Texts are encoded in batches of `batch_size`. With `sort_by_length` the texts are
+    ordered by length before batching so each batch pads to a similar length; rows are
+    returned in the original input order. With `num_workers` > 1 large inputs are spread
+    over a multi-process encode pool. Texts already in the embedding cache are not re-encoded.
+    `model_name` selects a model other than the default MODEL_NAME.
+    """
+    model_name = model_name or MODEL_NAME
+    texts = [t if isinstance(t, str) else "" for t in texts]
+    if not texts:
+        return np.empty((0, model_dimension(model_name)), dtype=np.float32)
+
+    batch_size = batch_size or EMBED_BATCH_SIZE
+    num_workers = EMBED_WORKERS if num_workers is None else num_workers
 
+    def compute(missing):
+        with metrics.span("encode", model=model_name):
+            vectors = _encode(missing, batch_size, num_workers, sort_by_length, model_name)
+        metrics.inc("texts_encoded_total", len(missing), model=model_name)
+        return vectors
 
-def get_model():
-    global _model
-    if _model is None:
-        logger.info("Loading embedding model: all-MiniLM-L6-v2")
-        _model = SentenceTransformer("all-MiniLM-L6-v2")
-    return _model
+    if not use_cache:
+        return np.ascontiguousarray(compute(texts))
+    return np.ascontiguousarray(np.vstack(lookup_embeddings(model_name, texts, compute)), dtype=np.float32)
 
 
-def get_embeddings(text: str) -> List[float]:
+def get_embeddings(text: str, model_name: Optional[str] = None) -> List[float]:
     """
     Converts text into an embedding vector.
     Returns an empty list if text is invalid or embedding fails.
@@ -30,9 +149,7 @@ def get_embeddings(text: str) -> List[float]:
         text = text.strip()
         if not text:
             return []
-        model = get_model()
-        embedding = model.encode(text, convert_to_numpy=True).tolist()
-        return embedding
+        return embed_batch([text], model_name=model_name)[0].tolist()
     except Exception as e:
         logger.warning(f"Embedding failed: {e}")
         return []
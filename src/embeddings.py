@@ -1,49 +1,194 @@
 """
 embeddings.py — Generate embeddings for text using Gemini
+
+Texts are sent through the batch embedding API (up to GEMINI_EMBED_BATCH_SIZE per
+request) with a bounded number of requests in flight, a token-bucket limit on
+requests per minute, and exponential backoff with jitter on transient errors.
+Items that still fail are reported through `EmbeddingError`; they are never
+replaced with placeholder vectors.
 """
 
+import logging
 import os
-from dotenv import load_dotenv
-import google.generativeai as genai
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
 import numpy as np
+from dotenv import load_dotenv
+
+from src import metrics
+from src.cache import lookup_embeddings
+from src.utils import TokenBucket, retry
 
 # Load .env variables
 load_dotenv()
 
-# Initialize Gemini API key
-api_key = os.getenv("GEMINI_API_KEY")
-if not api_key:
-    raise RuntimeError("GEMINI_API_KEY not found in environment or .env file")
-genai.configure(api_key=api_key)
+logger = logging.getLogger("researchmate.embeddings")
 
 # Default model for embeddings
 EMBEDDING_MODEL = os.getenv("GEMINI_EMBEDDING_MODEL", "models/text-embedding-004")
 
+# The batch endpoint accepts at most 100 texts per request
+BATCH_SIZE = int(os.getenv("GEMINI_EMBED_BATCH_SIZE", "100"))
+CONCURRENCY = int(os.getenv("GEMINI_EMBED_CONCURRENCY", "4"))
+REQUESTS_PER_MINUTE = float(os.getenv("GEMINI_EMBED_RPM", "1500"))
+RETRY_TRIES = 5
+
+_genai = None
+_genai_lock = threading.Lock()
+_limiter = TokenBucket(rate=REQUESTS_PER_MINUTE / 60.0, capacity=max(1.0, CONCURRENCY))
+
+
+class EmbeddingError(RuntimeError):
+    """
+    Raised when some texts could not be embedded.
+
+    `failed` maps input index -> error message; `embeddings` holds the vectors
+    that did succeed (None at failed positions).
+    """
+
+    def __init__(self, failed: Dict[int, str], embeddings: List[Optional[List[float]]]):
+        self.failed = failed
+        self.embeddings = embeddings
+        super().__init__(f"{len(failed)} of {len(embeddings)} texts failed to embed")
+
+
+def get_genai():
+    """
+    Imports and configures the Gemini client on first use.
+    Raises RuntimeError if GEMINI_API_KEY is not set.
+    """
+    global _genai
+    if _genai is None:
+        with _genai_lock:
+            if _genai is None:
+                import google.generativeai as genai
+
+                api_key = os.getenv("GEMINI_API_KEY")
+                if not api_key:
+                    raise RuntimeError("GEMINI_API_KEY not found in environment or .env file")
+                genai.configure(api_key=api_key)
+                _genai = genai
+    return _genai
+
+
+def _transient_errors() -> tuple:
+    """
+    Exception types worth retrying: rate limiting, timeouts and server errors.
+    """
+    try:
+        from google.api_core import exceptions as gexc
+    except ImportError:
+        return (ConnectionError, TimeoutError)
+    return (
+        gexc.ResourceExhausted,
+        gexc.ServiceUnavailable,
+        gexc.DeadlineExceeded,
+        gexc.InternalServerError,
+        ConnectionError,
+        TimeoutError,
+    )
+
 
+def _item_errors() -> tuple:
+    """
+    Exception types caused by some text in the batch (a rejected input or a
+    short response), which splitting the batch can isolate.
+    """
+    try:
+        from google.api_core import exceptions as gexc
+    except ImportError:
+        return (ValueError,)
+    return (gexc.InvalidArgument, ValueError)
+
+
+def _embed_request(texts: List[str]) -> List[List[float]]:
+    """
+    One rate-limited batch embedding call, retried with exponential backoff.
+    """
+    genai = get_genai()
+
+    @retry(_transient_errors(), tries=RETRY_TRIES, delay=1.0, backoff=2.0, max_delay=30.0, jitter=True)
+    def call():
+        with metrics.span("rate_limit_wait", source="gemini"):
+            _limiter.acquire()
+        with metrics.span("gemini_embed_request"):
+            response = genai.embed_content(model=EMBEDDING_MODEL, content=texts)
+        metrics.inc("texts_encoded_total", len(texts), model=EMBEDDING_MODEL)
+        vectors = response["embedding"]
+        if len(vectors) != len(texts):
+            raise ValueError(f"Expected {len(texts)} embeddings, got {len(vectors)}")
+        return vectors
+
+    return call()
+
+
+def _embed_batch(texts: List[str], errors: Dict[str, str]) -> List[Optional[List[float]]]:
+    try:
+        return _embed_request(texts)
+    except _item_errors() as e:
+        if len(texts) == 1:
+            errors[texts[0]] = str(e)
+            return [None]
+        # Isolate the offending texts instead of failing the whole batch
+        logger.warning(f"Batch of {len(texts)} failed ({e}); retrying items individually")
+        return [_embed_batch([t], errors)[0] for t in texts]
+    except Exception as e:
+        # Rate limits and outages have already been retried with backoff;
+        # splitting the batch would only multiply the requests
+        logger.error(f"Batch of {len(texts)} failed: {e}")
+        errors.update((t, str(e)) for t in texts)
+        return [None] * len(texts)
+
+
+def embed_texts(texts: List[str]) -> List[Optional[List[float]]]:
+    """
+    Embeds `texts` through the Gemini batch API and returns one vector per text.
+
+    Raises EmbeddingError (with per-index reasons and the partial results) if any
+    text is empty or could not be embedded after retries.
+    """
+    texts = [t or "" for t in texts]
+    errors: Dict[str, str] = {}
+
+    def compute(missing):
+        todo = [t for t in missing if t]
+        batches = [todo[i:i + BATCH_SIZE] for i in range(0, len(todo), BATCH_SIZE)]
+        vectors = {}
+        with ThreadPoolExecutor(max_workers=max(1, min(CONCURRENCY, len(batches)))) as pool:
+            for batch, result in zip(batches, pool.map(lambda b: _embed_batch(b, errors), batches)):
+                vectors.update(zip(batch, result))
+        return [vectors.get(t) for t in missing]
+
+    # Cached texts skip the Gemini call entirely; failures are never cached
+    embeddings = [
+        None if v is None else np.asarray(v, dtype=float).tolist()
+        for v in lookup_embeddings(EMBEDDING_MODEL, texts, compute)
+    ]
+
+    failed = {
+        i: "empty text" if not t else errors.get(t, "embedding failed")
+        for i, (t, v) in enumerate(zip(texts, embeddings)) if v is None
+    }
+    if failed:
+        metrics.inc("embedding_failures_total", len(failed), model=EMBEDDING_MODEL)
+        raise EmbeddingError(failed, embeddings)
+    return embeddings
+
+
+@metrics.timed()
 def get_embeddings(texts):
     """
-    Returns a numeric embedding vector for a single string, 
+    Returns a numeric embedding vector for a single string,
     or a list of vectors for a list of strings.
     Ensures 1D vectors for single string.
+    Raises EmbeddingError if any text fails to embed.
     """
     single_input = False
     if isinstance(texts, str):
         texts = [texts]
         single_input = True
 
-    embeddings = []
-    for text in texts:
-        if not text:
-            embeddings.append(np.zeros(768).tolist())  # fallback vector
-            continue
-        try:
-            response = genai.embed_content(
-                model=EMBEDDING_MODEL,
-                content=text
-            )
-            embeddings.append(response["embedding"])
-        except Exception as e:
-            print(f"[Gemini Embedding Error] {e}")
-            embeddings.append(np.zeros(768).tolist())
-
+    embeddings = embed_texts(list(texts))
     return embeddings[0] if single_input else embeddings
@@ -0,0 +1,266 @@
+"""
+lexical.py — BM25 inverted index kept alongside the vector collection
+
+Dense MiniLM vectors blur exact identifiers (model names, dataset names, arXiv
+ids); this index scores them directly. Postings are array-backed: a frozen CSR
+block (term offsets, doc numbers, term frequencies) loaded from disk plus
+per-term `array` deltas for documents added since, merged on `save()`.
+Replaced and deleted documents are tombstoned and dropped when the index is
+compacted on save.
+"""
+
+import json
+import logging
+import math
+import os
+import re
+import threading
+from array import array
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger("researchmate.lexical")
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Rewrite doc numbers on save once this fraction of documents is tombstoned
+COMPACT_DEAD_FRACTION = 0.25
+
+_TOKEN = re.compile(r"[a-z0-9]+(?:[._\-/][a-z0-9]+)*")
+_PART = re.compile(r"[a-z0-9]+")
+_ARXIV_VERSION = re.compile(r"^(\d{4}\.\d{4,5})v\d+$")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in into is it its of on or that the their this to was "
+    "were which with we our".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercased terms. Compound tokens such as "gpt-4", "resnet50/imagenet" or
+    "2301.12345v2" are kept whole and also split into their parts; arXiv ids are
+    additionally indexed without their version suffix.
+    """
+    terms = []
+    for token in _TOKEN.findall((text or "").lower()):
+        parts = _PART.findall(token)
+        if len(parts) > 1:
+            terms.append(token)
+            m = _ARXIV_VERSION.match(token)
+            if m:
+                terms.append(m.group(1))
+        terms.extend(p for p in parts if p not in _STOPWORDS)
+    return terms
+
+
+class LexicalIndex:
+    """
+    Incrementally updated BM25 index over (id, document) pairs.
+    """
+
+    def __init__(self, path=None):
+        self.path = Path(path) if path else None
+        self._lock = threading.RLock()
+        self._terms: Dict[str, int] = {}
+        self._doc_ids: List[str] = []
+        self._id_to_doc: Dict[str, int] = {}
+        self._lengths = array("i")
+        self._alive = bytearray()
+        self._alive_count = 0
+        self._alive_length = 0
+        # Frozen CSR postings for term ids < len(self._offsets) - 1
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._post_docs = np.zeros(0, dtype=np.int32)
+        self._post_tfs = np.zeros(0, dtype=np.int32)
+        # Postings appended since the last save, per term id
+        self._delta: Dict[int, Tuple[array, array]] = {}
+        self.dirty = False
+        if self.path and self.path.exists():
+            self._load()
+
+    def __len__(self) -> int:
+        return self._alive_count
+
+    def add(self, ids: Sequence[str], documents: Sequence[str]) -> None:
+        """
+        Indexes documents, replacing any earlier document with the same id.
+        """
+        with self._lock:
+            for id_, document in zip(ids, documents):
+                self._remove(id_)
+                terms = tokenize(document)
+                doc = len(self._doc_ids)
+                self._doc_ids.append(id_)
+                self._id_to_doc[id_] = doc
+                self._lengths.append(len(terms))
+                self._alive.append(1)
+                self._alive_count += 1
+                self._alive_length += len(terms)
+                for term, tf in Counter(terms).items():
+                    tid = self._terms.setdefault(term, len(self._terms))
+                    docs, tfs = self._delta.setdefault(tid, (array("i"), array("i")))
+                    docs.append(doc)
+                    tfs.append(tf)
+            self.dirty = True
+
+    def delete(self, ids: Iterable[str]) -> None:
+        with self._lock:
+            for id_ in ids:
+                self._remove(id_)
+            self.dirty = True
+
+    def _remove(self, id_: str) -> None:
+        doc = self._id_to_doc.pop(id_, None)
+        if doc is not None and self._alive[doc]:
+            self._alive[doc] = 0
+            self._alive_count -= 1
+            self._alive_length -= self._lengths[doc]
+
+    def _postings(self, tid: int) -> Tuple[np.ndarray, np.ndarray]:
+        if tid < len(self._offsets) - 1:
+            start, end = self._offsets[tid], self._offsets[tid + 1]
+            docs, tfs = self._post_docs[start:end], self._post_tfs[start:end]
+        else:
+            docs = tfs = np.zeros(0, dtype=np.int32)
+        if tid in self._delta:
+            d_docs, d_tfs = self._delta[tid]
+            docs = np.concatenate([docs, np.frombuffer(d_docs, dtype=np.int32)])
+            tfs = np.concatenate([tfs, np.frombuffer(d_tfs, dtype=np.int32)])
+        return docs, tfs
+
+    def search(self, query: str, k: int = 10, candidates: Optional[Iterable[str]] = None) -> List[Tuple[str, float]]:
+        """
+        Returns up to `k` (id, BM25 score) pairs, best first. `candidates`
+        restricts scoring to the given ids.
+        """
+        with self._lock:
+            if not self._alive_count:
+                return []
+            # Views, not copies: the buffers are only resized under the lock
+            alive = np.frombuffer(self._alive, dtype=np.uint8)
+            lengths = np.frombuffer(self._lengths, dtype=np.int32)
+            rows = None
+            if candidates is not None:
+                rows = np.fromiter((self._id_to_doc[i] for i in candidates if i in self._id_to_doc), dtype=np.int32)
+                if not len(rows):
+                    return []
+            avgdl = self._alive_length / self._alive_count or 1.0
+            matched, weights = [], []
+            for term in set(tokenize(query)):
+                tid = self._terms.get(term)
+                if tid is None:
+                    continue
+                docs, tfs = self._postings(tid)
+                keep = alive[docs].astype(bool)
+                docs, tfs = docs[keep], tfs[keep].astype(np.float32)
+                if not len(docs):
+                    continue
+                # Document frequency over the whole corpus; `candidates` only limits what is scored
+                idf = math.log(1.0 + (self._alive_count - len(docs) + 0.5) / (len(docs) + 0.5))
+                if rows is not None:
+                    keep = np.isin(docs, rows)
+                    docs, tfs = docs[keep], tfs[keep]
+                    if not len(docs):
+                        continue
+                norm = BM25_K1 * (1.0 - BM25_B + BM25_B * lengths[docs] / avgdl)
+                matched.append(docs)
+                weights.append(idf * tfs * (BM25_K1 + 1.0) / (tfs + norm))
+            if not matched:
+                return []
+            # Sum per-term scores over the matched documents only
+            docs, inverse = np.unique(np.concatenate(matched), return_inverse=True)
+            scores = np.bincount(inverse, weights=np.concatenate(weights))
+            top = np.arange(len(docs))
+            if len(top) > k:
+                top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top], kind="stable")]
+            return [(self._doc_ids[docs[i]], float(scores[i])) for i in top]
+
+    def _merged(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        offsets = np.zeros(len(self._terms) + 1, dtype=np.int64)
+        docs_parts, tfs_parts = [], []
+        for tid in range(len(self._terms)):
+            docs, tfs = self._postings(tid)
+            docs_parts.append(docs)
+            tfs_parts.append(tfs)
+            offsets[tid + 1] = offsets[tid] + len(docs)
+        docs = np.concatenate(docs_parts) if docs_parts else np.zeros(0, dtype=np.int32)
+        tfs = np.concatenate(tfs_parts) if tfs_parts else np.zeros(0, dtype=np.int32)
+        return offsets, docs.astype(np.int32), tfs.astype(np.int32)
+
+    def _compact(self, offsets, docs, tfs):
+        alive = np.frombuffer(bytes(self._alive), dtype=np.uint8).astype(bool)
+        remap = np.cumsum(alive, dtype=np.int64) - 1
+        keep = alive[docs]
+        term_of = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))[keep]
+        counts = np.bincount(term_of, minlength=len(offsets) - 1)
+        offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        docs = remap[docs[keep]].astype(np.int32)
+        tfs = tfs[keep]
+        live = np.flatnonzero(alive)
+        self._doc_ids = [self._doc_ids[d] for d in live]
+        self._id_to_doc = {id_: i for i, id_ in enumerate(self._doc_ids)}
+        self._lengths = array("i", np.frombuffer(self._lengths, dtype=np.int32)[live].tolist())
+        self._alive = bytearray(b"\x01" * len(live))
+        return offsets, docs, tfs
+
+    def save(self) -> None:
+        """
+        Folds pending postings into the CSR block (compacting tombstones when they
+        pile up) and writes the index atomically to `path`.
+        """
+        with self._lock:
+            offsets, docs, tfs = self._merged()
+            dead = len(self._doc_ids) - self._alive_count
+            if dead and dead >= COMPACT_DEAD_FRACTION * len(self._doc_ids):
+                offsets, docs, tfs = self._compact(offsets, docs, tfs)
+            self._offsets, self._post_docs, self._post_tfs = offsets, docs, tfs
+            self._delta = {}
+            if self.path is None or not self.dirty:
+                return
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_name(self.path.name + ".tmp")
+            with open(tmp, "wb") as f:
+                np.savez(
+                    f,
+                    offsets=offsets,
+                    docs=docs,
+                    tfs=tfs,
+                    lengths=np.frombuffer(self._lengths, dtype=np.int32),
+                    alive=np.frombuffer(bytes(self._alive), dtype=np.uint8),
+                    terms=np.frombuffer(json.dumps(list(self._terms)).encode(), dtype=np.uint8),
+                    ids=np.frombuffer(json.dumps(self._doc_ids).encode(), dtype=np.uint8),
+                )
+            os.replace(tmp, self.path)
+            self.dirty = False
+            logger.info(f"Saved lexical index: {self._alive_count} documents, {len(self._terms)} terms")
+
+    def _load(self) -> None:
+        with np.load(self.path) as data:
+            self._offsets = data["offsets"]
+            self._post_docs = data["docs"]
+            self._post_tfs = data["tfs"]
+            self._lengths = array("i", data["lengths"].tolist())
+            self._alive = bytearray(data["alive"].tobytes())
+            self._terms = {t: i for i, t in enumerate(json.loads(data["terms"].tobytes()))}
+            self._doc_ids = json.loads(data["ids"].tobytes())
+        self._id_to_doc = {id_: d for d, id_ in enumerate(self._doc_ids) if self._alive[d]}
+        self._alive_count = len(self._id_to_doc)
+        lengths = np.frombuffer(self._lengths, dtype=np.int32)
+        alive = np.frombuffer(bytes(self._alive), dtype=np.uint8).astype(bool)
+        self._alive_length = int(lengths[alive].sum())
+        logger.info(f"Loaded lexical index: {self._alive_count} documents, {len(self._terms)} terms")
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = 60) -> Dict[str, float]:
+    """
+    Fuses ranked id lists: each id scores sum(1 / (k + rank)) over the lists it appears in.
+    """
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, id_ in enumerate(ranking, start=1):
+            scores[id_] = scores.get(id_, 0.0) + 1.0 / (k + rank)
+    return scores
@@ -0,0 +1,656 @@
+"""
+local_index.py — In-process vector index backends for ResearchMate
+
+`LocalCollection` is a drop-in stand-in for the subset of the Chroma collection
+API that `VectorStore` uses (add / upsert / get / query / delete / count), so the
+rest of the code does not care which backend is active.
+
+Vectors live in a float32 memory-mapped file (`vectors.f32`, one row per
+record); ids, documents and metadata live in a small SQLite table. Searching is
+either exact NumPy brute force or a FAISS index (flat or HNSW) rebuilt from the
+memory map on load. Deletes and replaced rows are tombstoned and skipped at
+search time; `compact()` rewrites the files without them.
+
+Metadata filters (`where=`) are translated to SQL over the JSON metadata column,
+with expression indexes on the common filter fields, and only the matching rows
+are scored.
+
+With `quantization` ("float16", "int8" or "pq", see src.quantization) the
+NumPy backend scans compact in-memory codes instead of the float32 vectors and
+re-ranks a shortlist of `rerank * k` candidates exactly from the memory map, so
+only the codes need to stay resident.
+"""
+
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.quantization import QUANTIZATIONS, load_quantizer, make_quantizer
+
+logger = logging.getLogger(__name__)
+
+faiss = None
+
+
+def _import_faiss() -> bool:
+    """
+    Imports faiss on first use. faiss-cpu is optional; NumPy brute force still works.
+    """
+    global faiss
+    if faiss is None:
+        try:
+            import faiss as _faiss
+        except ImportError:
+            return False
+        faiss = _faiss
+    return True
+
+BACKENDS = ("numpy", "faiss", "hnsw")
+
+# Rows scored per matrix multiply in brute-force search, bounding temporary memory
+SEARCH_BLOCK_ROWS = 65536
+
+_OPS = {"$eq": "=", "$ne": "!=", "$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+_METADATA_KEY = re.compile(r"^[A-Za-z0-9_.\-]+$")
+
+# Shortlist size, as a multiple of k, re-ranked at full precision when quantized
+RERANK_FACTOR = int(os.getenv("QUANTIZATION_RERANK", "32"))
+# Quantizers that learn parameters (int8, pq) are trained once this many rows exist
+QUANTIZER_MIN_TRAIN_ROWS = 1024
+QUANTIZER_TRAIN_SAMPLE = 65536
+
+# Metadata fields given SQLite expression indexes, so filters on them avoid a full scan
+INDEXED_METADATA = ("paper_id", "source", "year", "category")
+
+
+def _json_column(key: str) -> str:
+    # The path is inlined (not bound) so SQLite can match it to an expression index
+    if not _METADATA_KEY.match(key):
+        raise ValueError(f"Unsupported metadata key in filter: {key!r}")
+    return f"json_extract(metadata, '$.\"{key}\"')"
+
+
+def where_to_sql(where: Optional[Dict]) -> Tuple[str, list]:
+    """
+    Translates a Chroma-style metadata filter into a SQL condition over the
+    JSON metadata column. Supports $and/$or, $eq/$ne/$gt/$gte/$lt/$lte, $in/$nin
+    and bare `{"key": value}` equality.
+    """
+    if not where:
+        return "1", []
+    clauses, params = [], []
+    for key, cond in where.items():
+        if key in ("$and", "$or"):
+            parts = [where_to_sql(c) for c in cond]
+            joiner = " AND " if key == "$and" else " OR "
+            clauses.append("(" + joiner.join(sql for sql, _ in parts) + ")")
+            for _, p in parts:
+                params.extend(p)
+            continue
+        column = _json_column(key)
+        if not isinstance(cond, dict):
+            cond = {"$eq": cond}
+        for op, value in cond.items():
+            if op in _OPS:
+                clauses.append(f"{column} {_OPS[op]} ?")
+                params.append(value)
+            elif op in ("$in", "$nin"):
+                marks = ",".join("?" * len(value)) or "NULL"
+                negate = "NOT " if op == "$nin" else ""
+                clauses.append(f"{column} {negate}IN ({marks})")
+                params.extend(value)
+            else:
+                raise ValueError(f"Unsupported filter operator: {op}")
+    return "(" + " AND ".join(clauses) + ")", params
+
+
+class LocalCollection:
+    """
+    Persistent, in-process vector collection with a Chroma-like interface.
+    """
+
+    def __init__(self, path, name: str, backend: str = "numpy", hnsw_m: int = 32, ef_search: int = 64,
+                 index_metadata: Sequence[str] = INDEXED_METADATA, quantization: Optional[str] = None,
+                 rerank: int = RERANK_FACTOR):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown local backend '{backend}', expected one of {BACKENDS}")
+        if backend != "numpy" and not _import_faiss():
+            logger.warning("faiss is not installed; falling back to NumPy brute-force search")
+            backend = "numpy"
+
+        self.name = name
+        self.backend = backend
+        self.hnsw_m = hnsw_m
+        self.ef_search = ef_search
+        self.rerank = rerank
+        self.path = Path(path) / name
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+
+        self._db = sqlite3.connect(str(self.path / "rows.sqlite3"), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS rows ("
+            " row INTEGER PRIMARY KEY, id TEXT NOT NULL, document TEXT, metadata TEXT,"
+            " deleted INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._db.execute("CREATE UNIQUE INDEX IF NOT EXISTS rows_live_id ON rows(id) WHERE deleted = 0")
+        for key in index_metadata:
+            self._db.execute(
+                f"CREATE INDEX IF NOT EXISTS \"rows_meta_{key}\" ON rows({_json_column(key)}) WHERE deleted = 0"
+            )
+        self._db.commit()
+
+        self._meta_path = self.path / "index.json"
+        meta = json.loads(self._meta_path.read_text()) if self._meta_path.exists() else {}
+        self.dim = meta.get("dim")
+        self._rows = meta.get("rows", 0)
+        self._capacity = meta.get("capacity", 0)
+        self._vectors = None
+        self._index = None
+        self._quantizer = None
+        self._codes = None
+
+        # None keeps the collection's stored setting; "none" turns quantization off
+        if quantization is None:
+            quantization = meta.get("quantization")
+        if quantization == "none":
+            quantization = None
+        if quantization and quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown quantization '{quantization}', expected one of {QUANTIZATIONS}")
+        if quantization and backend != "numpy":
+            logger.warning(f"Quantization applies to the numpy backend only; ignoring it for {backend}")
+            quantization = None
+        self.quantization = quantization
+        if self.dim:
+            self._open_vectors()
+        self._load_state()
+
+    # --- storage -----------------------------------------------------------
+
+    def _open_vectors(self):
+        file = self.path / "vectors.f32"
+        if self._capacity == 0:
+            self._vectors = np.zeros((0, self.dim), dtype=np.float32)
+            return
+        self._vectors = np.memmap(file, dtype=np.float32, mode="r+", shape=(self._capacity, self.dim))
+
+    def _grow(self, needed: int):
+        if self._rows + needed <= self._capacity:
+            return
+        capacity = max(1024, self._capacity)
+        while capacity < self._rows + needed:
+            capacity *= 2
+        file = self.path / "vectors.f32"
+        if isinstance(self._vectors, np.memmap):
+            self._vectors.flush()
+        self._vectors = None
+        with open(file, "ab") as f:
+            f.truncate(capacity * self.dim * 4)
+        self._capacity = capacity
+        self._open_vectors()
+        self._norms = np.resize(self._norms, capacity)
+        self._alive = np.resize(self._alive, capacity)
+        self._row_ids = np.resize(self._row_ids, capacity)
+        if self._codes is not None:
+            codes = self._quantizer.empty_codes(capacity)
+            codes[:self._rows] = self._codes[:self._rows]
+            self._codes = codes
+        self._norms[self._rows:] = 0
+        self._alive[self._rows:] = False
+        self._row_ids[self._rows:] = None
+
+    def _save_meta(self):
+        tmp = self._meta_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps({"dim": self.dim, "rows": self._rows, "capacity": self._capacity,
+                                   "backend": self.backend, "quantization": self.quantization}))
+        tmp.replace(self._meta_path)
+
+    def _load_state(self):
+        self._alive = np.zeros(self._capacity, dtype=bool)
+        self._norms = np.zeros(self._capacity, dtype=np.float32)
+        # Row -> id, so columnar queries resolve ids without touching SQLite
+        self._row_ids = np.empty(self._capacity, dtype=object)
+        self._id_to_row = {}
+        for row, id_ in self._db.execute("SELECT row, id FROM rows WHERE deleted = 0"):
+            self._id_to_row[id_] = row
+            self._row_ids[row] = id_
+            self._alive[row] = True
+        for start in range(0, self._rows, SEARCH_BLOCK_ROWS):
+            block = np.asarray(self._vectors[start:start + SEARCH_BLOCK_ROWS], dtype=np.float32)
+            self._norms[start:start + len(block)] = np.einsum("ij,ij->i", block, block)
+        self._build_index()
+        self._build_codes()
+
+    def _build_index(self):
+        if self.backend == "numpy" or not self.dim:
+            self._index = None
+            return
+        saved = self.path / f"{self.backend}.faiss"
+        if saved.exists():
+            index = faiss.read_index(str(saved))
+            if index.ntotal == self._rows:
+                self._index = index
+                self._set_search_params()
+                return
+        self._index = self._new_index()
+        for start in range(0, self._rows, SEARCH_BLOCK_ROWS):
+            self._index.add(np.ascontiguousarray(self._vectors[start:min(self._rows, start + SEARCH_BLOCK_ROWS)]))
+
+    def _new_index(self):
+        if self.backend == "hnsw":
+            index = faiss.IndexHNSWFlat(self.dim, self.hnsw_m)
+        else:
+            index = faiss.IndexFlatL2(self.dim)
+        self._index = index
+        self._set_search_params()
+        return index
+
+    def _build_codes(self):
+        """
+        Loads the saved quantizer and codes, re-encodes the rows with the saved
+        parameters if the codes are stale, or trains a new quantizer once the
+        collection is large enough to learn from.
+        """
+        self._quantizer, self._codes = None, None
+        if not self.quantization or not self.dim:
+            return
+        saved = self.path / "quantizer.npz"
+        if saved.exists():
+            with np.load(saved) as data:
+                state = dict(data)
+            if str(state.pop("kind")) == self.quantization:
+                rows, codes = int(state.pop("rows")), state.pop("codes")
+                self._quantizer = load_quantizer(self.quantization, self.dim, state)
+                if rows == self._rows:
+                    self._codes = self._quantizer.empty_codes(self._capacity)
+                    self._codes[:rows] = codes
+                    return
+        if self._quantizer is None:
+            quantizer = make_quantizer(self.quantization, self.dim)
+            if not quantizer.trained:
+                if len(self._id_to_row) < QUANTIZER_MIN_TRAIN_ROWS:
+                    return
+                logger.info(f"Training {self.quantization} quantizer on {len(self._id_to_row)} rows")
+                quantizer.train(self._training_sample())
+            self._quantizer = quantizer
+        self._encode_rows()
+
+    def _training_sample(self) -> np.ndarray:
+        rows = np.flatnonzero(self._alive[:self._rows])
+        if len(rows) > QUANTIZER_TRAIN_SAMPLE:
+            rows = np.sort(np.random.default_rng(0).choice(rows, QUANTIZER_TRAIN_SAMPLE, replace=False))
+        return np.asarray(self._vectors[rows], dtype=np.float32)
+
+    def train_quantizer(self):
+        """
+        Re-trains the quantizer on the current rows and re-encodes them, e.g. after
+        the collection has grown well past the data it was first trained on.
+        """
+        with self._lock:
+            if not self.quantization or not self.dim:
+                return
+            quantizer = make_quantizer(self.quantization, self.dim)
+            quantizer.train(self._training_sample())
+            self._quantizer = quantizer
+            self._encode_rows()
+            self.persist()
+
+    def _encode_rows(self):
+        self._codes = self._quantizer.empty_codes(self._capacity)
+        for start in range(0, self._rows, SEARCH_BLOCK_ROWS):
+            end = min(self._rows, start + SEARCH_BLOCK_ROWS)
+            self._codes[start:end] = self._quantizer.encode(self._vectors[start:end])
+
+    def footprint(self) -> Dict[str, int]:
+        """
+        Bytes taken by the full-precision vectors and by the in-memory codes.
+        """
+        dim = self.dim or 0
+        return {
+            "rows": self._rows,
+            "vector_bytes": self._rows * dim * 4,
+            "code_bytes": self._rows * self._quantizer.bytes_per_vector if self._codes is not None else 0,
+        }
+
+    def _set_search_params(self):
+        if self.backend == "hnsw":
+            self._index.hnsw.efSearch = self.ef_search
+
+    def _checkpoint(self):
+        if isinstance(self._vectors, np.memmap):
+            self._vectors.flush()
+        self._save_meta()
+        self._db.commit()
+
+    def persist(self):
+        """
+        Flushes vectors and saves the FAISS index and quantized codes so the next load
+        skips rebuilding them. Vectors and rows are already durable after every write;
+        only the index and codes are deferred.
+        """
+        with self._lock:
+            self._checkpoint()
+            if self._index is not None:
+                faiss.write_index(self._index, str(self.path / f"{self.backend}.faiss"))
+            if self._codes is not None:
+                tmp = self.path / "quantizer.npz.tmp"
+                with open(tmp, "wb") as f:
+                    np.savez(f, kind=np.array(self.quantization), rows=np.array(self._rows),
+                             codes=self._codes[:self._rows], **self._quantizer.state())
+                tmp.replace(self.path / "quantizer.npz")
+
+    # --- writes ------------------------------------------------------------
+
+    def add(self, ids, embeddings, documents=None, metadatas=None):
+        with self._lock:
+            clash = [i for i in ids if i in self._id_to_row]
+            if clash:
+                raise ValueError(f"Ids already exist: {clash[:5]}")
+        self.upsert(ids, embeddings, documents, metadatas)
+
+    def upsert(self, ids, embeddings, documents=None, metadatas=None):
+        ids = list(ids)
+        vectors = np.ascontiguousarray(np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1))
+        documents = documents if documents is not None else [None] * len(ids)
+        metadatas = metadatas if metadatas is not None else [None] * len(ids)
+
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                self._open_vectors()
+                self._load_state()
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match collection dimension {self.dim}")
+
+            # Replaced rows are tombstoned; the new version is appended
+            self._tombstone([self._id_to_row[i] for i in ids if i in self._id_to_row])
+            # The last occurrence of a repeated id wins
+            last = {id_: k for k, id_ in enumerate(ids)}
+            keep = sorted(last.values())
+            vectors = vectors[keep]
+
+            self._grow(len(keep))
+            start = self._rows
+            rows = range(start, start + len(keep))
+            self._vectors[start:start + len(keep)] = vectors
+            self._norms[start:start + len(keep)] = np.einsum("ij,ij->i", vectors, vectors)
+            self._alive[start:start + len(keep)] = True
+            self._db.executemany(
+                "INSERT INTO rows (row, id, document, metadata) VALUES (?, ?, ?, ?)",
+                [
+                    (row, ids[k], documents[k], json.dumps(metadatas[k]) if metadatas[k] is not None else None)
+                    for row, k in zip(rows, keep)
+                ],
+            )
+            for row, k in zip(rows, keep):
+                self._id_to_row[ids[k]] = row
+                self._row_ids[row] = ids[k]
+            if self._codes is not None:
+                self._codes[start:start + len(keep)] = self._quantizer.encode(vectors)
+            self._rows += len(keep)
+            if self._index is not None:
+                self._index.add(vectors)
+            if self.quantization and self._codes is None and len(self._id_to_row) >= QUANTIZER_MIN_TRAIN_ROWS:
+                self._build_codes()
+            self._checkpoint()
+
+    def delete(self, ids=None, where=None):
+        with self._lock:
+            rows = []
+            if ids is not None:
+                rows.extend(self._id_to_row[i] for i in ids if i in self._id_to_row)
+            if where:
+                rows.extend(self._filter_rows(where).tolist())
+            self._tombstone(rows)
+            self._db.commit()
+
+    def _tombstone(self, rows):
+        rows = sorted(set(rows))
+        if not rows:
+            return
+        dead = set(rows)
+        self._alive[rows] = False
+        self._db.executemany("UPDATE rows SET deleted = 1 WHERE row = ?", [(r,) for r in rows])
+        for (id_,) in self._db.execute(
+            f"SELECT id FROM rows WHERE row IN ({','.join('?' * len(rows))})", rows
+        ).fetchall():
+            if self._id_to_row.get(id_) in dead:
+                del self._id_to_row[id_]
+
+    def compact(self):
+        """
+        Rewrites the vector file and index without deleted rows.
+        """
+        with self._lock:
+            live = np.flatnonzero(self._alive[:self._rows])
+            if len(live) == self._rows:
+                return
+            vectors = np.array(self._vectors[live]) if len(live) else np.zeros((0, self.dim), np.float32)
+            records = self._db.execute(
+                "SELECT id, document, metadata FROM rows WHERE deleted = 0 ORDER BY row"
+            ).fetchall()
+            self._db.execute("DELETE FROM rows")
+            self._db.executemany(
+                "INSERT INTO rows (row, id, document, metadata) VALUES (?, ?, ?, ?)",
+                [(r, *rec) for r, rec in enumerate(records)],
+            )
+            self._vectors = None
+            (self.path / "vectors.f32").unlink(missing_ok=True)
+            (self.path / f"{self.backend}.faiss").unlink(missing_ok=True)
+            self._rows, self._capacity = 0, 0
+            self._open_vectors()
+            self._alive = np.zeros(0, dtype=bool)
+            self._norms = np.zeros(0, dtype=np.float32)
+            self._row_ids = np.empty(0, dtype=object)
+            self._grow(len(vectors))
+            self._vectors[:len(vectors)] = vectors
+            self._rows = len(vectors)
+            self._load_state()
+            self.persist()
+
+    # --- reads -------------------------------------------------------------
+
+    def count(self) -> int:
+        return len(self._id_to_row)
+
+    def _filter_rows(self, where, rows: Optional[Sequence[int]] = None) -> np.ndarray:
+        """
+        Rows matching `where`, optionally only among `rows`.
+        """
+        sql, params = where_to_sql(where)
+        if rows is None:
+            found = self._db.execute(f"SELECT row FROM rows WHERE deleted = 0 AND {sql}", params).fetchall()
+        else:
+            found = []
+            for start in range(0, len(rows), 500):
+                part = [int(r) for r in rows[start:start + 500]]
+                marks = ",".join("?" * len(part))
+                found += self._db.execute(
+                    f"SELECT row FROM rows WHERE row IN ({marks}) AND deleted = 0 AND {sql}", part + list(params)
+                ).fetchall()
+        return np.fromiter((r for (r,) in found), dtype=np.int64, count=len(found))
+
+    def _records(self, rows: Sequence[int]) -> Dict[int, tuple]:
+        if len(rows) == 0:
+            return {}
+        found = {}
+        rows = [int(r) for r in rows]
+        for start in range(0, len(rows), 500):
+            part = rows[start:start + 500]
+            for row, id_, doc, meta in self._db.execute(
+                f"SELECT row, id, document, metadata FROM rows WHERE row IN ({','.join('?' * len(part))})", part
+            ):
+                found[row] = (id_, doc, json.loads(meta) if meta else None)
+        return found
+
+    def get(self, ids=None, where=None, limit=None, offset=None, include=("metadatas", "documents")):
+        with self._lock:
+            if ids is not None:
+                rows = [self._id_to_row[i] for i in ids if i in self._id_to_row]
+                if where:
+                    allowed = set(self._filter_rows(where, rows).tolist())
+                    rows = [r for r in rows if r in allowed]
+            elif where:
+                rows = self._filter_rows(where).tolist()
+            else:
+                rows = np.flatnonzero(self._alive[:self._rows]).tolist()
+            rows = rows[offset or 0:]
+            if limit is not None:
+                rows = rows[:limit]
+            return self._result(rows, include)
+
+    def _result(self, rows, include, distances=None):
+        if "documents" not in include and "metadatas" not in include:
+            # Ids only (e.g. resolving a filter): no need to read the records
+            out = {"ids": [self._row_ids[r] for r in rows]}
+            if "embeddings" in include:
+                out["embeddings"] = np.array(self._vectors[rows]) if rows else np.zeros((0, self.dim or 0), np.float32)
+            if distances is not None:
+                out["distances"] = distances
+            return out
+        records = self._records(rows)
+        out = {"ids": [records[r][0] for r in rows]}
+        if "documents" in include:
+            out["documents"] = [records[r][1] for r in rows]
+        if "metadatas" in include:
+            out["metadatas"] = [records[r][2] for r in rows]
+        if "embeddings" in include:
+            out["embeddings"] = np.array(self._vectors[rows]) if rows else np.zeros((0, self.dim or 0), np.float32)
+        if distances is not None:
+            out["distances"] = distances
+        return out
+
+    def query(self, query_embeddings, n_results: int = 10, where=None,
+              include=("metadatas", "documents", "distances")):
+        """
+        Returns the `n_results` nearest rows to each query embedding, by squared L2
+        distance (Chroma's default space), as Chroma-style nested lists.
+        """
+        queries = np.ascontiguousarray(np.asarray(query_embeddings, dtype=np.float32))
+        if queries.ndim == 1:
+            queries = queries[None, :]
+        with self._lock:
+            if not self.dim or not self._id_to_row:
+                empty = [[] for _ in queries]
+                return {"ids": empty, "documents": empty, "metadatas": empty, "distances": empty}
+
+            top_rows, top_dist = self._nearest(queries, n_results, where)
+            out = {key: [] for key in ("ids", "documents", "metadatas", "distances", "embeddings") if key == "ids" or key in include}
+            for rows, dist in zip(top_rows, top_dist):
+                found = rows >= 0
+                result = self._result(rows[found].tolist(), include, distances=dist[found].tolist())
+                for key in out:
+                    out[key].append(result[key])
+            return out
+
+    def query_arrays(self, query_embeddings, n_results: int = 10, where=None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Columnar form of `query`: returns an (n_queries, n_results) object array of
+        ids and a float32 array of squared L2 distances, without loading documents
+        or metadata. Queries with fewer matches are padded with None / inf.
+        """
+        queries = np.ascontiguousarray(np.asarray(query_embeddings, dtype=np.float32))
+        if queries.ndim == 1:
+            queries = queries[None, :]
+        with self._lock:
+            if not self.dim or not self._id_to_row:
+                return (np.full((len(queries), n_results), None, dtype=object),
+                        np.full((len(queries), n_results), np.inf, dtype=np.float32))
+            rows, dist = self._nearest(queries, n_results, where)
+            ids = np.where(rows >= 0, self._row_ids[np.maximum(rows, 0)], None)
+            return ids, dist
+
+    def _nearest(self, queries, k, where=None):
+        """
+        Top-`k` rows and distances per query as (n_queries, k) arrays, padded with
+        row -1 / distance inf.
+        """
+        candidates = self._filter_rows(where) if where else None
+        if self._codes is not None:
+            rows, dist = self._quantized_search(queries, k, candidates)
+        elif candidates is not None or self._index is None:
+            rows, dist = self._brute_force(queries, k, candidates)
+        else:
+            rows, dist = self._faiss_search(queries, k)
+        if rows.shape[1] < k:
+            pad = k - rows.shape[1]
+            rows = np.pad(rows, ((0, 0), (0, pad)), constant_values=-1)
+            dist = np.pad(dist, ((0, 0), (0, pad)), constant_values=np.inf)
+        return rows, dist
+
+    def _brute_force(self, queries, k, candidates=None):
+        q_norms = np.einsum("ij,ij->i", queries, queries)
+
+        def exact(rows):
+            return q_norms[:, None] + self._norms[rows][None, :] - 2.0 * (queries @ self._vectors[rows].T)
+
+        return self._scan(len(queries), k, candidates, exact)
+
+    def _quantized_search(self, queries, k, candidates=None):
+        def approximate(rows):
+            return self._quantizer.distances(queries, self._codes[rows], self._norms[rows])
+
+        shortlist, _ = self._scan(len(queries), k * self.rerank, candidates, approximate)
+        return self._rerank(queries, shortlist, k)
+
+    def _rerank(self, queries, rows, k):
+        """
+        Exact distances for each query's shortlisted rows; returns the best `k`.
+        """
+        if rows.size == 0:
+            return rows[:, :k], np.zeros(rows[:, :k].shape, dtype=np.float32)
+        # Sorted unique rows: each vector is read from the memory map once, in file order
+        unique, inverse = np.unique(rows, return_inverse=True)
+        vectors = np.asarray(self._vectors[unique], dtype=np.float32)[inverse.reshape(rows.shape)]
+        dist = (
+            np.einsum("ij,ij->i", queries, queries)[:, None]
+            + self._norms[rows]
+            - 2.0 * np.einsum("qd,qsd->qs", queries, vectors)
+        )
+        np.maximum(dist, 0, out=dist)
+        order = np.argsort(dist, axis=1)[:, :k]
+        return np.take_along_axis(rows, order, axis=1), np.take_along_axis(dist, order, axis=1).astype(np.float32)
+
+    def _scan(self, n_queries, k, candidates, score):
+        """
+        Top-`k` rows per query under `score(rows) -> (n_queries, len(rows))`
+        distances, scoring the live (or candidate) rows block by block.
+        """
+        best_rows = np.empty((n_queries, 0), dtype=np.int64)
+        best_dist = np.empty((n_queries, 0), dtype=np.float32)
+        rows_all = candidates if candidates is not None else np.flatnonzero(self._alive[:self._rows])
+        for start in range(0, len(rows_all), SEARCH_BLOCK_ROWS):
+            rows = rows_all[start:start + SEARCH_BLOCK_ROWS]
+            dist = score(rows)
+            np.maximum(dist, 0, out=dist)
+            best_rows = np.hstack([best_rows, np.broadcast_to(rows, dist.shape)])
+            best_dist = np.hstack([best_dist, dist.astype(np.float32)])
+            if best_dist.shape[1] > k:
+                part = np.argpartition(best_dist, k - 1, axis=1)[:, :k]
+                best_rows = np.take_along_axis(best_rows, part, axis=1)
+                best_dist = np.take_along_axis(best_dist, part, axis=1)
+        order = np.argsort(best_dist, axis=1)
+        best_rows = np.take_along_axis(best_rows, order, axis=1)
+        best_dist = np.take_along_axis(best_dist, order, axis=1)
+        return best_rows, best_dist
+
+    def _faiss_search(self, queries, k):
+        # Over-fetch to make up for tombstoned rows still present in the FAISS index
+        dead = self._rows - len(self._id_to_row)
+        fetch = min(self._rows, k + dead)
+        dist, rows = self._index.search(queries, fetch)
+        valid = (rows >= 0) & self._alive[np.maximum(rows, 0)]
+        # Stable sort moves the live rows to the front, keeping FAISS's distance order
+        order = np.argsort(~valid, axis=1, kind="stable")[:, :k]
+        valid = np.take_along_axis(valid, order, axis=1)
+        rows = np.where(valid, np.take_along_axis(rows, order, axis=1), -1)
+        dist = np.where(valid, np.take_along_axis(dist, order, axis=1), np.inf).astype(np.float32)
+        return rows, dist
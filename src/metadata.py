@@ -0,0 +1,89 @@
+"""
+metadata.py — Structured paper metadata stored with every chunk, and search filters over it
+
+Every chunk carries its paper's `paper_id`, `title`, `url`, `source`, `year`,
+`authors`, `category` and one boolean `a_<surname>` key per author. The author
+keys let an author filter run as a plain equality match inside the store (Chroma
+and `LocalCollection` alike) instead of substring matching in Python.
+"""
+
+import re
+import unicodedata
+from typing import Dict, List, Optional
+
+# Authors beyond this many are not given filter keys (large collaborations)
+MAX_AUTHOR_KEYS = 25
+
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+
+def author_key(name: str) -> Optional[str]:
+    """
+    Filter key for an author: "a_" plus the normalized surname, so
+    "Geoffrey E. Hinton" and "Hinton" both map to "a_hinton".
+    """
+    name = unicodedata.normalize("NFKD", name or "").encode("ascii", "ignore").decode().lower()
+    parts = [p for p in _NON_ALNUM.sub(" ", name).split() if p]
+    return f"a_{parts[-1]}" if parts else None
+
+
+def _author_list(authors) -> List[str]:
+    if isinstance(authors, str):
+        authors = authors.split(",")
+    return [a.strip() for a in authors or [] if a and a.strip()]
+
+
+def paper_metadata(paper: Dict) -> Dict:
+    """
+    Chunk-level metadata for a collected paper. Missing fields are left out,
+    since the stores reject None values.
+    """
+    authors = _author_list(paper.get("authors"))
+    meta = {
+        "paper_id": paper.get("uid") or paper.get("id"),
+        "title": paper.get("title") or "No Title",
+        "url": paper.get("url") or "No URL",
+        "source": paper.get("source"),
+        "year": int(paper["year"]) if paper.get("year") else None,
+        "authors": ", ".join(authors) or None,
+        "category": paper.get("category"),
+    }
+    meta = {k: v for k, v in meta.items() if v is not None}
+    for name in authors[:MAX_AUTHOR_KEYS]:
+        key = author_key(name)
+        if key:
+            meta[key] = True
+    return meta
+
+
+def build_where(
+    year_from: Optional[int] = None,
+    year_to: Optional[int] = None,
+    source: Optional[str] = None,
+    author: Optional[str] = None,
+    category: Optional[str] = None,
+    paper_id: Optional[str] = None,
+) -> Optional[Dict]:
+    """
+    Builds a Chroma-style `where` filter from the given constraints, or None when
+    there are none. A single condition is returned bare, since Chroma requires
+    `$and` to have at least two operands.
+    """
+    conditions = []
+    if year_from is not None:
+        conditions.append({"year": {"$gte": int(year_from)}})
+    if year_to is not None:
+        conditions.append({"year": {"$lte": int(year_to)}})
+    if source:
+        conditions.append({"source": source})
+    if author:
+        key = author_key(author)
+        if key:
+            conditions.append({key: True})
+    if category:
+        conditions.append({"category": category})
+    if paper_id:
+        conditions.append({"paper_id": paper_id})
+    if not conditions:
+        return None
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
@@ -0,0 +1,295 @@
+"""
+metrics.py — Lightweight in-process metrics: spans, counters, histograms and cache hit rates
+
+    from src import metrics
+
+    with metrics.span("download_pdf"):            # duration histogram + error counter
+        ...
+
+    @metrics.timed("summarize_topic")
+    def summarize_topic(...): ...
+
+    metrics.inc("papers_collected_total", source="arxiv")
+    metrics.cache_access("query_embeddings", hit=True)
+
+Everything lands in one process-wide registry, exported as Prometheus text
+(`to_prometheus`, served at /metrics by src.server) or as JSON (`to_dict`,
+`dump_json`, `--metrics-json` on the CLI). `profile_run` wraps a block in
+cProfile or pyinstrument for one-off profiling.
+"""
+
+import contextlib
+import functools
+import json
+import logging
+import math
+import sys
+import threading
+import time
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+logger = logging.getLogger("researchmate.metrics")
+
+PREFIX = "researchmate_"
+
+# Seconds; spans range from sub-millisecond cache lookups to minute-long PDF extractions
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, math.inf)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def quantile(self, q: float) -> float:
+        """
+        Upper bound of the bucket holding the q-th quantile (Prometheus-style estimate).
+        """
+        if not self.count:
+            return 0.0
+        target, seen = q * self.count, 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return math.inf
+
+
+class Registry:
+    """
+    Thread-safe store of counters, histograms and gauge callbacks.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: Dict[str, Dict[LabelKey, float]] = {}
+        self.histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+        self.gauges: Dict[str, Dict[LabelKey, Callable[[], float]]] = {}
+        self.help: Dict[str, str] = {}
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        key = _labels(labels)
+        with self._lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        key = _labels(labels)
+        with self._lock:
+            series = self.histograms.setdefault(name, {})
+            if key not in series:
+                series[key] = Histogram()
+            series[key].observe(value)
+
+    def gauge(self, name: str, fn: Callable[[], float], **labels):
+        with self._lock:
+            self.gauges.setdefault(name, {})[_labels(labels)] = fn
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+            self.gauges.clear()
+
+    def _gauge_values(self) -> Dict[str, Dict[LabelKey, float]]:
+        with self._lock:
+            gauges = {name: dict(series) for name, series in self.gauges.items()}
+        values = {}
+        for name, series in gauges.items():
+            for key, fn in series.items():
+                try:
+                    values.setdefault(name, {})[key] = float(fn())
+                except Exception as e:
+                    logger.debug(f"Gauge {name} failed: {e}")
+        return values
+
+    def to_prometheus(self) -> str:
+        lines = []
+
+        def fmt(key: LabelKey, extra: Tuple = ()) -> str:
+            pairs = list(key) + list(extra)
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+        with self._lock:
+            counters = {n: dict(s) for n, s in self.counters.items()}
+            histograms = {n: {k: (h.buckets, list(h.counts), h.sum, h.count) for k, h in s.items()}
+                          for n, s in self.histograms.items()}
+        for name, series in sorted(counters.items()):
+            lines.append(f"# TYPE {PREFIX}{name} counter")
+            for key, value in series.items():
+                lines.append(f"{PREFIX}{name}{fmt(key)} {value:g}")
+        for name, series in sorted(histograms.items()):
+            lines.append(f"# TYPE {PREFIX}{name} histogram")
+            for key, (buckets, counts, total, count) in series.items():
+                cumulative = 0
+                for bound, c in zip(buckets, counts):
+                    cumulative += c
+                    le = "+Inf" if bound == math.inf else f"{bound:g}"
+                    lines.append(f"{PREFIX}{name}_bucket{fmt(key, (('le', le),))} {cumulative}")
+                lines.append(f"{PREFIX}{name}_sum{fmt(key)} {total:g}")
+                lines.append(f"{PREFIX}{name}_count{fmt(key)} {count}")
+        for name, series in sorted(self._gauge_values().items()):
+            lines.append(f"# TYPE {PREFIX}{name} gauge")
+            for key, value in series.items():
+                lines.append(f"{PREFIX}{name}{fmt(key)} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def to_dict(self) -> Dict:
+        def label_str(key: LabelKey) -> str:
+            return ",".join(f"{k}={v}" for k, v in key) or "_"
+
+        with self._lock:
+            counters = {n: {label_str(k): v for k, v in s.items()} for n, s in self.counters.items()}
+            spans = {
+                n: {
+                    label_str(k): {
+                        "count": h.count,
+                        "sum": h.sum,
+                        "mean": h.sum / h.count if h.count else 0.0,
+                        "p50": h.quantile(0.5),
+                        "p95": h.quantile(0.95),
+                        "p99": h.quantile(0.99),
+                    }
+                    for k, h in s.items()
+                }
+                for n, s in self.histograms.items()
+            }
+        gauges = {n: {label_str(k): v for k, v in s.items()} for n, s in self._gauge_values().items()}
+        return {"counters": counters, "histograms": spans, "gauges": gauges, "cache_hit_rate": self.cache_hit_rates()}
+
+    def cache_hit_rates(self) -> Dict[str, float]:
+        with self._lock:
+            series = dict(self.counters.get("cache_requests_total", {}))
+        totals: Dict[str, list] = {}
+        for key, value in series.items():
+            labels = dict(key)
+            hits_total = totals.setdefault(labels.get("cache", "_"), [0.0, 0.0])
+            hits_total[1] += value
+            if labels.get("result") == "hit":
+                hits_total[0] += value
+        return {cache: hits / total if total else 0.0 for cache, (hits, total) in totals.items()}
+
+
+REGISTRY = Registry()
+
+
+def inc(name: str, value: float = 1.0, **labels):
+    REGISTRY.inc(name, value, **labels)
+
+
+def observe(name: str, value: float, **labels):
+    REGISTRY.observe(name, value, **labels)
+
+
+def gauge(name: str, fn: Callable[[], float], **labels):
+    REGISTRY.gauge(name, fn, **labels)
+
+
+def cache_access(cache: str, hit: bool, count: int = 1):
+    if count:
+        REGISTRY.inc("cache_requests_total", count, cache=cache, result="hit" if hit else "miss")
+
+
+@contextlib.contextmanager
+def span(name: str, **labels) -> Iterator[None]:
+    """
+    Times the block into the `<name>_seconds` histogram and counts exceptions in
+    `<name>_errors_total`.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        REGISTRY.inc(f"{name}_errors_total", **labels)
+        raise
+    finally:
+        REGISTRY.observe(f"{name}_seconds", time.perf_counter() - started, **labels)
+
+
+def timed(name: Optional[str] = None, **labels):
+    """
+    Decorator form of `span`; the span name defaults to the function name.
+    """
+    def decorator(fn):
+        span_name = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(span_name, **labels):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def to_prometheus() -> str:
+    return REGISTRY.to_prometheus()
+
+
+def to_dict() -> Dict:
+    return REGISTRY.to_dict()
+
+
+def dump_json(path) -> None:
+    with open(path, "w") as f:
+        json.dump(to_dict(), f, indent=2)
+    logger.info(f"Wrote metrics to {path}")
+
+
+@contextlib.contextmanager
+def profile_run(output: Optional[str] = None, tool: str = "cprofile", top: int = 30) -> Iterator[None]:
+    """
+    Profiles the block with cProfile (default) or pyinstrument, prints a summary
+    to stderr and, if `output` is given, saves the raw profile (.prof for cProfile,
+    .html for pyinstrument).
+    """
+    if tool == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            logger.warning("pyinstrument is not installed; falling back to cProfile")
+            tool = "cprofile"
+
+    if tool == "pyinstrument":
+        profiler = Profiler()
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            print(profiler.output_text(unicode=True, color=False), file=sys.stderr)
+            if output:
+                with open(output, "w") as f:
+                    f.write(profiler.output_html())
+        return
+
+    import cProfile
+    import pstats
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        stats = pstats.Stats(profiler, stream=sys.stderr).sort_stats("cumulative")
+        stats.print_stats(top)
+        if output:
+            stats.dump_stats(output)
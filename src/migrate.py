@@ -0,0 +1,168 @@
+"""
+migrate.py — Re-embed the active collection with a new model and flip the alias
+
+    python -m src.app --mode migrate --model sentence-transformers/all-mpnet-base-v2
+
+Streams the stored documents out of the collection the "researchmate_papers"
+alias points at, in batches, embeds them with the new model into a collection
+versioned for that model and dimension, and, once it is complete, atomically
+points the alias at it. Searches keep using the old collection until the flip
+(running servers switch within ALIAS_CHECK_INTERVAL seconds), and no paper is
+fetched or parsed again.
+
+Progress is checkpointed after every batch under `<store>/migrations/`, so an
+interrupted job resumes where it stopped. A catch-up pass re-embeds documents
+written or changed in the source during the copy and drops deleted ones; a
+second one runs with writers blocked on the alias lock, immediately before the
+flip, so nothing written to the old collection is lost. Writers switch to the
+new collection as soon as they get the lock. The old collection is kept;
+`set_alias` back to it rolls the change back.
+"""
+
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+from src import metrics
+from src.embedder import embed_batch, model_dimension
+from src.vectorstore import VectorStore, alias_lock, set_alias, versioned_collection_name
+
+logger = logging.getLogger("researchmate.migrate")
+
+MIGRATE_BATCH_SIZE = int(os.getenv("MIGRATE_BATCH_SIZE", "1000"))
+
+
+def _checkpoint_path(vs: VectorStore, target: str) -> Path:
+    return vs.root / "migrations" / f"{target}.json"
+
+
+def _load_checkpoint(path: Path, source: str) -> Dict:
+    if path.exists():
+        checkpoint = json.loads(path.read_text())
+        if checkpoint.get("source") == source and not checkpoint.get("done"):
+            return checkpoint
+    return {"source": source, "offset": 0, "embedded": 0, "done": False}
+
+
+def _save_checkpoint(path: Path, checkpoint: Dict):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(checkpoint))
+    os.replace(tmp, path)
+
+
+def _copy_page(page: Dict, target: VectorStore, encode_batch: Optional[int], num_workers: Optional[int]) -> int:
+    """
+    Embeds and writes the documents of `page` that the target lacks or holds an
+    older version of. Returns how many were embedded.
+    """
+    metadatas = page["metadatas"]
+    hashes = [(m or {}).get("content_hash") for m in metadatas]
+    stored = target.get_content_hashes(page["ids"])
+    changed = [i for i, (id_, h) in enumerate(zip(page["ids"], hashes)) if id_ not in stored or stored[id_] != h]
+    if not changed:
+        return 0
+    documents = [page["documents"][i] or "" for i in changed]
+    vectors = embed_batch(documents, batch_size=encode_batch, num_workers=num_workers, model_name=target.model_name)
+    target.upsert_embeddings(
+        documents,
+        vectors,
+        metadatas=[metadatas[i] or None for i in changed],
+        ids=[page["ids"][i] for i in changed],
+    )
+    metrics.inc("migrate_documents_total", len(changed), model=target.model_name)
+    return len(changed)
+
+
+def _catch_up(source, target: VectorStore, batch_size: int, encode_batch: Optional[int],
+              num_workers: Optional[int]) -> tuple:
+    """
+    Brings `target` level with `source`: copies new and changed documents and
+    deletes the ones gone from the source. Returns (embedded, deleted).
+    """
+    source_ids = set()
+    embedded = 0
+    for offset in range(0, source.count(), batch_size):
+        page = source.get(limit=batch_size, offset=offset, include=["documents", "metadatas"])
+        source_ids.update(page["ids"])
+        embedded += _copy_page(page, target, encode_batch, num_workers)
+    stale = []
+    for offset in range(0, target.collection.count(), batch_size):
+        stale.extend(i for i in target.collection.get(limit=batch_size, offset=offset, include=[])["ids"]
+                     if i not in source_ids)
+    if stale:
+        target.collection.delete(ids=stale)
+        target.lexical.delete(stale)
+    target.persist()
+    return embedded, len(stale)
+
+
+def migrate(vs: VectorStore, model_name: str, batch_size: int = None, encode_batch: Optional[int] = None,
+            num_workers: Optional[int] = None, flip: bool = True) -> Dict:
+    """
+    Re-embeds every document of `vs`'s active collection with `model_name` and,
+    if `flip`, points the alias at the new collection and switches `vs` to it.
+    Returns a summary of the run.
+    """
+    batch_size = batch_size or MIGRATE_BATCH_SIZE
+    started = time.perf_counter()
+    source = vs.collection
+    target_name = versioned_collection_name(model_name, model_dimension(model_name))
+    if target_name == vs.collection_name:
+        logger.info(f"{vs.collection_name} is already embedded with {model_name}; nothing to migrate")
+        return {"source": vs.collection_name, "target": target_name, "embedded": 0, "deleted": 0, "flipped": False}
+
+    target = VectorStore(vs.persist_directory, vs.backend, vs.quantization,
+                         collection_name=target_name, model_name=model_name)
+    checkpoint_path = _checkpoint_path(vs, target_name)
+    checkpoint = _load_checkpoint(checkpoint_path, vs.collection_name)
+    total = source.count()
+    if checkpoint["offset"]:
+        logger.info(f"Resuming migration {vs.collection_name} -> {target_name} at {checkpoint['offset']}/{total}")
+    else:
+        logger.info(f"Migrating {total} documents {vs.collection_name} -> {target_name}")
+
+    # Copy pass: page through the source, checkpointing after each batch
+    while True:
+        with metrics.span("migrate_batch", model=model_name):
+            page = source.get(limit=batch_size, offset=checkpoint["offset"], include=["documents", "metadatas"])
+            if not page["ids"]:
+                break
+            checkpoint["embedded"] += _copy_page(page, target, encode_batch, num_workers)
+        checkpoint["offset"] += len(page["ids"])
+        target.persist()
+        _save_checkpoint(checkpoint_path, checkpoint)
+        elapsed = time.perf_counter() - started
+        logger.info(f"Migrated {checkpoint['offset']}/{total} documents ({checkpoint['offset'] / elapsed:.0f}/s)")
+
+    # Catch-up pass: writes and deletes that landed in the source during the copy
+    source_name = vs.collection_name
+    caught_up, deleted = _catch_up(source, target, batch_size, encode_batch, num_workers)
+    if flip:
+        # Final catch-up and flip with writers blocked; the target is pinned and
+        # writes without the lock
+        with alias_lock(vs.root, exclusive=True):
+            embedded, removed = _catch_up(source, target, batch_size, encode_batch, num_workers)
+            caught_up, deleted = caught_up + embedded, deleted + removed
+            set_alias(vs.root, target_name)
+        vs.refresh_alias(force=True)
+    checkpoint["embedded"] += caught_up
+
+    summary = {
+        "source": source_name,
+        "target": target_name,
+        "model": model_name,
+        "documents": target.collection.count(),
+        "embedded": checkpoint["embedded"],
+        "caught_up": caught_up,
+        "deleted": deleted,
+        "seconds": round(time.perf_counter() - started, 2),
+        "flipped": flip,
+    }
+    checkpoint["done"] = True
+    _save_checkpoint(checkpoint_path, checkpoint)
+    logger.info(f"Migration finished: {summary}")
+    return summary
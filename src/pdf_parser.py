@@ -1,9 +1,20 @@
+import json
 import os
 import requests
+import signal
+import threading
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from PyPDF2 import PdfReader
 import logging
 import re
+from typing import Dict, Iterator, List, Optional
+
+from src import metrics
+from src.catalog import PagePacker, get_catalog, open_catalog
+from src.chunker import DEFAULT_MAX_TOKENS, DEFAULT_OVERLAP, iter_chunks
+from src.metadata import paper_metadata
+from src.utils import file_hash, paper_uid
 
 logger = logging.getLogger(__name__)
 
@@ -11,15 +22,56 @@ logger = logging.getLogger(__name__)
 DATA_DIR = Path(__file__).parent.parent / "data" / "papers"
 DATA_DIR.mkdir(parents=True, exist_ok=True)
 
+# Documents each extraction worker handles before it is replaced
+EXTRACT_TASKS_PER_WORKER = 50
+
 def sanitize_filename(name: str) -> str:
     """
     Sanitize filename to avoid invalid characters.
     """
     return re.sub(r'[^a-zA-Z0-9_\-\.]', '_', name)
 
-def download_pdf(pdf_url: str, paper_id: str) -> str | None:
+# Validators (ETag / Last-Modified) of downloaded PDFs, keyed by filename
+INDEX_PATH = DATA_DIR / "_index.json"
+_index_lock = threading.Lock()
+_session = requests.Session()
+
+DOWNLOAD_CHUNK_SIZE = 1 << 16
+
+class DownloadError(Exception):
+    """
+    A PDF could not be downloaded; raised by `download_pdf(..., raise_errors=True)`.
+    """
+
+def _load_index() -> Dict[str, Dict]:
+    try:
+        with open(INDEX_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def _update_index(filename: str, entry: Dict) -> None:
+    with _index_lock:
+        index = _load_index()
+        index[filename] = entry
+        tmp = INDEX_PATH.with_suffix(".json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(index, f, indent=1, sort_keys=True)
+        os.replace(tmp, INDEX_PATH)
+
+def download_pdf(pdf_url: str, paper_id: str, revalidate: bool = False, raise_errors: bool = False) -> str | None:
     """
     Downloads a PDF if it does not exist and returns the local path.
+
+    The response is streamed to a `.part` file in fixed-size chunks and renamed
+    into place once complete, so a crash never leaves a truncated PDF behind and
+    memory use does not depend on the file size. An interrupted `.part` file is
+    resumed with a Range request. With `revalidate`, an existing file is checked
+    against the server using the stored ETag / Last-Modified and re-fetched only
+    if it changed.
+
+    Returns None if the PDF cannot be fetched (or raises DownloadError with the
+    reason, with `raise_errors`); a previously downloaded copy is still returned.
     """
     if not pdf_url:
         logger.warning("No PDF URL provided")
@@ -27,55 +79,240 @@ def download_pdf(pdf_url: str, paper_id: str) -> str | None:
 
     filename = sanitize_filename(f"{paper_id}.pdf")
     pdf_path = DATA_DIR / filename
+    part_path = pdf_path.with_name(filename + ".part")
 
-    if pdf_path.exists():
+    if pdf_path.exists() and not revalidate:
+        metrics.inc("pdf_downloads_total", result="cached")
         return str(pdf_path)
 
-    try:
-        response = requests.get(pdf_url, timeout=15)
-        response.raise_for_status()
-        with open(pdf_path, "wb") as f:
-            f.write(response.content)
-        logger.info(f"Saved PDF: {pdf_path}")
-        return str(pdf_path)
-    except Exception as e:
-        logger.warning(f"Failed to download PDF {pdf_url}: {e}")
-        return None
+    cached = _load_index().get(filename, {})
+    headers = {}
+    if pdf_path.exists():
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+    elif part_path.exists() and cached.get("url") == pdf_url and (cached.get("etag") or cached.get("last_modified")):
+        headers["Range"] = f"bytes={part_path.stat().st_size}-"
+        headers["If-Range"] = cached.get("etag") or cached["last_modified"]
+
+    with metrics.span("download_pdf"):
+        try:
+            with _session.get(pdf_url, headers=headers, timeout=15, stream=True) as response:
+                if response.status_code == 304:
+                    metrics.inc("pdf_downloads_total", result="not_modified")
+                    return str(pdf_path)
+                if response.status_code == 416 and "Range" in headers:
+                    # The partial file already holds the whole document
+                    response = None
+                else:
+                    response.raise_for_status()
+
+                if response is None:
+                    entry = cached
+                else:
+                    resuming = response.status_code == 206
+                    entry = {
+                        "url": pdf_url,
+                        "etag": response.headers.get("ETag"),
+                        "last_modified": response.headers.get("Last-Modified"),
+                    }
+                    # Record validators before the body so an interrupted download can resume
+                    _update_index(filename, entry)
+
+                    received = 0
+                    with open(part_path, "ab" if resuming else "wb") as f:
+                        for block in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                            f.write(block)
+                            received += len(block)
+                    metrics.inc("pdf_download_bytes_total", received)
+
+            with open(part_path, "rb") as f:
+                if f.read(5) != b"%PDF-":
+                    part_path.unlink()
+                    metrics.inc("pdf_downloads_total", result="not_pdf")
+                    raise DownloadError(f"response from {pdf_url} is not a PDF")
+
+            os.replace(part_path, pdf_path)
+            _update_index(filename, dict(entry, size=pdf_path.stat().st_size))
+            logger.info(f"Saved PDF: {pdf_path}")
+            metrics.inc("pdf_downloads_total", result="downloaded")
+            return str(pdf_path)
+        except Exception as e:
+            logger.warning(f"Failed to download PDF {pdf_url}: {e}")
+            if not isinstance(e, DownloadError):
+                metrics.inc("pdf_downloads_total", result="failed")
+            if pdf_path.exists():
+                return str(pdf_path)
+            if raise_errors:
+                if isinstance(e, DownloadError):
+                    raise
+                raise DownloadError(str(e)) from e
+            return None
+
+def iter_pdf_pages(pdf_path: str, max_pages: Optional[int] = None) -> Iterator[str]:
+    """
+    Yields the text of each page of a PDF file in order, stopping after `max_pages`.
 
-def extract_text_from_pdf(pdf_path: str) -> str:
+    The file is read through an open handle so PyPDF2 loads objects on demand
+    instead of copying the whole file into memory.
+    """
+    with open(pdf_path, "rb") as f:
+        reader = PdfReader(f)
+        for i, page in enumerate(reader.pages):
+            if max_pages is not None and i >= max_pages:
+                break
+            yield page.extract_text() or ""
+
+def extract_text_from_pdf(pdf_path: str, max_pages: Optional[int] = None) -> str:
     """
     Extracts text from a PDF file.
     """
+    pages = 0
     try:
-        reader = PdfReader(pdf_path)
-        text = ""
-        for page in reader.pages:
-            text += page.extract_text() or ""
-        return text
+        with metrics.span("extract_text_from_pdf"):
+            text = []
+            for page in iter_pdf_pages(pdf_path, max_pages):
+                text.append(page)
+                pages += 1
+            return "".join(text)
     except Exception as e:
         logger.warning(f"Failed to extract text from {pdf_path}: {e}")
         return ""
+    finally:
+        metrics.inc("pdf_pages_extracted_total", pages)
+
+class ExtractionTimeout(Exception):
+    pass
+
+def _raise_timeout(signum, frame):
+    raise ExtractionTimeout()
+
+def extract_document(
+    pdf_path: str,
+    max_tokens: int = DEFAULT_MAX_TOKENS,
+    overlap: int = DEFAULT_OVERLAP,
+    max_pages: Optional[int] = None,
+    timeout: Optional[int] = None,
+    chunk: bool = True,
+    catalog_path: Optional[str] = None,
+    uid: Optional[str] = None,
+) -> Dict:
+    """
+    Parses a PDF once, page by page. With `chunk`, pages are cut into
+    token-bounded chunks as they are read and are not kept; otherwise the page
+    texts are returned. With `catalog_path` and `uid`, the text is packed into
+    the paper catalog as it streams and saved by this process (e.g. the
+    extraction worker), so it is never sent back.
+
+    Returns a dict with `pages` (None with `chunk`), `chunks`, `num_pages`,
+    `status` ("extracted", "partial" or "failed", as in src.catalog), `error`,
+    `page_limit`, the `pdf_hash` of the file and whether it was `catalogued`.
+
+    At most `max_pages` pages are read; text that reached the limit is still
+    "extracted", with `page_limit` set to it. When `timeout` (seconds) is set and
+    the call runs on a process's main thread (as in an extraction pool worker),
+    what was produced before the deadline is returned with status "partial".
+    """
+    pages = None if chunk else []
+    chunks = []
+    packer = PagePacker() if catalog_path and uid else None
+    num_pages = 0
+    status, error, page_limit = "extracted", None, None
+
+    def read_pages():
+        nonlocal num_pages
+        for page in iter_pdf_pages(pdf_path, max_pages):
+            num_pages += 1
+            if packer is not None:
+                packer.add(page)
+            if pages is not None:
+                pages.append(page)
+            yield page
+
+    use_alarm = bool(timeout) and hasattr(signal, "SIGALRM") and threading.current_thread() is threading.main_thread()
+    if use_alarm:
+        previous = signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.alarm(timeout)
+    try:
+        if chunk:
+            for piece in iter_chunks(read_pages(), max_tokens=max_tokens, overlap=overlap):
+                chunks.append(piece)
+        else:
+            for _ in read_pages():
+                pass
+        if max_pages is not None and num_pages >= max_pages:
+            page_limit = max_pages
+    except ExtractionTimeout:
+        logger.warning(f"Extraction of {pdf_path} timed out after {timeout}s; kept {len(chunks)} chunks")
+        status, error = "partial", f"timed out after {timeout}s"
+    except Exception as e:
+        logger.warning(f"Failed to extract text from {pdf_path}: {e}")
+        status, error = ("partial" if num_pages else "failed"), str(e)
+    finally:
+        if use_alarm:
+            signal.alarm(0)
+            signal.signal(signal.SIGALRM, previous)
+    try:
+        pdf_hash = file_hash(pdf_path)
+    except OSError:
+        pdf_hash = None
+    if packer is not None:
+        open_catalog(catalog_path).save_pages(uid, packer, status, pdf_path, pdf_hash, error, page_limit)
+    return {"pages": pages, "chunks": chunks, "num_pages": num_pages, "status": status, "error": error,
+            "page_limit": page_limit, "pdf_hash": pdf_hash, "catalogued": packer is not None}
+
+def extract_chunks_from_pdf(
+    pdf_path: str,
+    max_tokens: int = DEFAULT_MAX_TOKENS,
+    overlap: int = DEFAULT_OVERLAP,
+    max_pages: Optional[int] = None,
+    timeout: Optional[int] = None,
+) -> List[Dict]:
+    """
+    Extracts a PDF page by page straight into token-bounded chunks (see
+    `extract_document`). Returns [] if extraction fails.
+    """
+    return extract_document(pdf_path, max_tokens, overlap, max_pages, timeout)["chunks"]
+
+def make_extraction_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    Process pool for PDF extraction. Workers are recycled periodically so memory
+    held by PyPDF2 after large documents is returned to the OS.
+    """
+    return ProcessPoolExecutor(max_workers=workers, max_tasks_per_child=EXTRACT_TASKS_PER_WORKER)
 
 def parse_pdf(paper: dict) -> dict | None:
     """
     Downloads and extracts text from a paper dictionary with keys: id, pdf_url, title, authors.
     Returns a dictionary with text and cleaned metadata for Chroma ingestion.
+
+    Text already in the paper catalog (src.catalog) is reused; newly extracted
+    text is added to it.
     """
-    pdf_path = download_pdf(paper.get("pdf_url"), paper.get("id"))
-    if not pdf_path:
-        return None
+    catalog = get_catalog()
+    uid = paper.get("uid") or paper_uid(paper)
+    pages = catalog.get_pages(uid) if catalog else None
+    if pages is None:
+        pdf_path = download_pdf(paper.get("pdf_url"), uid)
+        if not pdf_path:
+            return None
+        with metrics.span("extract_text_from_pdf"):
+            document = extract_document(pdf_path, chunk=False)
+        metrics.inc("pdf_pages_extracted_total", document["num_pages"])
+        pages = document["pages"]
+        if catalog:
+            catalog.upsert_papers([dict(paper, uid=uid)])
+            catalog.save_pages(uid, pages, document["status"], pdf_path, document["pdf_hash"], document["error"],
+                               document["page_limit"])
 
-    text = extract_text_from_pdf(pdf_path)
+    text = "".join(pages)
     if not text.strip():
-        logger.warning(f"No text extracted from PDF {pdf_path}")
+        logger.warning(f"No text extracted for paper {uid}")
         return None
 
     # Clean metadata
-    metadata = {
-        "title": paper.get("title", ""),
-        "authors": ", ".join(paper.get("authors", [])) if isinstance(paper.get("authors"), list) else paper.get("authors", ""),
-        "id": paper.get("id", "")
-    }
+    metadata = paper_metadata(dict(paper, uid=uid))
 
     return {
         "text": text,
@@ -0,0 +1,418 @@
+"""
+pipeline.py — Staged, concurrent ingest pipeline for ResearchMate
+
+Papers flow through bounded queues between stages:
+
+    collect -> download -> extract -> chunk -> embed -> write
+
+Each stage runs its own worker threads (text extraction hands the CPU-bound
+PyPDF2 work to a process pool), so network fetches, PDF parsing, model
+inference and Chroma writes overlap. A full queue blocks its producers, which
+keeps memory bounded when a downstream stage is the bottleneck.
+
+Papers are recorded in the paper catalog (src.catalog) as they are collected,
+and extracted text is stored there, so a paper whose text is already catalogued
+skips the download and extract stages entirely. With `revalidate_pdfs`, stored
+PDFs are first re-checked with a conditional request and re-extracted only if
+the server sent a different file.
+"""
+
+import logging
+import queue
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from src import metrics
+from src.catalog import get_catalog
+from src.chunker import DEFAULT_MAX_TOKENS, DEFAULT_OVERLAP, iter_chunks
+from src.embedder import embed_batch
+from src.metadata import paper_metadata
+from src.pdf_parser import DownloadError, download_pdf, extract_document, make_extraction_pool
+from src.utils import file_hash, paper_uid, text_hash
+
+logger = logging.getLogger("researchmate.pipeline")
+
+_DONE = object()
+
+
+@dataclass
+class PipelineConfig:
+    download_workers: int = 8
+    extract_workers: int = 4
+    chunk_workers: int = 1
+    embed_batch: int = 256       # chunks per embed call
+    encode_batch: Optional[int] = None  # texts per model forward pass
+    embed_workers: Optional[int] = None  # processes in the encode pool
+    write_batch: int = 512       # chunks per Chroma write
+    chunk_tokens: int = DEFAULT_MAX_TOKENS
+    max_pages: Optional[int] = None  # pages extracted per PDF
+    extract_timeout: int = 120   # seconds per PDF before keeping what was extracted
+    chunk_overlap: int = DEFAULT_OVERLAP
+    queue_size: int = 64
+    fetch_pdfs: bool = True
+    refresh: bool = False        # re-process papers already in the store
+    revalidate_pdfs: bool = False  # re-check stored PDFs with the server (ETag / Last-Modified)
+    use_catalog: bool = True     # read/record extracted text in the paper catalog
+
+
+@dataclass
+class StageStats:
+    name: str
+    workers: int
+    items_in: int = 0
+    items_out: int = 0
+    errors: int = 0
+    busy: float = 0.0
+
+    def utilization(self, elapsed: float) -> float:
+        return self.busy / (elapsed * self.workers) if elapsed else 0.0
+
+
+@dataclass
+class PipelineReport:
+    elapsed: float
+    stages: List[StageStats]
+    papers: int = 0
+    chunks: int = 0
+    duplicates: int = 0  # same paper seen twice in this run
+    catalogued: int = 0  # text read from the paper catalog instead of the PDF
+    existing: int = 0    # paper already in the store (skipped unless refresh)
+    unchanged: int = 0   # chunks whose content hash matched the stored one
+
+    def format(self) -> str:
+        lines = [
+            f"Ingest finished in {self.elapsed:.1f}s: {self.papers} papers, {self.chunks} chunks "
+            f"({self.papers / self.elapsed if self.elapsed else 0:.2f} papers/s, "
+            f"{self.chunks / self.elapsed if self.elapsed else 0:.2f} chunks/s)",
+            f"Skipped {self.duplicates} duplicate papers, {self.existing} already stored, "
+            f"{self.unchanged} unchanged chunks; {self.catalogued} papers read from the catalog",
+            f"{'stage':<10}{'workers':>8}{'in':>8}{'out':>8}{'errors':>8}{'busy s':>10}{'util':>7}",
+        ]
+        for s in self.stages:
+            lines.append(
+                f"{s.name:<10}{s.workers:>8}{s.items_in:>8}{s.items_out:>8}{s.errors:>8}"
+                f"{s.busy:>10.1f}{s.utilization(self.elapsed):>7.0%}"
+            )
+        return "\n".join(lines)
+
+
+class _Map:
+    """Per-worker handler that applies `fn` to each item (None results are dropped)."""
+
+    def __init__(self, fn: Callable):
+        self.fn = fn
+
+    def process(self, item):
+        result = self.fn(item)
+        return [] if result is None else [result]
+
+    def flush(self):
+        return []
+
+
+class _Batch:
+    """Per-worker handler that groups items into lists of `size` before calling `fn`."""
+
+    def __init__(self, fn: Callable, size: int):
+        self.fn = fn
+        self.size = size
+        self.pending = []
+
+    def process(self, item):
+        self.pending.append(item)
+        if len(self.pending) < self.size:
+            return []
+        return self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return []
+        batch, self.pending = self.pending, []
+        result = self.fn(batch)
+        return [] if result is None else [result]
+
+
+class _Stage:
+    def __init__(self, name: str, make_handler: Callable, workers: int, inbox: queue.Queue,
+                 outbox: Optional[queue.Queue], fan_out: bool = False):
+        self.stats = StageStats(name, workers)
+        self.make_handler = make_handler
+        self.inbox = inbox
+        self.outbox = outbox
+        self.fan_out = fan_out  # handlers return iterables of items rather than single items
+        self.downstream_workers = 1
+        self._alive = workers
+        self._lock = threading.Lock()
+        self.threads = [
+            threading.Thread(target=self._run, name=f"ingest-{name}-{i}", daemon=True)
+            for i in range(workers)
+        ]
+
+    def start(self):
+        for t in self.threads:
+            t.start()
+
+    def _emit(self, results):
+        for result in results:
+            items = result if self.fan_out else [result]
+            for item in items:
+                with self._lock:
+                    self.stats.items_out += 1
+                if self.outbox is not None:
+                    self.outbox.put(item)
+
+    def _call(self, method, *args):
+        started = time.perf_counter()
+        try:
+            return method(*args)
+        except Exception as e:
+            with self._lock:
+                self.stats.errors += 1
+            logger.warning(f"[{self.stats.name}] failed: {e}")
+            return []
+        finally:
+            with self._lock:
+                self.stats.busy += time.perf_counter() - started
+
+    def _run(self):
+        handler = self.make_handler()
+        while True:
+            item = self.inbox.get()
+            if item is _DONE:
+                break
+            with self._lock:
+                self.stats.items_in += 1
+            self._emit(self._call(handler.process, item))
+        self._emit(self._call(handler.flush))
+        with self._lock:
+            self._alive -= 1
+            last = self._alive == 0
+        # The last worker out tells every downstream worker to stop
+        if last and self.outbox is not None:
+            for _ in range(self.downstream_workers):
+                self.outbox.put(_DONE)
+
+
+def paper_text(paper: Dict) -> str:
+    """
+    Best available text for a paper when no PDF chunks were extracted: full text,
+    then abstract, then title.
+    """
+    text = paper.get("text") or paper.get("abstract") or paper.get("title") or ""
+    if isinstance(text, list):
+        text = " ".join(text)  # flatten list if needed
+    return text.strip()
+
+
+def run_pipeline(papers: Iterable[Dict], vs, config: Optional[PipelineConfig] = None) -> PipelineReport:
+    """
+    Streams `papers` through download, extraction, chunking, embedding and writes
+    into the VectorStore `vs`, and returns a throughput report.
+    """
+    config = config or PipelineConfig()
+    started = time.perf_counter()
+    counts = Counter()
+    counts_lock = threading.Lock()
+    extract_pool = make_extraction_pool(config.extract_workers) if config.fetch_pdfs else None
+    catalog = get_catalog() if config.use_catalog else None
+
+    def download(paper):
+        revalidate = config.revalidate_pdfs and paper.get("pdf_url") and not paper.get("pdf_path")
+        if revalidate:
+            # Conditional fetch: a 304 keeps the local copy, a changed PDF replaces it
+            try:
+                paper["pdf_path"] = download_pdf(paper["pdf_url"], paper["uid"], revalidate=True, raise_errors=True)
+            except DownloadError as e:
+                paper["download_error"] = str(e)
+        if catalog is not None and "pages" not in paper:
+            pages = catalog.get_pages(paper["uid"])
+            stored = catalog.get(paper["uid"]) if revalidate and pages is not None else None
+            changed = bool(stored and paper.get("pdf_path") and file_hash(paper["pdf_path"]) != stored.get("pdf_hash"))
+            if pages is not None and not changed:
+                with counts_lock:
+                    counts["catalogued"] += 1
+                paper["pages"] = pages
+                return paper
+        if not paper.get("pdf_path") and paper.get("pdf_url") and "download_error" not in paper:
+            try:
+                paper["pdf_path"] = download_pdf(paper["pdf_url"], paper["uid"], raise_errors=True)
+            except DownloadError as e:
+                paper["download_error"] = str(e)
+        return paper
+
+    def extract(paper):
+        if "pages" in paper:
+            return paper
+        if paper.get("pdf_path") and not paper.get("text"):
+            # Pages are chunked inside the worker process as they are extracted
+            document = extract_pool.submit(
+                extract_document,
+                paper["pdf_path"],
+                config.chunk_tokens,
+                config.chunk_overlap,
+                config.max_pages,
+                config.extract_timeout,
+                True,
+                # The worker streams the page text into the catalog itself
+                str(catalog.path) if catalog is not None else None,
+                paper["uid"],
+            ).result()
+            paper["chunks"] = document["chunks"]
+        elif catalog is not None and paper.get("download_error"):
+            catalog.set_status(paper["uid"], "failed", f"download failed: {paper['download_error']}")
+        elif catalog is not None and not paper.get("text"):
+            catalog.set_status(paper["uid"], "no_pdf")
+        return paper
+
+    def chunk(paper):
+        pieces = paper.pop("chunks", None)
+        pages = paper.pop("pages", None)
+        if not pieces and pages and any(p.strip() for p in pages):
+            pieces = list(iter_chunks(pages, config.chunk_tokens, config.chunk_overlap))
+        if not pieces:
+            text = paper_text(paper)
+            if not text:
+                return []
+            pieces = list(iter_chunks([text], config.chunk_tokens, config.chunk_overlap))
+        uid = paper["uid"]
+        base = paper_metadata(paper)
+        chunks = [
+            {
+                "id": f"{uid}#{p['index']}",
+                "text": p["text"],
+                "metadata": dict(
+                    base,
+                    chunk=p["index"],
+                    section=p["section"],
+                    page=p["page"],
+                    content_hash=text_hash(p["text"]),
+                ),
+            }
+            for p in pieces
+        ]
+        if config.refresh:
+            vs.delete_stale_chunks(uid, len(chunks))
+        return chunks
+
+    def embed(chunks):
+        # Only re-embed chunks whose content changed since they were stored
+        stored = vs.get_content_hashes([c["id"] for c in chunks])
+        changed = [c for c in chunks if stored.get(c["id"]) != c["metadata"]["content_hash"]]
+        with counts_lock:
+            counts["unchanged"] += len(chunks) - len(changed)
+        if not changed:
+            return None
+        model_name = vs.model_name
+        vectors = embed_batch(
+            [c["text"] for c in changed],
+            batch_size=config.encode_batch,
+            num_workers=config.embed_workers,
+            model_name=model_name,
+        )
+        return changed, vectors, model_name
+
+    def write(batches):
+        # Batches embedded before and after an alias flip carry different models
+        for model_name in dict.fromkeys(m for _, _, m in batches):
+            group = [(batch, vectors) for batch, vectors, m in batches if m == model_name]
+            chunks = [c for batch, _ in group for c in batch]
+            vs.upsert_embeddings(
+                [c["text"] for c in chunks],
+                np.vstack([vectors for _, vectors in group]),
+                metadatas=[c["metadata"] for c in chunks],
+                ids=[c["id"] for c in chunks],
+                model_name=model_name,
+            )
+        written = sum(len(batch) for batch, _, _ in batches)
+        with counts_lock:
+            counts["written"] += written
+        return written
+
+    q = [queue.Queue(maxsize=config.queue_size) for _ in range(5)]
+    # Write batches are counted in embed batches; round up so a write covers write_batch chunks
+    embeds_per_write = max(1, -(-config.write_batch // config.embed_batch))
+    stages = []
+    if config.fetch_pdfs:
+        stages.append(_Stage("download", lambda: _Map(download), config.download_workers, q[0], q[1]))
+        stages.append(_Stage("extract", lambda: _Map(extract), config.extract_workers, q[1], q[2]))
+        chunk_inbox = q[2]
+    else:
+        chunk_inbox = q[0]
+    stages.append(_Stage("chunk", lambda: _Map(chunk), config.chunk_workers, chunk_inbox, q[3], fan_out=True))
+    stages.append(_Stage("embed", lambda: _Batch(embed, config.embed_batch), 1, q[3], q[4]))
+    stages.append(_Stage("write", lambda: _Batch(write, embeds_per_write), 1, q[4], None))
+    for upstream, downstream in zip(stages, stages[1:]):
+        upstream.downstream_workers = len(downstream.threads)
+
+    collect = StageStats("collect", 1)
+    try:
+        for stage in stages:
+            stage.start()
+        first = stages[0]
+        source = iter(papers)
+        seen = set()
+        while True:
+            fetch_started = time.perf_counter()
+            paper = next(source, _DONE)
+            collect.busy += time.perf_counter() - fetch_started
+            if paper is _DONE:
+                break
+            collect.items_in += 1
+            paper["uid"] = uid = paper.get("uid") or paper_uid(paper)
+            if uid in seen:
+                counts["duplicates"] += 1
+                continue
+            seen.add(uid)
+            if catalog is not None:
+                catalog.upsert_papers([paper])
+            # Chunk 0 exists for every stored paper, so one id lookup tells us if it is new
+            if not (config.refresh or config.revalidate_pdfs) and vs.existing_ids([f"{uid}#0"]):
+                counts["existing"] += 1
+                continue
+            collect.items_out += 1
+            first.inbox.put(paper)
+        for _ in first.threads:
+            first.inbox.put(_DONE)
+        for stage in stages:
+            for t in stage.threads:
+                t.join()
+    finally:
+        if extract_pool is not None:
+            extract_pool.shutdown()
+        vs.persist()
+
+    report = PipelineReport(
+        elapsed=time.perf_counter() - started,
+        stages=[collect] + [s.stats for s in stages],
+        papers=collect.items_out,
+        chunks=counts["written"],
+        duplicates=counts["duplicates"],
+        existing=counts["existing"],
+        unchanged=counts["unchanged"],
+        catalogued=counts["catalogued"],
+    )
+    record_metrics(report)
+    return report
+
+
+def record_metrics(report: PipelineReport) -> None:
+    """
+    Adds a finished run's per-stage busy time and item counts to `src.metrics`, so
+    exports show whether ingest was bound by the network, extraction, the model or the store.
+    """
+    metrics.observe("ingest_seconds", report.elapsed)
+    metrics.inc("ingest_papers_total", report.papers)
+    metrics.inc("ingest_chunks_total", report.chunks)
+    metrics.inc("ingest_skipped_total", report.duplicates, reason="duplicate")
+    metrics.inc("ingest_skipped_total", report.existing, reason="existing")
+    metrics.inc("ingest_skipped_total", report.unchanged, reason="unchanged")
+    metrics.inc("ingest_catalogued_total", report.catalogued)
+    for stage in report.stages:
+        metrics.inc("pipeline_stage_busy_seconds_total", stage.busy, stage=stage.name)
+        metrics.inc("pipeline_stage_items_total", stage.items_out, stage=stage.name)
+        metrics.inc("pipeline_stage_errors_total", stage.errors, stage=stage.name)
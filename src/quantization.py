@@ -0,0 +1,251 @@
+"""
+quantization.py — Compact in-memory vector codes for the local index
+
+A quantizer turns float32 embeddings into smaller codes and estimates squared
+L2 distances from a query directly against those codes:
+
+    float16   2 bytes / dimension    near-lossless
+    int8      1 byte / dimension     per-dimension scalar quantization
+    pq        1 byte / subvector     product quantization (asymmetric distances)
+
+`LocalCollection` scans the codes to shortlist candidates and re-ranks the
+shortlist exactly against the full-precision vectors on disk, so only the codes
+need to stay resident in RAM.
+"""
+
+import logging
+import os
+from typing import Dict, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+QUANTIZATIONS = ("float16", "int8", "pq")
+
+# Dimensions per PQ subvector; 384-dim MiniLM vectors become 48-byte codes
+PQ_SUBVECTOR_DIM = int(os.getenv("PQ_SUBVECTOR_DIM", "8"))
+PQ_CENTROIDS = 256
+PQ_TRAIN_SAMPLE = 65536
+PQ_ITERATIONS = 20
+
+# Rows encoded per step, bounding temporary memory
+ENCODE_BLOCK_ROWS = 65536
+
+
+class Quantizer:
+    """
+    Base class: `train` on a sample, `encode` rows into codes, then estimate
+    `distances` from queries to codes. `state` / `from_state` round-trip the
+    trained parameters through an npz file.
+    """
+
+    kind = None
+    dtype = None
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.trained = False
+
+    @property
+    def code_size(self) -> int:
+        """Code width in elements (row shape of the codes array)."""
+        return self.dim
+
+    @property
+    def bytes_per_vector(self) -> int:
+        return self.code_size * np.dtype(self.dtype).itemsize
+
+    def empty_codes(self, rows: int) -> np.ndarray:
+        return np.zeros((rows, self.code_size), dtype=self.dtype)
+
+    def train(self, vectors: np.ndarray):
+        self.trained = True
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    def distances(self, queries: np.ndarray, codes: np.ndarray, norms: np.ndarray) -> np.ndarray:
+        """
+        Approximate squared L2 distances, shape (n_queries, n_codes). `norms` are
+        the exact squared norms of the encoded rows.
+        """
+        raise NotImplementedError
+
+    def state(self) -> Dict[str, np.ndarray]:
+        return {}
+
+    @classmethod
+    def from_state(cls, dim: int, state: Dict[str, np.ndarray]) -> "Quantizer":
+        quantizer = cls(dim)
+        quantizer.trained = True
+        return quantizer
+
+
+class Float16Quantizer(Quantizer):
+    kind = "float16"
+    dtype = np.float16
+
+    def __init__(self, dim: int):
+        super().__init__(dim)
+        # Nothing to learn
+        self.trained = True
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        return np.asarray(vectors, dtype=np.float16)
+
+    def distances(self, queries, codes, norms):
+        dots = queries @ codes.astype(np.float32).T
+        return np.einsum("ij,ij->i", queries, queries)[:, None] + norms[None, :] - 2.0 * dots
+
+
+class Int8Quantizer(Quantizer):
+    """
+    Maps each dimension's observed [min, max] range onto 256 levels.
+    """
+
+    kind = "int8"
+    dtype = np.uint8
+
+    def train(self, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        self.low = vectors.min(axis=0)
+        self.scale = np.maximum(vectors.max(axis=0) - self.low, 1e-12) / 255.0
+        self.trained = True
+
+    def encode(self, vectors):
+        levels = (np.asarray(vectors, dtype=np.float32) - self.low) / self.scale
+        return np.clip(np.rint(levels), 0, 255).astype(np.uint8)
+
+    def distances(self, queries, codes, norms):
+        # x ~= low + scale * code, so q.x = q.low + (q * scale).code
+        dots = (queries @ self.low)[:, None] + (queries * self.scale) @ codes.astype(np.float32).T
+        return np.einsum("ij,ij->i", queries, queries)[:, None] + norms[None, :] - 2.0 * dots
+
+    def state(self):
+        return {"low": self.low, "scale": self.scale}
+
+    @classmethod
+    def from_state(cls, dim, state):
+        quantizer = cls(dim)
+        quantizer.low = np.asarray(state["low"], dtype=np.float32)
+        quantizer.scale = np.asarray(state["scale"], dtype=np.float32)
+        quantizer.trained = True
+        return quantizer
+
+
+class ProductQuantizer(Quantizer):
+    """
+    Splits vectors into `subvectors` equal slices and replaces each slice with the
+    index of its nearest of 256 k-means centroids. Distances are computed
+    asymmetrically: the query stays exact and is compared against centroid tables.
+    """
+
+    kind = "pq"
+    dtype = np.uint8
+
+    def __init__(self, dim: int, subvectors: Optional[int] = None):
+        super().__init__(dim)
+        if subvectors is None:
+            subvectors = max(1, dim // PQ_SUBVECTOR_DIM)
+            while dim % subvectors:
+                subvectors -= 1
+        if dim % subvectors:
+            raise ValueError(f"Dimension {dim} is not divisible into {subvectors} subvectors")
+        self.subvectors = subvectors
+        self.sub_dim = dim // subvectors
+        self.centroids = None  # (subvectors, PQ_CENTROIDS, sub_dim)
+
+    @property
+    def code_size(self) -> int:
+        return self.subvectors
+
+    def _split(self, vectors: np.ndarray) -> np.ndarray:
+        return np.asarray(vectors, dtype=np.float32).reshape(len(vectors), self.subvectors, self.sub_dim)
+
+    def train(self, vectors, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if len(vectors) > PQ_TRAIN_SAMPLE:
+            vectors = vectors[rng.choice(len(vectors), PQ_TRAIN_SAMPLE, replace=False)]
+        parts = self._split(vectors)
+        k = min(PQ_CENTROIDS, len(vectors))
+        self.centroids = np.zeros((self.subvectors, PQ_CENTROIDS, self.sub_dim), dtype=np.float32)
+        for j in range(self.subvectors):
+            self.centroids[j, :k] = _kmeans(parts[:, j], k, PQ_ITERATIONS, rng)
+            if k < PQ_CENTROIDS:
+                # Unused slots repeat real centroids so every code decodes to something sensible
+                self.centroids[j, k:] = self.centroids[j, :k][np.arange(PQ_CENTROIDS - k) % k]
+        self.trained = True
+
+    def encode(self, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        codes = np.empty((len(vectors), self.subvectors), dtype=np.uint8)
+        for start in range(0, len(vectors), ENCODE_BLOCK_ROWS):
+            parts = self._split(vectors[start:start + ENCODE_BLOCK_ROWS])
+            for j in range(self.subvectors):
+                codes[start:start + len(parts), j] = _nearest_centroid(parts[:, j], self.centroids[j])
+        return codes
+
+    def distances(self, queries, codes, norms):
+        # tables[q, j, c] = |query q's j-th slice - centroid c of subspace j|^2
+        parts = self._split(queries)
+        tables = (
+            np.einsum("qjd,qjd->qj", parts, parts)[:, :, None]
+            + np.einsum("jcd,jcd->jc", self.centroids, self.centroids)[None, :, :]
+            - 2.0 * np.einsum("qjd,jcd->qjc", parts, self.centroids)
+        )
+        out = np.zeros((len(queries), len(codes)), dtype=np.float32)
+        for j in range(self.subvectors):
+            out += tables[:, j, codes[:, j]]
+        return out
+
+    def state(self):
+        return {"centroids": self.centroids}
+
+    @classmethod
+    def from_state(cls, dim, state):
+        centroids = np.asarray(state["centroids"], dtype=np.float32)
+        quantizer = cls(dim, subvectors=centroids.shape[0])
+        quantizer.centroids = centroids
+        quantizer.trained = True
+        return quantizer
+
+
+def _nearest_centroid(points: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    dist = (
+        np.einsum("ij,ij->i", points, points)[:, None]
+        + np.einsum("ij,ij->i", centroids, centroids)[None, :]
+        - 2.0 * points @ centroids.T
+    )
+    return dist.argmin(axis=1)
+
+
+def _kmeans(points: np.ndarray, k: int, iterations: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    Lloyd's k-means; empty clusters are re-seeded from random points.
+    """
+    centroids = points[rng.choice(len(points), k, replace=False)].copy()
+    for _ in range(iterations):
+        assign = _nearest_centroid(points, centroids)
+        counts = np.bincount(assign, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, points)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        if empty.any():
+            centroids[empty] = points[rng.choice(len(points), int(empty.sum()), replace=False)]
+    return centroids
+
+
+_QUANTIZERS = {q.kind: q for q in (Float16Quantizer, Int8Quantizer, ProductQuantizer)}
+
+
+def make_quantizer(kind: str, dim: int) -> Quantizer:
+    if kind not in _QUANTIZERS:
+        raise ValueError(f"Unknown quantization '{kind}', expected one of {QUANTIZATIONS}")
+    return _QUANTIZERS[kind](dim)
+
+
+def load_quantizer(kind: str, dim: int, state: Dict[str, np.ndarray]) -> Quantizer:
+    return _QUANTIZERS[kind].from_state(dim, state)
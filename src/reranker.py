@@ -0,0 +1,169 @@
+"""
+reranker.py — Cross-encoder re-ranking of first-stage search hits
+
+The vector / BM25 / hybrid search is the cheap first stage: it returns a wide
+candidate set. A small local cross-encoder then reads each (query, chunk) pair
+and re-orders the candidates by its relevance score, which is much more precise
+at small k than embedding distance.
+
+Scoring is batched and cached per (query, document id, content hash), and
+bounded by a per-request time budget: candidates are scored best-first, in
+batches sized to the time left, and whatever the budget does not cover keeps
+its first-stage order. The per-pair cost that sizes the batches is measured
+when the model is loaded and refined after every batch. If the model cannot be
+loaded, hits are returned in first-stage order.
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Sequence
+
+from src import metrics
+from src.cache import LRUCache
+
+logger = logging.getLogger("researchmate.reranker")
+
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+# Set RERANK=0 to disable the second stage
+RERANK_ENABLED = os.getenv("RERANK", "1") != "0"
+# First-stage candidates fetched per request for re-ranking
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "30"))
+# Milliseconds of cross-encoder time allowed per request
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "250"))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "16"))
+RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "50000"))
+# Tokens of (query + chunk) the cross-encoder reads
+RERANK_MAX_LENGTH = 256
+
+_model = None
+_model_failed = False
+_model_lock = threading.Lock()
+_scores = LRUCache(max_entries=RERANK_CACHE_SIZE, name="rerank_scores")
+# Running estimate of seconds per scored pair, used to stop before the budget is exceeded
+_seconds_per_pair: Optional[float] = None
+
+
+def get_reranker():
+    """
+    Returns the cross-encoder, loading it on first use, or None if it cannot be
+    loaded (the failure is logged once and not retried).
+    """
+    global _model, _model_failed
+    with _model_lock:
+        if _model is None and not _model_failed:
+            try:
+                # Imported here: sentence_transformers pulls in torch
+                from sentence_transformers import CrossEncoder
+
+                logger.info(f"Loading re-ranking model: {RERANK_MODEL}")
+                _model = CrossEncoder(RERANK_MODEL, max_length=RERANK_MAX_LENGTH)
+                _calibrate(_model)
+            except Exception as e:
+                _model, _model_failed = None, True
+                logger.warning(f"Re-ranking disabled, could not load {RERANK_MODEL}: {e}")
+    return _model
+
+
+def _calibrate(model):
+    """
+    Seeds the per-pair cost estimate with a timed batch of full-length pairs, so
+    the first request's batches are already sized to its budget.
+    """
+    global _seconds_per_pair
+    pairs = [("warm up", "warm up " * RERANK_MAX_LENGTH)] * RERANK_BATCH_SIZE
+    # The first call pays one-off setup costs; time the second
+    model.predict(pairs[:1], batch_size=RERANK_BATCH_SIZE, show_progress_bar=False)
+    started = time.perf_counter()
+    model.predict(pairs, batch_size=RERANK_BATCH_SIZE, show_progress_bar=False)
+    _seconds_per_pair = (time.perf_counter() - started) / len(pairs)
+    logger.info(f"Re-ranking costs {_seconds_per_pair * 1000:.2f} ms per pair")
+
+
+def set_reranker(model, calibrate: bool = True):
+    """
+    Installs an already-constructed cross-encoder (anything with a CrossEncoder
+    `predict(pairs, batch_size=...)` method) and clears cached scores. Pass
+    `calibrate=False` to skip timing it.
+    """
+    global _model, _model_failed, _seconds_per_pair
+    with _model_lock:
+        _model, _model_failed, _seconds_per_pair = model, False, None
+        if model is not None and calibrate:
+            _calibrate(model)
+    _scores.clear()
+
+
+def cache_stats() -> Dict[str, float]:
+    return _scores.stats()
+
+
+def _key(query: str, hit: Dict) -> tuple:
+    return query, hit.get("id"), (hit.get("metadata") or {}).get("content_hash")
+
+
+def rerank(query: str, hits: Sequence[Dict], top_k: Optional[int] = None, budget_ms: Optional[float] = None,
+           batch_size: Optional[int] = None) -> List[Dict]:
+    """
+    Re-orders `hits` by cross-encoder relevance and returns the first `top_k`.
+
+    Scored hits are copied with a "rerank_score" (0-1 for the default model) and
+    come first, best first; hits left unscored when `budget_ms` runs out follow
+    in their original order.
+    """
+    global _seconds_per_pair
+    hits = list(hits)
+    top_k = len(hits) if top_k is None else top_k
+    budget = (RERANK_BUDGET_MS if budget_ms is None else budget_ms) / 1000.0
+    batch_size = batch_size or RERANK_BATCH_SIZE
+    if len(hits) < 2:
+        return hits[:top_k]
+    model = get_reranker()
+    if model is None:
+        return hits[:top_k]
+
+    scores: Dict[int, float] = {}
+    for i, hit in enumerate(hits):
+        cached = _scores.get(_key(query, hit))
+        if cached is not None:
+            scores[i] = cached
+    pending = [i for i in range(len(hits)) if i not in scores]
+
+    started = time.perf_counter()
+    while pending:
+        remaining = budget - (time.perf_counter() - started)
+        if remaining <= 0:
+            break
+        if _seconds_per_pair is None:
+            # Not calibrated: score one pair to measure the cost before a full batch
+            size = 1
+        else:
+            # Shrink the batch to what the remaining budget is expected to cover
+            size = min(batch_size, int(remaining / max(_seconds_per_pair, 1e-9)))
+            if size < 1:
+                break
+        batch, pending = pending[:size], pending[size:]
+        batch_started = time.perf_counter()
+        try:
+            with metrics.span("rerank_batch", model=RERANK_MODEL):
+                batch_scores = model.predict(
+                    [(query, hits[i].get("document") or "") for i in batch], batch_size=batch_size,
+                    show_progress_bar=False,
+                )
+        except Exception as e:
+            logger.error(f"Error during re-ranking: {e}")
+            pending = batch + pending
+            break
+        per_pair = (time.perf_counter() - batch_started) / len(batch)
+        _seconds_per_pair = per_pair if _seconds_per_pair is None else 0.8 * _seconds_per_pair + 0.2 * per_pair
+        for i, score in zip(batch, batch_scores):
+            scores[i] = float(score)
+            _scores.put(_key(query, hits[i]), float(score))
+
+    metrics.inc("rerank_pairs_total", len(hits) - len(pending))
+    if pending:
+        metrics.inc("rerank_budget_exceeded_total")
+        logger.info(f"Re-ranking budget of {budget * 1000:.0f} ms left {len(pending)} of {len(hits)} hits unscored")
+    ranked = [dict(hits[i], rerank_score=scores[i]) for i in sorted(scores, key=lambda i: (-scores[i], i))]
+    return (ranked + [hits[i] for i in sorted(pending)])[:top_k]
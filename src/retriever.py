@@ -2,51 +2,81 @@
 Retriever module for ResearchMate.
 
 Provides functionality to retrieve top-k most relevant document chunks
-from the Chroma-backed vector store using embeddings.
+from the Chroma-backed vector store using embeddings, in two stages: a wide
+first-stage search, then cross-encoder re-ranking (src.reranker) down to k.
 """
 
-from typing import List, Tuple
-import numpy as np
+from typing import Dict, List, Optional, Tuple
 
+from .context import DEFAULT_TOKEN_BUDGET, PackedContext, build_context
+from .reranker import RERANK_CANDIDATES, RERANK_ENABLED, rerank as rerank_hits
 from .vectorstore import VectorStore
-from .embeddings import get_embedding
 
 class Retriever:
     """Retrieves relevant document chunks from the VectorStore."""
 
-    def __init__(self, vectorstore: VectorStore = None):
+    def __init__(self, vectorstore: VectorStore = None, rerank: Optional[bool] = None,
+                 candidates: int = RERANK_CANDIDATES, rerank_budget_ms: Optional[float] = None):
         # Use existing VectorStore or initialize a new one
         self.vs = vectorstore or VectorStore()
+        # Second stage: re-rank `candidates` first-stage hits (RERANK=0 turns it off)
+        self.rerank = RERANK_ENABLED if rerank is None else rerank
+        self.candidates = candidates
+        self.rerank_budget_ms = rerank_budget_ms
 
-    def retrieve(self, query: str, k: int = 5) -> List[Tuple[str, float]]:
+    def search(self, query: str, k: int, **search_options) -> List[Dict]:
         """
-        Retrieve top-k documents for a given query.
+        Two-stage search: fetches max(k, candidates) hits with `VectorStore.search`,
+        then keeps the k best by cross-encoder score (within the time budget).
+        """
+        if not self.rerank:
+            return self.vs.search(query, top_k=k, **search_options)
+        hits = self.vs.search(query, top_k=max(k, self.candidates), **search_options)
+        return rerank_hits(query, hits, top_k=k, budget_ms=self.rerank_budget_ms)
 
-        Returns a list of tuples: [(document_text, similarity_score), ...]
+    def retrieve(self, query: str, k: int = 5, group_by_paper: bool = False, mode: str = None,
+                 prefilter: int = 0, where: dict = None) -> List[Tuple[str, float]]:
         """
-        # Step 1: Embed the query
-        query_emb = get_embedding(query)
+        Retrieve top-k documents for a given query.
 
-        # Step 2: Query the vector store
-        results = self.vs.query(query_emb, n_results=k)
+        With `group_by_paper`, chunk hits are grouped so each paper appears once
+        (its best-matching chunk); otherwise individual chunks are returned.
+        `mode` ("vector", "lexical" or "hybrid"), `prefilter` and the metadata
+        filter `where` are passed to `VectorStore.search`.
 
-        # Chroma returns dict with 'documents', 'metadatas', 'distances', 'ids'
-        docs = results.get("documents", [[]])[0]  # results are nested list
-        distances = results.get("distances", [[]])[0]
+        Returns a list of tuples: [(document_text, similarity_score), ...]
+        The score is the cross-encoder relevance for re-ranked hits.
+        """
+        # Embed the query and search the vector store
+        hits = self.search(query, k, group_by_paper=group_by_paper, mode=mode, prefilter=prefilter, where=where)
 
-        # Step 3: Combine docs and distances
         retrieved = []
-        for doc, dist in zip(docs, distances):
+        for hit in hits:
             # Convert distance to similarity if needed (optional)
-            similarity = 1.0 / (1.0 + dist)  # simple transformation
-            retrieved.append((doc, similarity))
+            similarity = hit.get("rerank_score", 1.0 / (1.0 + hit["distance"]))  # simple transformation
+            retrieved.append((hit["document"], similarity))
 
         return retrieved
 
-    def retrieve_text(self, query: str, k: int = 5) -> str:
+    def retrieve_context(self, query: str, k: int = 8, token_budget: int = DEFAULT_TOKEN_BUDGET,
+                         mode: str = None, where: dict = None) -> PackedContext:
+        """
+        Retrieves (and re-ranks) top-k chunks and packs them into at most `token_budget` tokens:
+        near-duplicates are removed with MMR over the stored embeddings and chunks
+        that do not fit whole are trimmed to their most query-relevant sentences.
         """
-        Convenience method: returns concatenated top-k documents as a single string.
+        hits = self.search(query, k, include_embeddings=True, mode=mode, where=where)
+        return build_context(query, hits, token_budget, query_embedding=self.vs.embed_query(query)[0])
+
+    def retrieve_text(self, query: str, k: int = 5, token_budget: Optional[int] = DEFAULT_TOKEN_BUDGET) -> str:
+        """
+        Convenience method: returns the top-k documents as a single string.
         Useful for feeding to the summarizer.
+
+        The text is packed to `token_budget` tokens (see `retrieve_context`);
+        pass token_budget=None to concatenate the documents verbatim.
         """
+        if token_budget is not None:
+            return self.retrieve_context(query, k, token_budget).text
         docs = self.retrieve(query, k)
         return "\n\n".join([doc for doc, _ in docs])
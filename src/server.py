@@ -0,0 +1,341 @@
+"""
+server.py — Long-running HTTP service for ResearchMate search, ingest and summaries
+
+Keeps one warm VectorStore, embedding and re-ranking model for the life of the process:
+
+    python -m src.server --port 8000
+    # or: uvicorn src.server:app
+
+Endpoints:
+    POST /search           {"query", "top_k", "group_by_paper", "mode", "where"}
+    POST /search/batch     {"queries", "top_k", "group_by_paper", "mode", "where"}
+    POST /ingest           {"queries", "max_papers", "fetch_pdfs"} -> job id
+    GET  /ingest/{job_id}  job status and throughput report
+    POST /summarize        {"query", "top_k", "token_budget", "max_tokens"}
+    GET  /health
+    GET  /metrics          Prometheus text (?format=json for a JSON dump)
+
+Concurrent /search requests are micro-batched: requests arriving within
+SEARCH_BATCH_WAIT_MS of each other share one encode call and one store query.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from dataclasses import asdict
+from typing import Any, Dict, List, Literal, Optional
+
+import uvicorn
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel, Field
+
+from src import metrics
+from src.collector import iter_papers
+from src.context import DEFAULT_TOKEN_BUDGET
+from src.embedder import embed_batch
+from src.pipeline import PipelineConfig, run_pipeline
+from src.reranker import RERANK_ENABLED, get_reranker
+from src.retriever import Retriever
+from src.summarizer import summarize_topic
+from src.sharding import ShardedVectorStore, open_store, sharded_search_error
+from src.vectorstore import SEARCH_MODES, VectorStore
+
+logger = logging.getLogger("researchmate.server")
+
+SEARCH_BATCH_SIZE = int(os.getenv("SEARCH_BATCH_SIZE", "64"))
+SEARCH_BATCH_WAIT_MS = float(os.getenv("SEARCH_BATCH_WAIT_MS", "5"))
+
+
+class SearchRequest(BaseModel):
+    query: str
+    top_k: int = Field(3, ge=1, le=100)
+    group_by_paper: bool = True
+    mode: Optional[Literal[SEARCH_MODES]] = None
+    where: Optional[Dict[str, Any]] = None
+
+
+class BatchSearchRequest(BaseModel):
+    queries: List[str]
+    top_k: int = Field(3, ge=1, le=100)
+    group_by_paper: bool = True
+    mode: Optional[Literal[SEARCH_MODES]] = None
+    where: Optional[Dict[str, Any]] = None
+
+
+class IngestRequest(BaseModel):
+    queries: List[str]
+    max_papers: int = Field(5, ge=1)
+    fetch_pdfs: bool = True
+
+
+class SummarizeRequest(BaseModel):
+    query: str
+    top_k: int = Field(8, ge=1, le=50)
+    token_budget: int = Field(DEFAULT_TOKEN_BUDGET, ge=64)
+    max_tokens: int = Field(1000, ge=16)
+
+
+class MicroBatcher:
+    """
+    Collects concurrent search requests for up to `max_wait_ms` (or `max_batch`
+    requests) and answers them with one `VectorStore.search_many` call per
+    (grouping, search mode, filter) combination.
+    """
+
+    def __init__(self, vs: VectorStore, max_batch: int = SEARCH_BATCH_SIZE, max_wait_ms: float = SEARCH_BATCH_WAIT_MS):
+        self.vs = vs
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.batches = 0
+        self.requests = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def search(self, query: str, top_k: int, group_by_paper: bool, mode: Optional[str] = None,
+                     where: Optional[Dict] = None):
+        future = asyncio.get_running_loop().create_future()
+        options = (group_by_paper, mode, json.dumps(where, sort_keys=True) if where else None)
+        await self._queue.put((query, top_k, options, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            self.batches += 1
+            self.requests += len(batch)
+            try:
+                results = await loop.run_in_executor(None, self._search, batch)
+                for (_, _, _, future), hits in zip(batch, results):
+                    if not future.done():
+                        future.set_result(hits)
+            except Exception as e:
+                for *_, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _search(self, batch):
+        results = [None] * len(batch)
+        for options in dict.fromkeys(item[2] for item in batch):
+            group_by_paper, mode, where = options
+            members = [i for i, item in enumerate(batch) if item[2] == options]
+            # One store query at the largest top_k in the group, trimmed per request
+            top_k = max(batch[i][1] for i in members)
+            found = self.vs.search_many(
+                [batch[i][0] for i in members], top_k, group_by_paper=group_by_paper, mode=mode,
+                where=json.loads(where) if where else None,
+            )
+            for i, hits in zip(members, found):
+                results[i] = hits[:batch[i][1]]
+        return results
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "batches": self.batches,
+            "requests": self.requests,
+            "mean_batch_size": self.requests / self.batches if self.batches else 0.0,
+        }
+
+
+class IngestJobs:
+    """
+    Runs ingest jobs one at a time on a background thread against the warm store.
+    """
+
+    def __init__(self, vs: VectorStore):
+        self.vs = vs
+        self.jobs: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest-job")
+
+    def submit(self, request: IngestRequest) -> str:
+        job_id = uuid.uuid4().hex[:12]
+        with self._lock:
+            self.jobs[job_id] = {"id": job_id, "status": "queued", "queries": request.queries, "submitted": time.time()}
+        self._executor.submit(self._run, job_id, request)
+        return job_id
+
+    def _run(self, job_id: str, request: IngestRequest):
+        self._update(job_id, status="running", started=time.time())
+        try:
+            config = PipelineConfig(fetch_pdfs=request.fetch_pdfs)
+            report = run_pipeline(iter_papers(request.queries, max_results=request.max_papers), self.vs, config)
+            self._update(job_id, status="done", finished=time.time(), report=asdict(report))
+        except Exception as e:
+            logger.exception(f"Ingest job {job_id} failed")
+            self._update(job_id, status="failed", finished=time.time(), error=str(e))
+
+    def _update(self, job_id: str, **fields):
+        with self._lock:
+            self.jobs[job_id].update(fields)
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job else None
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+state: Dict = {}
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    vs = open_store()
+    # Load the embedding model now rather than on the first request
+    embed_batch(["warm up"], use_cache=False, model_name=vs.model_name)
+    if RERANK_ENABLED:
+        get_reranker()
+    batcher = MicroBatcher(vs)
+    batcher.start()
+    metrics.gauge("search_mean_batch_size", lambda: batcher.stats()["mean_batch_size"])
+    state.update(vs=vs, batcher=batcher, jobs=IngestJobs(vs))
+    logger.info("ResearchMate service ready")
+    try:
+        yield
+    finally:
+        await batcher.stop()
+        state["jobs"].shutdown()
+        vs.persist()
+
+
+app = FastAPI(title="ResearchMate", lifespan=lifespan)
+
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    started = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    path = route.path if route is not None else "unmatched"
+    metrics.observe("http_request_seconds", time.perf_counter() - started, path=path, method=request.method)
+    metrics.inc("http_requests_total", path=path, method=request.method, status=response.status_code)
+    return response
+
+
+@app.get("/health")
+async def health():
+    return {
+        "status": "ok",
+        "backend": state["vs"].backend,
+        "collection": state["vs"].collection_name,
+        "model": state["vs"].model_name,
+        "documents": state["vs"].count(),
+        "cache": state["vs"].cache_stats(),
+        "batching": state["batcher"].stats(),
+    }
+
+
+@app.get("/metrics")
+async def metrics_export(format: str = "prometheus"):
+    if format == "json":
+        return metrics.to_dict()
+    return PlainTextResponse(metrics.to_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+def _check_search_mode(mode: Optional[str]):
+    if isinstance(state["vs"], ShardedVectorStore):
+        error = sharded_search_error(mode)
+        if error:
+            raise HTTPException(status_code=400, detail=error)
+
+
+@app.post("/search")
+async def search(request: SearchRequest):
+    _check_search_mode(request.mode)
+    started = time.perf_counter()
+    hits = await state["batcher"].search(request.query, request.top_k, request.group_by_paper, request.mode, request.where)
+    return {"query": request.query, "hits": hits, "took_ms": (time.perf_counter() - started) * 1000}
+
+
+@app.post("/search/batch")
+async def search_batch(request: BatchSearchRequest):
+    _check_search_mode(request.mode)
+    started = time.perf_counter()
+    results = await asyncio.get_running_loop().run_in_executor(
+        None, lambda: state["vs"].search_many(request.queries, request.top_k, request.group_by_paper,
+                                          mode=request.mode, where=request.where)
+    )
+    return {
+        "results": [{"query": q, "hits": hits} for q, hits in zip(request.queries, results)],
+        "took_ms": (time.perf_counter() - started) * 1000,
+    }
+
+
+@app.post("/ingest", status_code=202)
+async def ingest(request: IngestRequest):
+    if not request.queries:
+        raise HTTPException(status_code=400, detail="queries must not be empty")
+    return {"job_id": state["jobs"].submit(request)}
+
+
+@app.get("/ingest/{job_id}")
+async def ingest_status(job_id: str):
+    job = state["jobs"].get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="unknown job")
+    return job
+
+
+@app.post("/summarize")
+async def summarize(request: SummarizeRequest):
+    def run():
+        context = Retriever(state["vs"]).retrieve_context(request.query, k=request.top_k, token_budget=request.token_budget)
+        return context, summarize_topic(request.query, context.text, max_tokens=request.max_tokens)
+
+    started = time.perf_counter()
+    try:
+        context, summary = await asyncio.get_running_loop().run_in_executor(None, run)
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return {
+        "query": request.query,
+        "summary": summary,
+        "context": {"tokens": context.tokens, "budget": context.budget, "chunks": context.ids,
+                    "duplicates": context.duplicates, "trimmed": context.trimmed},
+        "took_ms": (time.perf_counter() - started) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ResearchMate HTTP service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
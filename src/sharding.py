@@ -0,0 +1,385 @@
+"""
+sharding.py — Vector store partitioned across several shards
+
+    python -m src.app --mode ingest --queries "graph neural networks" --shards 8
+    python -m src.app --mode query --query "message passing" --shards 8
+
+A `ShardedVectorStore` splits the corpus across N independent `VectorStore`s,
+one per directory (`<persist_directory>/shard-03`). Each document goes to shard
+crc32(paper id) % N, where the paper id is the part of the chunk id before "#",
+so all chunks of a paper live on one shard.
+
+Every shard is served by its own worker process standing in for a node: it
+opens its store once and keeps it warm. The coordinator embeds queries once,
+sends the embeddings to all nodes in parallel and merges their per-shard top-k
+lists with a heap; writes are routed to the node that owns each document.
+With SHARD_PROCESSES=0 the shards are served from threads in the calling
+process instead.
+
+The shard count is recorded in `shards.json`; changing it means re-ingesting
+into a new directory (e.g. `--mode reindex` from the paper catalog).
+"""
+
+import atexit
+import heapq
+import json
+import logging
+import multiprocessing
+import os
+import time
+import zlib
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from src import metrics
+from src.cache import LRUCache
+from src.embedder import MODEL_NAME, embed_batch, model_dimension
+from src.utils import text_hash
+from src.vectorstore import (
+    COLLECTION_ALIAS,
+    LEGACY_MODEL,
+    QUERY_EMBEDDING_CACHE_SIZE,
+    SEARCH_BATCH_SIZE,
+    VectorStore,
+    group_hits,
+    read_registry,
+    register_collection,
+    set_alias,
+    store_root,
+    versioned_collection_name,
+)
+
+logger = logging.getLogger("researchmate.sharding")
+
+# Default shard count for `open_store`; 1 keeps a single unsharded store
+VECTOR_SHARDS = int(os.getenv("VECTOR_SHARDS", "1"))
+SHARD_PROCESSES = os.getenv("SHARD_PROCESSES", "1") != "0"
+SHARDS_FILE = "shards.json"
+# BM25 statistics are per shard, so lexical and hybrid scores do not merge across shards
+SHARDED_SEARCH_MODES = ("vector",)
+
+
+def open_store(persist_directory: str = "chroma_db", backend: str = None, shards: Optional[int] = None,
+               quantization: str = None):
+    """
+    A plain VectorStore, or a ShardedVectorStore when `shards` (default
+    VECTOR_SHARDS) is more than 1.
+    """
+    shards = VECTOR_SHARDS if shards is None else shards
+    if shards > 1:
+        return ShardedVectorStore(persist_directory, shards, backend, quantization)
+    return VectorStore(persist_directory, backend, quantization)
+
+
+def sharded_search_error(mode: Optional[str], prefilter: int = 0) -> Optional[str]:
+    """
+    Why a sharded store cannot run a search with these options, or None if it can.
+    """
+    if (mode or "vector") not in SHARDED_SEARCH_MODES:
+        return f"Sharded stores support vector search only, not {mode} search"
+    if prefilter:
+        return "Sharded stores do not support lexical prefiltering"
+    return None
+
+
+def shard_key(doc_id: str) -> str:
+    return doc_id.split("#", 1)[0]
+
+
+def shard_for(doc_id: str, shards: int) -> int:
+    """
+    Shard owning a document (or paper) id.
+    """
+    return zlib.crc32(shard_key(doc_id).encode("utf-8")) % shards
+
+
+# --- node side: one warm store per worker process ---------------------------
+
+_node_store = None
+
+
+def _open_node(persist_directory: str, backend: str, quantization: Optional[str]):
+    global _node_store
+    _node_store = VectorStore(persist_directory, backend, quantization)
+
+
+def _node_call(method: str, *args, **kwargs):
+    return getattr(_node_store, method)(*args, **kwargs)
+
+
+class ShardedVectorStore:
+    """
+    VectorStore-compatible facade over N shard stores (vector search only).
+    """
+
+    def __init__(self, persist_directory: str = "chroma_db", shards: int = 4, backend: str = None,
+                 quantization: str = None, processes: Optional[bool] = None):
+        self.persist_directory = str(persist_directory)
+        self.backend = backend or os.getenv("VECTOR_BACKEND", "chroma")
+        self.quantization = quantization
+        self.shards = self._check_layout(shards)
+        self.paths = [str(Path(self.persist_directory) / f"shard-{i:02d}") for i in range(self.shards)]
+        self.collection_name, self.model_name = self._prepare_shards()
+        self.version = 0
+        self._query_embeddings = LRUCache(max_entries=QUERY_EMBEDDING_CACHE_SIZE, name="query_embeddings")
+
+        processes = SHARD_PROCESSES if processes is None else processes
+        if processes:
+            # Spawned, not forked: nodes start on first use, when the parent may
+            # already run server threads and torch, which fork can deadlock
+            context = multiprocessing.get_context("spawn")
+            self._nodes = [
+                ProcessPoolExecutor(max_workers=1, mp_context=context, initializer=_open_node,
+                                    initargs=(path, self.backend, quantization))
+                for path in self.paths
+            ]
+            self._stores = None
+            # Stop the nodes before interpreter teardown
+            atexit.register(self.close)
+        else:
+            self._nodes = None
+            self._stores = [VectorStore(path, self.backend, quantization) for path in self.paths]
+            self._threads = ThreadPoolExecutor(max_workers=self.shards, thread_name_prefix="shard")
+        logger.info(f"Opened {self.shards} shards of {self.collection_name} under {self.persist_directory} "
+                    f"({self.backend}, {'processes' if processes else 'threads'})")
+
+    def _check_layout(self, shards: int) -> int:
+        path = Path(self.persist_directory) / SHARDS_FILE
+        if path.exists():
+            layout = json.loads(path.read_text())
+            if layout["shards"] != shards:
+                raise ValueError(f"{self.persist_directory} holds {layout['shards']} shards, not {shards}; "
+                                 f"re-ingest into a new directory to change the shard count")
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(json.dumps({"shards": shards, "backend": self.backend}))
+        return shards
+
+    def _prepare_shards(self):
+        """
+        Points every shard's alias at the same versioned collection, so nodes open
+        it without loading the embedding model themselves.
+        """
+        roots = [store_root(path, self.backend) for path in self.paths]
+        current = read_registry(roots[0])
+        name = current["aliases"].get(COLLECTION_ALIAS)
+        if name:
+            model_name = current["collections"].get(name, {}).get("model", LEGACY_MODEL)
+            dim = current["collections"].get(name, {}).get("dim")
+        else:
+            model_name = MODEL_NAME
+            dim = model_dimension(model_name)
+            name = versioned_collection_name(model_name, dim)
+        for root in roots:
+            registry = read_registry(root)
+            if registry["aliases"].get(COLLECTION_ALIAS) != name:
+                register_collection(root, name, model_name, dim)
+                set_alias(root, name)
+        return name, model_name
+
+    # --- dispatch -------------------------------------------------------------
+
+    def _submit(self, shard: int, method: str, *args, **kwargs):
+        if self._nodes is not None:
+            return self._nodes[shard].submit(_node_call, method, *args, **kwargs)
+        return self._threads.submit(getattr(self._stores[shard], method), *args, **kwargs)
+
+    def _all(self, method: str, *args, **kwargs) -> list:
+        futures = [self._submit(i, method, *args, **kwargs) for i in range(self.shards)]
+        return [f.result() for f in futures]
+
+    def _route(self, ids) -> Dict[int, List[int]]:
+        """
+        Positions of `ids` grouped by owning shard.
+        """
+        groups = defaultdict(list)
+        for i, doc_id in enumerate(ids):
+            groups[shard_for(doc_id, self.shards)].append(i)
+        return groups
+
+    def _routed(self, method: str, ids, **kwargs) -> Dict[int, object]:
+        """
+        Calls `method` on each shard with the part of `ids` it owns.
+        """
+        futures = {
+            shard: self._submit(shard, method, _take(ids, idx), **kwargs) for shard, idx in self._route(ids).items()
+        }
+        return {shard: f.result() for shard, f in futures.items()}
+
+    # --- writes ---------------------------------------------------------------
+
+    def add_documents(self, documents, metadatas=None, ids=None, batch_size=None, num_workers=None):
+        """
+        Same contract as `VectorStore.add_documents`: embeds changed documents once
+        here, then writes each to its shard.
+        """
+        if metadatas is None:
+            metadatas = [{} for _ in documents]
+        if ids is None:
+            ids = [text_hash(doc) for doc in documents]
+        metadatas = [dict(m, content_hash=text_hash(doc)) for doc, m in zip(documents, metadatas)]
+        stored = self.get_content_hashes(ids)
+        changed = [i for i, m in enumerate(metadatas) if stored.get(ids[i]) != m["content_hash"]]
+        if not changed:
+            logger.info(f"All {len(documents)} documents already up to date.")
+            return 0
+        documents = [documents[i] for i in changed]
+        embeddings = embed_batch(documents, batch_size=batch_size, num_workers=num_workers, model_name=self.model_name)
+        self.upsert_embeddings(documents, embeddings, [metadatas[i] for i in changed], [ids[i] for i in changed],
+                               model_name=self.model_name)
+        return len(changed)
+
+    def upsert_embeddings(self, documents, embeddings, metadatas, ids, model_name: str = None):
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        groups = self._route(ids)
+        futures = [
+            self._submit(shard, "upsert_embeddings", _take(documents, idx), embeddings[idx],
+                         _take(metadatas, idx), _take(ids, idx), model_name)
+            for shard, idx in groups.items()
+        ]
+        for f in futures:
+            f.result()
+        metrics.inc("shard_batches_total", len(groups))
+        self.version += 1
+
+    def delete_stale_chunks(self, paper_id: str, num_chunks: int):
+        self._submit(shard_for(paper_id, self.shards), "delete_stale_chunks", paper_id, num_chunks).result()
+        self.version += 1
+
+    def persist(self):
+        self._all("persist")
+
+    # --- reads ----------------------------------------------------------------
+
+    def count(self) -> int:
+        return sum(self._all("count"))
+
+    def shard_counts(self) -> List[int]:
+        return self._all("count")
+
+    def get_content_hashes(self, ids):
+        if not ids:
+            return {}
+        found = {}
+        for part in self._routed("get_content_hashes", list(ids)).values():
+            found.update(part)
+        return found
+
+    def existing_ids(self, ids):
+        if not ids:
+            return set()
+        return set().union(*self._routed("existing_ids", list(ids)).values())
+
+    def get_snippets(self, ids, max_chars: int = 300):
+        if not ids:
+            return {}
+        snippets = {}
+        for part in self._routed("get_snippets", list(ids), max_chars=max_chars).values():
+            snippets.update(part)
+        return snippets
+
+    def cache_stats(self):
+        return {"query_embeddings": self._query_embeddings.stats()}
+
+    def embed_query(self, query_text: str):
+        embedding = self._query_embeddings.get(query_text)
+        if embedding is None:
+            embedding = embed_batch([query_text], model_name=self.model_name)
+            self._query_embeddings.put(query_text, embedding)
+        return embedding
+
+    def _embed_queries(self, queries) -> np.ndarray:
+        embeddings = [self._query_embeddings.get(q) for q in queries]
+        to_embed = list(dict.fromkeys(q for q, e in zip(queries, embeddings) if e is None))
+        if to_embed:
+            fresh = dict(zip(to_embed, embed_batch(to_embed, model_name=self.model_name)))
+            for q, e in fresh.items():
+                self._query_embeddings.put(q, e[None, :])
+            embeddings = [e if e is not None else fresh[q][None, :] for q, e in zip(queries, embeddings)]
+        return np.vstack(embeddings)
+
+    def search(self, query_text: str, top_k: int = 3, group_by_paper: bool = False, overfetch: int = 4,
+               include_embeddings: bool = False, mode: str = None, prefilter: int = 0, where: dict = None,
+               include_documents: bool = True):
+        """
+        Vector search over all shards; see `VectorStore.search`. Raises
+        ValueError for a search mode shards cannot answer.
+        """
+        error = sharded_search_error(mode, prefilter)
+        if error:
+            raise ValueError(error)
+        try:
+            return self.search_many([query_text], top_k, group_by_paper, overfetch, include_embeddings, mode,
+                                    prefilter, where, include_documents)[0]
+        except Exception as e:
+            logger.error(f"Error during search: {e}")
+            return []
+
+    def search_many(self, queries, top_k: int = 3, group_by_paper: bool = False, overfetch: int = 4,
+                    include_embeddings: bool = False, mode: str = None, prefilter: int = 0, where: dict = None,
+                    include_documents: bool = True):
+        """
+        Embeds the queries once, runs them on every shard in parallel and merges
+        each query's per-shard hit lists (sorted by distance) with a heap.
+        """
+        error = sharded_search_error(mode, prefilter)
+        if error:
+            raise ValueError(error)
+        if not queries:
+            return []
+        started = time.perf_counter()
+        embeddings = self._embed_queries(list(queries))
+        n_results = top_k * overfetch if group_by_paper else top_k
+        with metrics.span("shard_fanout", shards=str(self.shards)):
+            per_shard = self._all("search_embeddings", embeddings, n_results, False, 1, include_embeddings, where,
+                                  include_documents)
+        results = []
+        for q in range(len(queries)):
+            merged = list(islice(heapq.merge(*(hits[q] for hits in per_shard), key=lambda h: h["distance"]),
+                                 n_results))
+            results.append(group_hits(merged, top_k) if group_by_paper else merged)
+        metrics.observe("search_seconds", time.perf_counter() - started, mode="sharded")
+        metrics.inc("search_queries_total", len(queries), mode="sharded")
+        return results
+
+    def search_batch(self, queries, top_k: int = 3, where: dict = None, batch_size: int = None):
+        """
+        Columnar vector search over all shards; see `VectorStore.search_batch`.
+        """
+        queries = list(queries)
+        batch_size = batch_size or SEARCH_BATCH_SIZE
+        ids = np.full((len(queries), top_k), None, dtype=object)
+        distances = np.full((len(queries), top_k), np.inf, dtype=np.float32)
+        if not queries:
+            return {"ids": ids, "distances": distances}
+
+        started = time.perf_counter()
+        embeddings = embed_batch(queries, model_name=self.model_name)
+        for start in range(0, len(queries), batch_size):
+            block = embeddings[start:start + batch_size]
+            per_shard = self._all("query_arrays", block, top_k, where)
+            # k-way merge of the sorted shard columns: best top_k of the concatenation
+            block_ids = np.hstack([i for i, _ in per_shard])
+            block_dist = np.hstack([d for _, d in per_shard])
+            order = np.argsort(block_dist, axis=1, kind="stable")[:, :top_k]
+            ids[start:start + len(block)] = np.take_along_axis(block_ids, order, axis=1)
+            distances[start:start + len(block)] = np.take_along_axis(block_dist, order, axis=1)
+        metrics.observe("search_seconds", time.perf_counter() - started, mode="batch")
+        metrics.inc("search_queries_total", len(queries), mode="batch")
+        return {"ids": ids, "distances": distances}
+
+    def close(self):
+        if self._nodes is not None:
+            for node in self._nodes:
+                node.shutdown()
+        else:
+            self._threads.shutdown()
+
+
+def _take(values, idx: List[int]) -> list:
+    return [values[i] for i in idx]
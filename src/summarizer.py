@@ -5,6 +5,11 @@ summarizer.py — ResearchMate Gemini-powered summarizer
 This module handles interaction with Google's Gemini API to summarize and synthesize
 research paper content.
 
+Summaries are cached on disk per (model, prompt) for SUMMARY_CACHE_TTL seconds.
+`stream_summary` yields text as it is generated, and `summarize_many` runs
+several summaries concurrently. Every entry point accepts `model=` so a local
+object with the same `generate_content` interface can stand in for Gemini.
+
 ✅ Requirements:
     pip install google-generativeai python-dotenv
 
@@ -16,16 +21,41 @@ research paper content.
         python -m src.app --q "Recent advances in diffusion models"
 """
 
+import asyncio
+import logging
 import os
+import threading
+import time
+from pathlib import Path
+from typing import Iterator, List, Optional, Sequence, Tuple
+
 from dotenv import load_dotenv
-import google.generativeai as genai
+
+from src import metrics
+from src.cache import DiskCache
+from src.utils import text_hash
 
 # Load environment variables from .env (if present)
 load_dotenv()
 
+logger = logging.getLogger("researchmate.summarizer")
+
+MODEL_NAME = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
+
+# Persistent summary cache (set SUMMARY_CACHE=0 to disable)
+DEFAULT_SUMMARY_CACHE_PATH = Path(__file__).parent.parent / "data" / "summary_cache.sqlite3"
+SUMMARY_CACHE_TTL = float(os.getenv("SUMMARY_CACHE_TTL", str(7 * 24 * 3600)))
+SUMMARY_CACHE_MAX_ENTRIES = int(os.getenv("SUMMARY_CACHE_MAX_ENTRIES", "10000"))
+SUMMARY_CACHE_MAX_BYTES = int(os.getenv("SUMMARY_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# Concurrent Gemini requests in summarize_many
+SUMMARY_CONCURRENCY = int(os.getenv("SUMMARY_CONCURRENCY", "4"))
+
 
 def init_gemini():
     """Initialize and configure the Gemini model."""
+    import google.generativeai as genai
+
     api_key = os.getenv("GEMINI_API_KEY")
     if not api_key:
         raise RuntimeError(
@@ -33,13 +63,52 @@ def init_gemini():
         )
     genai.configure(api_key=api_key)
 
-    model_name = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
-    model = genai.GenerativeModel(model_name)
+    model = genai.GenerativeModel(MODEL_NAME)
     return model
 
 
-# Initialize Gemini model globally (so it's loaded only once)
-model = init_gemini()
+# Gemini model, created on first use (so importing this module stays cheap)
+_model = None
+_model_lock = threading.Lock()
+
+
+def get_model():
+    """Return the shared Gemini model, initializing it on first call."""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                _model = init_gemini()
+    return _model
+
+
+_summary_cache = None
+_summary_cache_lock = threading.Lock()
+
+
+def get_summary_cache() -> Optional[DiskCache]:
+    """
+    Returns the process-wide summary cache, or None when disabled with SUMMARY_CACHE=0.
+    """
+    global _summary_cache
+    if os.getenv("SUMMARY_CACHE", "1") == "0":
+        return None
+    with _summary_cache_lock:
+        if _summary_cache is None:
+            _summary_cache = DiskCache(
+                os.getenv("SUMMARY_CACHE_PATH") or DEFAULT_SUMMARY_CACHE_PATH,
+                max_entries=SUMMARY_CACHE_MAX_ENTRIES,
+                max_bytes=SUMMARY_CACHE_MAX_BYTES,
+                ttl=SUMMARY_CACHE_TTL,
+                name="summary",
+            )
+            logger.info(f"Using summary cache at {_summary_cache.path}")
+    return _summary_cache
+
+
+def summary_cache_key(model, prompt: str, max_tokens: int) -> str:
+    model_name = getattr(model, "model_name", None) or type(model).__name__
+    return f"{model_name}:{max_tokens}:{text_hash(prompt)}"
 
 
 def make_summary_prompt(query: str, context: str) -> str:
@@ -72,19 +141,135 @@ Format your answer clearly using Markdown headings.
     return prompt
 
 
-def summarize_topic(query: str, context: str, max_tokens: int = 1000) -> str:
+def _response_text(response) -> str:
+    if hasattr(response, "text"):
+        return response.text.strip()
+    elif isinstance(response, str):
+        return response.strip()
+    return ""
+
+
+def _generation_config(max_tokens: int) -> dict:
+    return {"max_output_tokens": max_tokens}
+
+
+def summarize_topic(query: str, context: str, max_tokens: int = 1000, model=None, use_cache: bool = True) -> str:
     """
     Generate a Gemini-powered summary for the given research query and context.
+    `max_tokens` caps the length of the generated answer.
+
+    Summaries are cached on disk per (model, max_tokens, prompt); pass `model`
+    to use another object with the GenerativeModel interface (e.g. a local fake).
     """
     prompt = make_summary_prompt(query, context)
+    model = model or get_model()
+    key = summary_cache_key(model, prompt, max_tokens)
+    cache = get_summary_cache() if use_cache else None
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached.decode("utf-8")
 
+    started = time.perf_counter()
     try:
-        response = model.generate_content(prompt)
-        if hasattr(response, "text"):
-            return response.text.strip()
-        elif isinstance(response, str):
-            return response.strip()
+        text = _response_text(model.generate_content(prompt, generation_config=_generation_config(max_tokens)))
+    except Exception as e:
+        metrics.inc("summarize_topic_errors_total")
+        return f"[Gemini API Error] {str(e)}"
+    finally:
+        metrics.observe("summarize_topic_seconds", time.perf_counter() - started)
+    if not text:
+        return "[No valid text output returned by Gemini API.]"
+    if cache is not None:
+        cache.put(key, text.encode("utf-8"))
+    return text
+
+
+def stream_summary(query: str, context: str, max_tokens: int = 1000, model=None, use_cache: bool = True) -> Iterator[str]:
+    """
+    Yields the summary in pieces as Gemini produces them, for incremental rendering
+    (e.g. `st.write_stream`). A cached summary is yielded in one piece; a stream
+    that completes is added to the cache.
+    """
+    prompt = make_summary_prompt(query, context)
+    model = model or get_model()
+    key = summary_cache_key(model, prompt, max_tokens)
+    cache = get_summary_cache() if use_cache else None
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            yield cached.decode("utf-8")
+            return
+
+    parts = []
+    started = time.perf_counter()
+    try:
+        for chunk in model.generate_content(prompt, generation_config=_generation_config(max_tokens), stream=True):
+            text = getattr(chunk, "text", "")
+            if text:
+                if not parts:
+                    metrics.observe("summary_first_token_seconds", time.perf_counter() - started)
+                parts.append(text)
+                yield text
+    except Exception as e:
+        metrics.inc("summarize_topic_errors_total")
+        yield f"[Gemini API Error] {str(e)}"
+        return
+    finally:
+        # Includes time the consumer spent between pieces
+        metrics.observe("summarize_topic_seconds", time.perf_counter() - started, mode="stream")
+    if cache is not None and parts:
+        cache.put(key, "".join(parts).strip().encode("utf-8"))
+
+
+async def summarize_topic_async(query: str, context: str, max_tokens: int = 1000, model=None, use_cache: bool = True) -> str:
+    """
+    Async variant of `summarize_topic`, using the model's native async call when it has one.
+    """
+    prompt = make_summary_prompt(query, context)
+    model = model or await asyncio.to_thread(get_model)
+    key = summary_cache_key(model, prompt, max_tokens)
+    cache = get_summary_cache() if use_cache else None
+    if cache is not None:
+        cached = await asyncio.to_thread(cache.get, key)
+        if cached is not None:
+            return cached.decode("utf-8")
+
+    config = _generation_config(max_tokens)
+    started = time.perf_counter()
+    try:
+        if hasattr(model, "generate_content_async"):
+            response = await model.generate_content_async(prompt, generation_config=config)
         else:
-            return "[No valid text output returned by Gemini API.]"
+            response = await asyncio.to_thread(model.generate_content, prompt, generation_config=config)
+        text = _response_text(response)
     except Exception as e:
+        metrics.inc("summarize_topic_errors_total")
         return f"[Gemini API Error] {str(e)}"
+    finally:
+        metrics.observe("summarize_topic_seconds", time.perf_counter() - started, mode="async")
+    if not text:
+        return "[No valid text output returned by Gemini API.]"
+    if cache is not None:
+        await asyncio.to_thread(cache.put, key, text.encode("utf-8"))
+    return text
+
+
+async def summarize_many(
+    items: Sequence[Tuple[str, str]],
+    max_tokens: int = 1000,
+    concurrency: int = SUMMARY_CONCURRENCY,
+    model=None,
+    use_cache: bool = True,
+) -> List[str]:
+    """
+    Summarizes several (query, context) pairs concurrently, at most `concurrency`
+    requests in flight. Results are returned in input order.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run(query, context):
+        async with semaphore:
+            return await summarize_topic_async(query, context, max_tokens, model=model, use_cache=use_cache)
+
+    return list(await asyncio.gather(*(run(q, c) for q, c in items)))
@@ -1,11 +1,14 @@
 """Utility helpers: logging, simple retry decorator, and safe filenames."""
 
+import hashlib
 import logging
+import random
 import re
+import threading
 import time
 from functools import wraps
 from pathlib import Path
-from typing import Callable, Type, Union
+from typing import Callable, Dict, Optional, Type, Union
 
 logger = logging.getLogger("researchmate.utils")
 
@@ -20,6 +23,78 @@ def safe_filename(s: str) -> str:
     return s.strip().replace(" ", "_")
 
 
+def text_hash(text: str) -> str:
+    """Stable sha256 content hash of `text`, used for cache keys and change detection."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def file_hash(path: Union[str, Path], block_size: int = 1 << 20) -> str:
+    """sha256 of a file's bytes, read in blocks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+_ARXIV_NEW_ID = re.compile(r"(\d{4}\.\d{4,5})(v\d+)?")
+_ARXIV_OLD_ID = re.compile(r"([a-z\-]+(?:\.[A-Z]{2})?/\d{7})(v\d+)?")
+
+
+def parse_arxiv_id(s: Optional[str]) -> Optional[str]:
+    """Extract a version-less arXiv id from an id or URL, e.g. 'http://arxiv.org/abs/2302.07261v2' -> '2302.07261'.
+
+    Returns None when `s` does not contain an arXiv identifier.
+    """
+    if not s:
+        return None
+    m = _ARXIV_OLD_ID.search(s) or _ARXIV_NEW_ID.search(s)
+    return m.group(1) if m else None
+
+
+def paper_uid(paper: Dict) -> str:
+    """Deterministic id for a collected paper.
+
+    Prefers the arXiv id (so the same paper found through arXiv and Semantic Scholar
+    maps to one id), then the Semantic Scholar paperId, then a hash of the title.
+    """
+    arxiv_id = paper.get("arxiv_id") or (paper.get("source") == "arxiv" and parse_arxiv_id(paper.get("url") or paper.get("id")))
+    if arxiv_id:
+        return f"arxiv:{arxiv_id}"
+    if paper.get("source") == "semantic_scholar" and paper.get("id"):
+        return f"s2:{paper['id']}"
+    title = re.sub(r"\W+", " ", (paper.get("title") or "").lower()).strip()
+    return f"title:{text_hash(title)[:16]}"
+
+
+class TokenBucket:
+    """Thread-safe token-bucket rate limiter.
+
+    Tokens refill continuously at `rate` per second up to `capacity`; `acquire(n)`
+    blocks until `n` tokens are available and takes them.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0) -> None:
+        tokens = min(tokens, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+
 def ensure_dir(path: Union[str, Path]) -> Path:
     """Create `path` (and parents) if it does not exist and return a Path object."""
     p = Path(path)
@@ -27,19 +102,31 @@ def ensure_dir(path: Union[str, Path]) -> Path:
     return p
 
 
-def retry(on_exception: Union[Type[BaseException], tuple], tries: int = 3, delay: float = 1.0) -> Callable:
+def retry(
+    on_exception: Union[Type[BaseException], tuple],
+    tries: int = 3,
+    delay: float = 1.0,
+    backoff: float = 1.0,
+    max_delay: Optional[float] = None,
+    jitter: bool = False,
+) -> Callable:
     """A decorator factory that retries the wrapped function on `on_exception`.
 
     Args:
         on_exception: Exception class or tuple of exception classes to catch and retry on.
         tries: Number of attempts (including the first).
-        delay: Seconds to wait between attempts.
+        delay: Seconds to wait before the first retry.
+        backoff: Multiplier applied to the delay after each failed attempt (2.0 = exponential).
+        max_delay: Upper bound on the delay between attempts.
+        jitter: Sleep a uniformly random time up to the computed delay ("full jitter"),
+            so many clients retrying at once do not stay in lockstep.
     """
 
     def decorator(fn: Callable) -> Callable:
         @wraps(fn)
         def wrapper(*args, **kwargs):
             last_exc = None
+            wait = delay
             for attempt in range(1, tries + 1):
                 try:
                     return fn(*args, **kwargs)
@@ -49,10 +136,90 @@ def retry(on_exception: Union[Type[BaseException], tuple], tries: int = 3, delay
                     if attempt == tries:
                         logger.error("All %d attempts failed.", tries)
                         raise
-                    time.sleep(delay)
+                    time.sleep(random.uniform(0, wait) if jitter else wait)
+                    wait = wait * backoff if max_delay is None else min(max_delay, wait * backoff)
             # If we exit the loop without returning, re-raise the last exception
             if last_exc:
                 raise last_exc
         return wrapper
 
     return decorator
+
+
+class StartupProfiler:
+    """Records how long startup phases and first imports of heavy modules take.
+
+    `install()` wraps `builtins.__import__` so the first import of any module in
+    `modules` (and of anything it pulls in from that list) is timed; `phase(name)`
+    times a block of init work. `report()` renders both as an indented table.
+    """
+
+    DEFAULT_MODULES = (
+        "torch", "sentence_transformers", "transformers", "chromadb", "google.generativeai",
+        "faiss", "numpy", "PyPDF2", "feedparser", "requests",
+    )
+
+    def __init__(self, modules=DEFAULT_MODULES):
+        self.modules = set(modules)
+        self.events = []  # (kind, name, depth, seconds)
+        self._depth = 0
+        self._original_import = None
+        self._started = time.perf_counter()
+
+    def install(self) -> "StartupProfiler":
+        import builtins
+        import sys
+
+        self._original_import = original = builtins.__import__
+
+        def timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+            if level or name not in self.modules or name in sys.modules:
+                return original(name, globals, locals, fromlist, level)
+            slot = len(self.events)
+            self.events.append(None)
+            self._depth += 1
+            started = time.perf_counter()
+            try:
+                return original(name, globals, locals, fromlist, level)
+            finally:
+                self._depth -= 1
+                self.events[slot] = ("import", name, self._depth, time.perf_counter() - started)
+
+        builtins.__import__ = timed_import
+        return self
+
+    def uninstall(self) -> None:
+        import builtins
+
+        if self._original_import is not None:
+            builtins.__import__ = self._original_import
+            self._original_import = None
+
+    def phase(self, name: str):
+        profiler = self
+
+        class _Phase:
+            def __enter__(self):
+                self.slot = len(profiler.events)
+                profiler.events.append(None)
+                self.depth = profiler._depth
+                profiler._depth += 1
+                self.started = time.perf_counter()
+
+            def __exit__(self, *exc):
+                profiler._depth -= 1
+                profiler.events[self.slot] = ("phase", name, self.depth, time.perf_counter() - self.started)
+                return False
+
+        return _Phase()
+
+    def report(self) -> str:
+        lines = [f"{'startup step':<50}{'ms':>10}"]
+        for event in self.events:
+            if event is None:
+                continue
+            kind, name, depth, seconds = event
+            label = ("  " * depth) + (f"import {name}" if kind == "import" else name)
+            lines.append(f"{label:<50}{seconds * 1000:>10.1f}")
+        lines.append(f"{'total':<50}{(time.perf_counter() - self._started) * 1000:>10.1f}")
+        return "\n".join(lines)
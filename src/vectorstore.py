@@ -1,71 +1,701 @@
 """
-vectorstore.py — Manages ChromaDB vector storage for ResearchMate
+vectorstore.py — Manages vector storage for ResearchMate
+
+ChromaDB is the default backend. Setting `backend` (or VECTOR_BACKEND) to
+"numpy", "faiss" or "hnsw" swaps in the in-process `LocalCollection` from
+`src.local_index`, which exposes the same collection methods. For large
+corpora the "numpy" backend can keep only compact float16 / int8 / PQ codes in
+memory (`quantization` or VECTOR_QUANTIZATION), re-ranking at full precision.
+
+A BM25 `LexicalIndex` (src.lexical) is maintained next to the collection, so
+searches can run in "vector", "lexical" or "hybrid" (reciprocal rank fusion)
+mode, optionally scoring vectors only for the best lexical candidates.
+
+Collections are versioned by embedding model and dimension
+("researchmate_papers-all-minilm-l6-v2-384"); the store opens whichever one the
+"researchmate_papers" alias in `aliases.json` points at, so `src.migrate` can
+re-embed into a new collection and flip the alias while searches keep running.
 """
 
+import json
 import logging
-import chromadb
-from src.embedder import get_embeddings
+import os
+import re
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+from src import metrics
+from src.cache import LRUCache, TTLCache
+from src.embedder import MODEL_NAME, embed_batch, model_dimension
+from src.lexical import LexicalIndex, reciprocal_rank_fusion
+from src.local_index import BACKENDS as LOCAL_BACKENDS, LocalCollection
+from src.utils import text_hash
+
+try:
+    import fcntl
+except ImportError:  # Windows: writes are not guarded against a concurrent alias flip
+    fcntl = None
 
 logger = logging.getLogger(__name__)
 
+# Query caches; results also expire so writes from other processes show up
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "4096"))
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "1024"))
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "300"))
+
+SEARCH_MODES = ("vector", "lexical", "hybrid")
+DEFAULT_SEARCH_MODE = os.getenv("SEARCH_MODE", "vector")
+# Hits taken from each ranking before reciprocal rank fusion
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "50"))
+RRF_K = 60
+# Queries scored per store call in `search_batch`, bounding the distance matrix held in memory
+SEARCH_BATCH_SIZE = int(os.getenv("SEARCH_BATCH_SIZE", "256"))
+
+# The alias searches and ingest resolve; also the name of pre-versioning collections
+COLLECTION_ALIAS = "researchmate_papers"
+# Model every pre-versioning collection was built with
+LEGACY_MODEL = "all-MiniLM-L6-v2"
+ALIAS_FILE = "aliases.json"
+ALIAS_LOCK_FILE = "aliases.lock"
+# Seconds between checks for an alias flipped by another process
+ALIAS_CHECK_INTERVAL = float(os.getenv("ALIAS_CHECK_INTERVAL", "5"))
+
+
+def store_root(persist_directory, backend: str) -> Path:
+    """
+    Directory holding a backend's collections and alias registry.
+    """
+    return Path(persist_directory) / "local" if backend in LOCAL_BACKENDS else Path(persist_directory)
+
+
+def versioned_collection_name(model_name: str, dim: int) -> str:
+    """
+    Collection name tagged with the embedding model and dimension, kept within
+    Chroma's naming rules (3-63 characters of [a-z0-9._-]).
+    """
+    slug = re.sub(r"[^a-z0-9]+", "-", model_name.lower()).strip("-")
+    name = f"{COLLECTION_ALIAS}-{slug}-{dim}"
+    if len(name) > 63:
+        name = f"{name[:50].rstrip('-')}-{text_hash(name)[:8]}-{dim}"[-63:]
+    return name
+
+
+def read_registry(root) -> dict:
+    """
+    The alias registry stored under a backend's root directory:
+
+        {"aliases": {alias: collection}, "collections": {collection: {"model", "dim", "created"}}}
+    """
+    path = Path(root) / ALIAS_FILE
+    registry = json.loads(path.read_text()) if path.exists() else {}
+    registry.setdefault("aliases", {})
+    registry.setdefault("collections", {})
+    return registry
+
+
+def _write_registry(root, registry: dict):
+    path = Path(root) / ALIAS_FILE
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(registry, indent=2, sort_keys=True))
+    os.replace(tmp, path)
+
+
+def register_collection(root, name: str, model_name: str, dim: Optional[int]):
+    registry = read_registry(root)
+    if name not in registry["collections"]:
+        registry["collections"][name] = {"model": model_name, "dim": dim, "created": time.time()}
+        _write_registry(root, registry)
+
+
+def set_alias(root, collection: str, alias: str = COLLECTION_ALIAS):
+    """
+    Points `alias` at `collection`. The registry file is replaced atomically, so
+    readers see either the old or the new target.
+    """
+    registry = read_registry(root)
+    if collection not in registry["collections"]:
+        raise ValueError(f"Unknown collection '{collection}'")
+    previous = registry["aliases"].get(alias)
+    registry["aliases"][alias] = collection
+    _write_registry(root, registry)
+    logger.info(f"Alias {alias}: {previous} -> {collection}")
+
+
+@contextmanager
+def alias_lock(root, exclusive: bool = False):
+    """
+    Cross-process lock on a store's alias. Writers hold it shared while they
+    write; a migration holds it exclusively for its final catch-up and the alias
+    flip, so no write lands in the old collection after it was caught up.
+    """
+    if fcntl is None:
+        yield
+        return
+    path = Path(root) / ALIAS_LOCK_FILE
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
 class VectorStore:
-    def __init__(self, persist_directory: str = "chroma_db"):
-        # Initialize Chroma persistent client
-        self.client = chromadb.PersistentClient(path=persist_directory)
+    def __init__(self, persist_directory: str = "chroma_db", backend: str = None, quantization: str = None,
+                 collection_name: str = None, model_name: str = None):
+        """
+        Opens the collection the "researchmate_papers" alias points at, creating a
+        versioned collection for `model_name` (default EMBED_MODEL) when there is
+        none yet. Pass `collection_name` to pin a specific collection instead.
+        """
+        self.backend = backend or os.getenv("VECTOR_BACKEND", "chroma")
+        self.persist_directory = str(persist_directory)
+        self.quantization = quantization or os.getenv("VECTOR_QUANTIZATION") or None
+        self.pinned = collection_name is not None
+
+        self.root = store_root(persist_directory, self.backend)
+        if self.backend in LOCAL_BACKENDS:
+            self.client = None
+        elif self.backend == "chroma":
+            import chromadb
+
+            if self.quantization:
+                logger.warning("Quantization is only supported by the local backends; storing full precision")
+
+            # Initialize Chroma persistent client
+            self.client = chromadb.PersistentClient(path=self.persist_directory)
+        else:
+            raise ValueError(f"Unknown vector backend: {self.backend}")
 
-        # Create or load collection
-        self.collection_name = "researchmate_papers"
-        self.collection = self.client.get_or_create_collection(
-            name=self.collection_name
-        )
+        self._alias_checked = time.monotonic()
+        self._alias_mtime = self._registry_mtime()
+        if self.pinned:
+            info = read_registry(self.root)["collections"].get(collection_name, {})
+            model_name = model_name or info.get("model") or MODEL_NAME
+            register_collection(self.root, collection_name, model_name, info.get("dim") or model_dimension(model_name))
+        else:
+            collection_name, model_name = self._resolve_alias(model_name)
+        self._open(collection_name, model_name)
+        logger.info(f"Loaded existing collection: {self.collection_name} ({self.backend}, model {self.model_name})")
 
-        logger.info(f"Loaded existing collection: {self.collection_name}")
+    def _resolve_alias(self, model_name: str = None):
+        """
+        Returns (collection, model) for the alias, adopting a pre-versioning
+        collection or creating a versioned one on first use.
+        """
+        registry = read_registry(self.root)
+        name = registry["aliases"].get(COLLECTION_ALIAS)
+        if name:
+            stored_model = registry["collections"].get(name, {}).get("model", LEGACY_MODEL)
+            if model_name and model_name != stored_model:
+                logger.warning(
+                    f"Collection {name} was embedded with {stored_model}, not {model_name}; "
+                    f"run `--mode migrate --model {model_name}` to switch models"
+                )
+            return name, stored_model
+
+        if self._collection_exists(COLLECTION_ALIAS):
+            # Built before versioning, always with the then hard-coded model
+            name, model_name, dim = COLLECTION_ALIAS, LEGACY_MODEL, None
+        else:
+            model_name = model_name or MODEL_NAME
+            dim = model_dimension(model_name)
+            name = versioned_collection_name(model_name, dim)
+        register_collection(self.root, name, model_name, dim)
+        set_alias(self.root, name)
+        return name, model_name
+
+    def _collection_exists(self, name: str) -> bool:
+        if self.client is None:
+            return (self.root / name / "rows.sqlite3").exists()
+        return name in [getattr(c, "name", c) for c in self.client.list_collections()]
+
+    def _open(self, collection_name: str, model_name: str):
+        if self.client is None:
+            collection = LocalCollection(self.root, collection_name, self.backend, quantization=self.quantization)
+        else:
+            # Create or load collection
+            collection = self.client.get_or_create_collection(
+                name=collection_name, metadata={"embedding_model": model_name}
+            )
+        self.collection_name = collection_name
+        self.model_name = model_name
+        self.collection = collection
+
+        self.lexical = LexicalIndex(Path(self.persist_directory) / "lexical" / f"{collection_name}.npz")
+        self._lexical_checked = False
+
+        # Bumped on every write; part of the result cache key so writes invalidate it
+        self.version = getattr(self, "version", -1) + 1
+        self._query_embeddings = LRUCache(max_entries=QUERY_EMBEDDING_CACHE_SIZE, name="query_embeddings")
+        self._results = TTLCache(max_entries=RESULT_CACHE_SIZE, ttl=RESULT_CACHE_TTL, name="search_results")
+
+    def _registry_mtime(self):
+        try:
+            return (self.root / ALIAS_FILE).stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def refresh_alias(self, force: bool = False) -> bool:
+        """
+        Switches to the alias's current collection if another process (e.g. a
+        finished `src.migrate` job) flipped it. The registry is checked at most
+        every ALIAS_CHECK_INTERVAL seconds unless `force`d. Returns True on a switch.
+        """
+        if self.pinned:
+            return False
+        now = time.monotonic()
+        if not force and now - self._alias_checked < ALIAS_CHECK_INTERVAL:
+            return False
+        self._alias_checked = now
+        mtime = self._registry_mtime()
+        if mtime == self._alias_mtime:
+            return False
+        self._alias_mtime = mtime
+        registry = read_registry(self.root)
+        name = registry["aliases"].get(COLLECTION_ALIAS)
+        if not name or name == self.collection_name:
+            return False
+        model_name = registry["collections"].get(name, {}).get("model", LEGACY_MODEL)
+        logger.info(f"Alias {COLLECTION_ALIAS} now points at {name}; switching from {self.collection_name}")
+        self._open(name, model_name)
+        return True
+
+    @contextmanager
+    def _writing(self):
+        """
+        Holds the alias lock shared for a write, against the collection the alias
+        points at right now.
+        """
+        if self.pinned:
+            yield
+            return
+        with alias_lock(self.root):
+            self.refresh_alias(force=True)
+            yield
+
+    def _bump_version(self):
+        self.version += 1
+        self._results.clear()
+
+    def cache_stats(self):
+        """
+        Hit/miss counters for the query-embedding and search-result caches.
+        """
+        return {"query_embeddings": self._query_embeddings.stats(), "results": self._results.stats()}
+
+    def embed_query(self, query_text: str):
+        """
+        Returns the (1, dim) embedding of a query, reusing recently embedded queries.
+        """
+        self.refresh_alias()
+        embedding = self._query_embeddings.get(query_text)
+        if embedding is None:
+            embedding = embed_batch([query_text], model_name=self.model_name)
+            self._query_embeddings.put(query_text, embedding)
+        return embedding
 
-    def add_documents(self, documents, metadatas=None, ids=None):
+    def persist(self):
         """
-        Adds text documents to the vector store.
+        Flushes backend state that is not written on every update (the FAISS index
+        for local backends). Chroma persists on its own.
+        """
+        if hasattr(self.collection, "persist"):
+            self.collection.persist()
+        self.lexical.save()
+
+    def ensure_lexical_index(self, batch_size: int = 5000):
+        """
+        Builds the lexical index from the stored documents when it is missing or
+        out of step with the collection (e.g. a store created before it existed).
+        """
+        if self._lexical_checked:
+            return
+        self._lexical_checked = True
+        total = self.collection.count()
+        if len(self.lexical) == total:
+            return
+        logger.info(f"Rebuilding lexical index over {total} documents")
+        self.lexical = LexicalIndex(self.lexical.path)
+        for offset in range(0, total, batch_size):
+            page = self.collection.get(limit=batch_size, offset=offset, include=["documents"])
+            self.lexical.add(page["ids"], [d or "" for d in page["documents"]])
+        self.lexical.save()
+
+    def add_documents(self, documents, metadatas=None, ids=None, batch_size=None, num_workers=None):
+        """
+        Upserts text documents into the vector store.
+
+        Ids default to the content hash of each document. Documents whose stored
+        content hash is unchanged are skipped; the rest are embedded together through
+        the batched embedder. Returns the number of documents written.
         """
+        if metadatas is None:
+            metadatas = [{} for _ in documents]
+        if ids is None:
+            ids = [text_hash(doc) for doc in documents]
+        metadatas = [dict(m, content_hash=text_hash(doc)) for doc, m in zip(documents, metadatas)]
+
         try:
-            embeddings = [get_embeddings(doc) for doc in documents]
-
-            # Ensure metadatas and ids are lists of same length
-            if metadatas is None:
-                metadatas = [{} for _ in documents]
-            if ids is None:
-                ids = [str(i) for i in range(len(documents))]
-
-            self.collection.add(
-                ids=ids,
-                documents=documents,
-                embeddings=embeddings,
-                metadatas=metadatas,
+            stored = self.get_content_hashes(ids)
+            changed = [i for i, m in enumerate(metadatas) if stored.get(ids[i]) != m["content_hash"]]
+            if not changed:
+                logger.info(f"All {len(documents)} documents already up to date.")
+                return 0
+
+            documents = [documents[i] for i in changed]
+            model_name = self.model_name
+            embeddings = embed_batch(documents, batch_size=batch_size, num_workers=num_workers,
+                                     model_name=model_name)
+            self.upsert_embeddings(
+                documents,
+                embeddings,
+                metadatas=[metadatas[i] for i in changed],
+                ids=[ids[i] for i in changed],
+                model_name=model_name,
             )
-            logger.info(f"Added {len(documents)} documents to vectorstore.")
+            return len(changed)
         except Exception as e:
             logger.error(f"Error adding documents to vectorstore: {e}")
+            raise
+
+    def upsert_embeddings(self, documents, embeddings, metadatas, ids, model_name: str = None):
+        """
+        Inserts or replaces documents whose embeddings were already computed with
+        `model_name` (default: the store's model). If the alias was flipped to a
+        collection of another model meanwhile, the documents are re-embedded.
+        """
+        with self._writing():
+            if model_name and model_name != self.model_name:
+                logger.info(f"Store switched to {self.model_name}; re-embedding {len(documents)} documents")
+                embeddings = embed_batch(documents, model_name=self.model_name)
+            with metrics.span("store_upsert", backend=self.backend):
+                self.collection.upsert(
+                    ids=ids,
+                    documents=documents,
+                    embeddings=embeddings,
+                    metadatas=metadatas,
+                )
+            with metrics.span("lexical_update"):
+                self.lexical.add(ids, documents)
+            metrics.inc("store_documents_written_total", len(ids), backend=self.backend)
+            self._bump_version()
+        logger.info(f"Upserted {len(documents)} documents to vectorstore.")
+
+    def count(self) -> int:
+        self.refresh_alias()
+        return self.collection.count()
+
+    def get_content_hashes(self, ids):
+        """
+        Returns {id: content_hash} for the given ids that are already stored.
+        """
+        if not ids:
+            return {}
+        self.refresh_alias()
+        found = self.collection.get(ids=list(ids), include=["metadatas"])
+        return {
+            id_: (meta or {}).get("content_hash")
+            for id_, meta in zip(found["ids"], found["metadatas"])
+        }
+
+    def existing_ids(self, ids):
+        """
+        Returns the subset of `ids` already present in the collection.
+        """
+        if not ids:
+            return set()
+        self.refresh_alias()
+        return set(self.collection.get(ids=list(ids), include=[])["ids"])
+
+    def get_snippets(self, ids, max_chars: int = 300):
+        """
+        Returns {id: snippet} with the first `max_chars` characters (cut at a word
+        boundary) of each stored document, for displaying a page of hits.
+        """
+        if not ids:
+            return {}
+        self.refresh_alias()
+        found = self.collection.get(ids=list(ids), include=["documents"])
+        snippets = {}
+        for id_, doc in zip(found["ids"], found["documents"]):
+            doc = " ".join((doc or "").split())
+            if len(doc) > max_chars:
+                doc = doc[:max_chars].rsplit(" ", 1)[0] + "…"
+            snippets[id_] = doc
+        return snippets
 
-    def search(self, query_text: str, top_k: int = 3):
+    def delete_stale_chunks(self, paper_id: str, num_chunks: int):
+        """
+        Removes chunks of `paper_id` numbered `num_chunks` or higher, left over from
+        an earlier, longer version of the paper.
+        """
+        where = {"$and": [{"paper_id": paper_id}, {"chunk": {"$gte": num_chunks}}]}
+        with self._writing():
+            stale = self.collection.get(where=where, include=[])["ids"]
+            if not stale:
+                return
+            self.collection.delete(ids=stale)
+            self.lexical.delete(stale)
+            self._bump_version()
+
+    def search(self, query_text: str, top_k: int = 3, group_by_paper: bool = False, overfetch: int = 4,
+               include_embeddings: bool = False, mode: str = None, prefilter: int = 0, where: dict = None,
+               include_documents: bool = True):
         """
         Searches for the most similar documents to the given query.
+
+        With `group_by_paper`, chunk hits are grouped by their parent paper: up to
+        `top_k` papers are returned, each represented by its best chunk and carrying
+        all of its matched chunks under "chunks". `overfetch` controls how many
+        chunks are retrieved per requested paper.
+
+        `mode` is "vector" (dense similarity, the default via SEARCH_MODE),
+        "lexical" (BM25) or "hybrid" (reciprocal rank fusion of both; hits carry
+        the fused "score"). With `prefilter` > 0, vectors are scored only for the
+        best `prefilter` BM25 candidates instead of the whole collection.
+
+        `where` is a Chroma-style metadata filter (see `src.metadata.build_where`),
+        applied inside the store query rather than to the returned hits.
+
+        Results are cached for RESULT_CACHE_TTL seconds per (query, options,
+        collection version), so repeated searches skip the model and the store.
+        With `include_embeddings`, each hit also carries its stored "embedding";
+        with `include_documents=False`, hits carry only ids, metadata and scores
+        ("document" is None) and vector-mode searches do not read document text.
         """
         try:
-            query_embedding = get_embeddings(query_text)
+            return self.search_many(
+                [query_text], top_k, group_by_paper, overfetch, include_embeddings, mode, prefilter, where,
+                include_documents,
+            )[0]
+        except Exception as e:
+            logger.error(f"Error during search: {e}")
+            return []
+
+    def search_many(self, queries, top_k: int = 3, group_by_paper: bool = False, overfetch: int = 4,
+                    include_embeddings: bool = False, mode: str = None, prefilter: int = 0, where: dict = None,
+                    include_documents: bool = True):
+        """
+        Searches several queries at once and returns one hit list per query.
+
+        Cached results are reused; the remaining queries are embedded in a single
+        encode call and, in plain vector mode, sent to the store as a single
+        multi-embedding query.
+        """
+        mode = mode or DEFAULT_SEARCH_MODE
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode '{mode}', expected one of {SEARCH_MODES}")
+        self.refresh_alias()
+        started = time.perf_counter()
+        where_key = json.dumps(where, sort_keys=True) if where else None
+        options = (top_k, group_by_paper, overfetch, include_embeddings, mode, prefilter, where_key, include_documents,
+                   self.version)
+        results = [self._results.get((q,) + options) for q in queries]
+        missing = list(dict.fromkeys(q for q, r in zip(queries, results) if r is None))
+        if missing:
+            embeddings = [self._query_embeddings.get(q) for q in missing]
+            to_embed = [q for q, e in zip(missing, embeddings) if e is None]
+            if to_embed:
+                fresh = dict(zip(to_embed, embed_batch(to_embed, model_name=self.model_name)))
+                for q, e in fresh.items():
+                    self._query_embeddings.put(q, e[None, :])
+                embeddings = [e if e is not None else fresh[q][None, :] for q, e in zip(missing, embeddings)]
+            if mode == "vector" and not prefilter:
+                found = dict(zip(missing, self.search_embeddings(
+                    np.vstack(embeddings), top_k, group_by_paper, overfetch, include_embeddings, where,
+                    include_documents,
+                )))
+            else:
+                self.ensure_lexical_index()
+                # The filter is resolved once for the batch; BM25 then ranks only the ids it admits
+                admitted = self.collection.get(where=where, include=[])["ids"] if where else None
+                found = {
+                    q: self._search_with_lexical(
+                        q, e, top_k, group_by_paper, overfetch, include_embeddings, mode, prefilter, where, admitted
+                    )
+                    for q, e in zip(missing, embeddings)
+                }
+                if not include_documents:
+                    found = {q: [_without_document(h) for h in hits] for q, hits in found.items()}
+            for q, hits in found.items():
+                self._results.put((q,) + options, hits)
+            results = [r if r is not None else found[q] for q, r in zip(queries, results)]
+        metrics.observe("search_seconds", time.perf_counter() - started, mode=mode)
+        metrics.inc("search_queries_total", len(queries), mode=mode)
+        return [list(r) for r in results]
+
+    def search_batch(self, queries, top_k: int = 3, where: dict = None, batch_size: int = None):
+        """
+        Vector search for many queries, returned column-wise for bulk consumers
+        (evaluation sweeps, saved-search alerts):
+
+            {"ids": (n, top_k) object array, "distances": (n, top_k) float32 array}
+
+        Rows follow the input order; queries with fewer than `top_k` matches are
+        padded with None ids and inf distances. All queries are embedded in one
+        encode call, then scored `batch_size` queries per store call. Documents
+        and metadata are not fetched, and the per-query caches are bypassed.
+        """
+        queries = list(queries)
+        batch_size = batch_size or SEARCH_BATCH_SIZE
+        ids = np.full((len(queries), top_k), None, dtype=object)
+        distances = np.full((len(queries), top_k), np.inf, dtype=np.float32)
+        if not queries:
+            return {"ids": ids, "distances": distances}
+
+        self.refresh_alias()
+        started = time.perf_counter()
+        embeddings = embed_batch(queries, model_name=self.model_name)
+        for start in range(0, len(queries), batch_size):
+            block = embeddings[start:start + batch_size]
+            block_ids, block_dist = self.query_arrays(block, top_k, where)
+            ids[start:start + len(block)] = block_ids
+            distances[start:start + len(block)] = block_dist
+        metrics.observe("search_seconds", time.perf_counter() - started, mode="batch")
+        metrics.inc("search_queries_total", len(queries), mode="batch")
+        return {"ids": ids, "distances": distances}
+
+    def query_arrays(self, query_embeddings, top_k: int = 3, where: dict = None):
+        """
+        One store query for precomputed embeddings, returned as (ids, distances)
+        arrays of shape (n, top_k), padded with None / inf.
+        """
+        with metrics.span("store_query", backend=self.backend):
+            if isinstance(self.collection, LocalCollection):
+                return self.collection.query_arrays(query_embeddings, top_k, where=where)
             results = self.collection.query(
-                query_embeddings=[query_embedding],
-                n_results=top_k
+                query_embeddings=query_embeddings, n_results=top_k, where=where, include=["distances"]
             )
+        ids = np.full((len(query_embeddings), top_k), None, dtype=object)
+        distances = np.full((len(query_embeddings), top_k), np.inf, dtype=np.float32)
+        for q, (row_ids, row_dist) in enumerate(zip(results["ids"], results["distances"])):
+            ids[q, :len(row_ids)] = row_ids
+            distances[q, :len(row_dist)] = row_dist
+        return ids, distances
 
-            if not results or "documents" not in results:
+    def _score_ids(self, ids, query_embedding, include_embeddings: bool = False):
+        """
+        Fetches the given ids and computes their squared L2 distance to the query
+        (the same metric the store uses). Returns {id: hit}.
+        """
+        if not ids:
+            return {}
+        with metrics.span("store_get", backend=self.backend):
+            found = self.collection.get(ids=list(ids), include=["documents", "metadatas", "embeddings"])
+        if not found["ids"]:
+            return {}
+        vectors = np.asarray(found["embeddings"], dtype=np.float32)
+        query = np.asarray(query_embedding, dtype=np.float32).reshape(-1)
+        distances = ((vectors - query) ** 2).sum(axis=1)
+        hits = {}
+        for i, id_ in enumerate(found["ids"]):
+            hits[id_] = {
+                "id": id_,
+                "document": found["documents"][i],
+                "metadata": found["metadatas"][i],
+                "distance": float(distances[i]),
+            }
+            if include_embeddings:
+                hits[id_]["embedding"] = vectors[i]
+        return hits
+
+    def _lexical_search(self, query_text: str, k: int, admitted: Optional[list] = None) -> list:
+        """
+        Ids of the `k` best BM25 matches, ranked only among `admitted` (the ids a
+        metadata filter admits) when given.
+        """
+        with metrics.span("lexical_search"):
+            if admitted is not None and not admitted:
                 return []
+            return [id_ for id_, _ in self.lexical.search(query_text, k, candidates=admitted)]
+
+    def _search_with_lexical(self, query_text, query_embedding, top_k, group_by_paper, overfetch,
+                             include_embeddings, mode, prefilter, where=None, admitted=None):
+        n = top_k * overfetch if group_by_paper else top_k
+        pool = max(n, HYBRID_CANDIDATES)
+
+        if mode == "lexical":
+            ranked = self._lexical_search(query_text, n, admitted)
+            scored = self._score_ids(ranked, query_embedding, include_embeddings)
+            hits = [scored[id_] for id_ in ranked if id_ in scored]
+        else:
+            candidates = self._lexical_search(query_text, prefilter, admitted) if prefilter else []
+            if candidates:
+                # Dense scoring restricted to the lexical candidate set
+                scored = self._score_ids(candidates, query_embedding, include_embeddings)
+                dense = sorted(scored.values(), key=lambda h: h["distance"])[:pool]
+            else:
+                dense = self.search_embeddings(query_embedding, pool, include_embeddings=include_embeddings, where=where)[0]
 
+            if mode == "vector":
+                hits = dense[:n]
+            else:
+                lexical = self._lexical_search(query_text, pool, admitted)
+                fused = reciprocal_rank_fusion([[h["id"] for h in dense], lexical], RRF_K)
+                by_id = {h["id"]: h for h in dense}
+                by_id.update(self._score_ids([id_ for id_ in lexical if id_ not in by_id], query_embedding, include_embeddings))
+                ranked = sorted(fused, key=lambda id_: -fused[id_])[:n]
+                hits = [dict(by_id[id_], score=fused[id_]) for id_ in ranked if id_ in by_id]
+
+        return group_hits(hits, top_k) if group_by_paper else hits
+
+    def search_embeddings(self, query_embeddings, top_k: int = 3, group_by_paper: bool = False, overfetch: int = 4,
+                          include_embeddings: bool = False, where: dict = None, include_documents: bool = True):
+        """
+        Runs one store query for a batch of precomputed query embeddings and
+        returns a list of hit lists, one per query.
+        """
+        include = ["metadatas", "distances"] + (["documents"] if include_documents else [])
+        include += ["embeddings"] if include_embeddings else []
+        with metrics.span("store_query", backend=self.backend):
+            results = self.collection.query(
+                query_embeddings=query_embeddings,
+                n_results=top_k * overfetch if group_by_paper else top_k,
+                where=where,
+                include=include,
+            )
+
+        if not results or not results.get("ids"):
+            return [[] for _ in range(len(query_embeddings))]
+
+        all_hits = []
+        for q in range(len(results["ids"])):
             hits = []
-            for i in range(len(results["documents"][0])):
+            for i in range(len(results["ids"][q])):
                 hits.append({
-                    "document": results["documents"][0][i],
-                    "metadata": results["metadatas"][0][i],
-                    "distance": results["distances"][0][i],
+                    "id": results["ids"][q][i],
+                    "document": results["documents"][q][i] if include_documents else None,
+                    "metadata": results["metadatas"][q][i],
+                    "distance": results["distances"][q][i],
                 })
-            return hits
-        except Exception as e:
-            logger.error(f"Error during search: {e}")
-            return []
+                if include_embeddings:
+                    hits[-1]["embedding"] = np.asarray(results["embeddings"][q][i], dtype=np.float32)
+            all_hits.append(group_hits(hits, top_k) if group_by_paper else hits)
+        return all_hits
+
+
+def _without_document(hit):
+    hit = dict(hit, document=None)
+    if "chunks" in hit:
+        hit["chunks"] = [dict(c, document=None) for c in hit["chunks"]]
+    return hit
+
+
+def group_hits(hits, top_k):
+    """
+    Groups chunk hits (sorted by distance) by their `paper_id` metadata and returns
+    up to `top_k` paper-level hits, best first.
+    """
+    papers = {}
+    for hit in hits:
+        paper_id = (hit["metadata"] or {}).get("paper_id") or hit["id"]
+        if paper_id not in papers:
+            papers[paper_id] = dict(hit, paper_id=paper_id, chunks=[])
+        papers[paper_id]["chunks"].append(hit)
+    return list(papers.values())[:top_k]
@@ -1,21 +1,123 @@
+"""
+streamlit_app.py — Streamlit front end for ResearchMate
+
+    streamlit run streamlit_app.py
+
+The vector store, retriever and embedding model are process-wide resources
+(`st.cache_resource`), shared by every session instead of rebuilt on each
+rerun, and search results are cached per query (`st.cache_data`). Searches
+fetch ids and metadata only; document snippets are fetched for the results
+page being shown, and further pages are loaded on demand.
+"""
+
+import os
+import time
+
 import streamlit as st
-from src.vectorstore import VectorStore
 
-# Initialize vectorstore
-vs = VectorStore()
+from src.embedder import get_model
+from src.retriever import Retriever
+from src.sharding import open_store
+from src.summarizer import stream_summary
+
+# Papers fetched per query, shown RESULTS_PER_PAGE at a time
+MAX_RESULTS = int(os.getenv("UI_MAX_RESULTS", "50"))
+RESULTS_PER_PAGE = int(os.getenv("UI_RESULTS_PER_PAGE", "5"))
+SNIPPET_CHARS = 400
+# Pause before searching a changed query; typing more within it cancels the search
+DEBOUNCE_SECONDS = float(os.getenv("UI_DEBOUNCE_MS", "300")) / 1000.0
+MIN_QUERY_CHARS = 3
+CACHE_TTL = int(os.getenv("RESULT_CACHE_TTL", "300"))
+
+
+@st.cache_resource(show_spinner="Loading vector store and embedding model...")
+def get_store():
+    # Same alias, shard and collection-version resolution as the CLI and server
+    vs = open_store()
+    # Load the embedding model once per process rather than on the first search
+    get_model(vs.model_name)
+    return vs
+
+
+@st.cache_resource
+def get_retriever() -> Retriever:
+    return Retriever(get_store())
+
+
+@st.cache_data(ttl=CACHE_TTL, max_entries=512, show_spinner=False)
+def search_papers(query: str):
+    """
+    Paper-level hits for `query` without document text, and the search time in ms.
+    """
+    started = time.perf_counter()
+    hits = get_store().search(query, top_k=MAX_RESULTS, group_by_paper=True, include_documents=False)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    papers = []
+    for hit in hits:
+        meta = hit.get("metadata") or {}
+        papers.append({
+            "id": hit["id"],
+            "title": meta.get("title") or "Untitled",
+            "url": meta.get("url"),
+            "year": meta.get("year"),
+            "authors": meta.get("authors"),
+            "distance": hit.get("distance"),
+        })
+    return papers, elapsed_ms
+
+
+@st.cache_data(ttl=CACHE_TTL, max_entries=2048, show_spinner=False)
+def fetch_snippets(ids: tuple):
+    return get_store().get_snippets(ids, max_chars=SNIPPET_CHARS)
+
+
+def normalize(query: str) -> str:
+    return " ".join(query.split())
+
 
 st.title("ResearchMate - Semantic Paper Search")
 
 # Input query
-query = st.text_input("Enter your search query:")
-
-if query:
-    results = vs.search(query)
-    if results:
-        st.write(f"Found {len(results)} results:")
-        for hit in results:
-            st.subheader(hit['metadata'].get('title', 'Untitled'))
-            st.write(hit['document'][:500] + "...")  # show first 500 chars
-            st.write(f"Distance: {hit['distance']:.4f}")
+query = normalize(st.text_input("Enter your search query:"))
+state = st.session_state
+
+if len(query) >= MIN_QUERY_CHARS:
+    status = st.empty()
+    if state.get("query") != query:
+        # Debounce: a newer input during the pause reruns the script and the
+        # next Streamlit call below stops this run before it searches
+        time.sleep(DEBOUNCE_SECONDS)
+        status.caption("Searching...")
+        state.query, state.pages = query, 1
+
+    get_store()
+    started = time.perf_counter()
+    papers, search_ms = search_papers(query)
+    total_ms = (time.perf_counter() - started) * 1000
+    cached = total_ms < search_ms / 2
+    status.caption(f"{len(papers)} papers in {total_ms:.0f} ms" + (" (cached)" if cached else ""))
+
+    if papers:
+        shown = papers[:state.pages * RESULTS_PER_PAGE]
+        for start in range(0, len(shown), RESULTS_PER_PAGE):
+            page = shown[start:start + RESULTS_PER_PAGE]
+            snippets = fetch_snippets(tuple(p["id"] for p in page))
+            for paper in page:
+                st.subheader(paper["title"] + (f" ({paper['year']})" if paper["year"] else ""))
+                if paper["authors"]:
+                    st.caption(paper["authors"])
+                st.write(snippets.get(paper["id"], ""))
+                st.write((f"[Link]({paper['url']}) · " if paper["url"] else "") + f"Distance: {paper['distance']:.4f}")
+
+        if len(shown) < len(papers) and st.button("Show more results"):
+            state.pages += 1
+            st.rerun()
+
+        if st.button("Summarize"):
+            context = get_retriever().retrieve_text(query)
+            # Render the summary as Gemini streams it
+            st.write_stream(stream_summary(query, context))
     else:
         st.write("No results found.")
+elif query:
+    st.caption(f"Type at least {MIN_QUERY_CHARS} characters to search.")
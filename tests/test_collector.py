@@ -0,0 +1,132 @@
+"""
+test_collector.py — Paging, retries and rate limiting against a local stub server
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from src import collector
+
+ATOM_ENTRY = """<entry>
+  <id>http://arxiv.org/abs/2401.{n:05d}v1</id>
+  <published>2024-01-01T00:00:00Z</published>
+  <title>Paper {n}</title>
+  <summary>Abstract {n}</summary>
+  <author><name>Author {n}</name></author>
+  <link title="pdf" href="http://arxiv.org/pdf/2401.{n:05d}v1" rel="related" type="application/pdf"/>
+</entry>"""
+
+
+class StubServer:
+    """
+    Serves Semantic Scholar-style JSON on /s2 and an arXiv Atom feed on /arxiv
+    from `total` fake papers. Queued status codes are answered first, one per
+    request. Every request is recorded with its arrival time.
+    """
+
+    def __init__(self, total: int):
+        self.total = total
+        self.failures = []
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                params = {k: v[0] for k, v in parse_qs(url.query).items()}
+                stub.requests.append((time.monotonic(), url.path, params))
+                if stub.failures:
+                    self.send_response(stub.failures.pop(0))
+                    self.end_headers()
+                    return
+                if url.path == "/s2":
+                    start, count = int(params["offset"]), int(params["limit"])
+                    body = json.dumps({"data": [
+                        {"paperId": f"s2-{n}", "title": f"Paper {n}", "authors": [{"name": f"Author {n}"}], "year": 2024}
+                        for n in range(start, min(start + count, stub.total))
+                    ]}).encode()
+                    content_type = "application/json"
+                else:
+                    start, count = int(params["start"]), int(params["max_results"])
+                    entries = "".join(ATOM_ENTRY.format(n=n) for n in range(start, min(start + count, stub.total)))
+                    body = f'<feed xmlns="http://www.w3.org/2005/Atom">{entries}</feed>'.encode()
+                    content_type = "application/atom+xml"
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        self.base_urls = {"semantic_scholar": f"{self.url}/s2", "arxiv": f"{self.url}/arxiv"}
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    monkeypatch.setattr(collector, "_limiters", {})
+    monkeypatch.setitem(collector.RATE_LIMITS, "arxiv", 0.0)
+    monkeypatch.setitem(collector.RATE_LIMITS, "semantic_scholar", 0.0)
+    server = StubServer(total=250)
+    yield server
+    server.close()
+
+
+def test_iter_papers_pages_through_each_source(stub):
+    papers = list(collector.iter_papers(["q"], max_results=230, page_size=100, base_urls=stub.base_urls))
+    s2 = [p for p in papers if p["source"] == "semantic_scholar"]
+    arxiv = [p for p in papers if p["source"] == "arxiv"]
+    assert [p["id"] for p in s2] == [f"s2-{n}" for n in range(230)]
+    assert [p["id"] for p in arxiv] == [f"2401.{n:05d}v1" for n in range(230)]
+    assert all(p["query"] == "q" for p in papers)
+
+    pages = sorted((int(p["offset"]), int(p["limit"])) for _, path, p in stub.requests if path == "/s2")
+    assert pages == [(0, 100), (100, 100), (200, 30)]
+
+
+def test_iter_source_stops_at_the_last_short_page(stub):
+    stub.total = 5
+    pages = list(collector.iter_source("arxiv", "q", max_results=50, page_size=2, base_url=stub.base_urls["arxiv"]))
+    assert [len(page) for page in pages] == [2, 2, 1]
+    assert len(stub.requests) == 3
+
+
+def test_fetch_retries_on_429_and_5xx(stub, monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(time, "sleep", sleeps.append)
+    stub.failures = [429, 503]
+    papers = collector.search_semantic_scholar("q", max_results=3, base_url=stub.base_urls["semantic_scholar"])
+    assert [p["id"] for p in papers] == ["s2-0", "s2-1", "s2-2"]
+    assert len(stub.requests) == 3
+    assert len(sleeps) == 2
+
+    # Failing every attempt gives up after three and returns no papers
+    stub.requests.clear()
+    stub.failures = [500, 502, 503]
+    assert collector.search_semantic_scholar("q", base_url=stub.base_urls["semantic_scholar"]) == []
+    assert len(stub.requests) == 3
+
+
+def test_requests_to_a_source_are_rate_limited(stub, monkeypatch):
+    monkeypatch.setitem(collector.RATE_LIMITS, "semantic_scholar", 0.2)
+    papers = list(collector.iter_papers(
+        ["a", "b"], max_results=20, sources=["semantic_scholar"], page_size=10, base_urls=stub.base_urls,
+    ))
+    assert len(papers) == 40
+    arrivals = sorted(t for t, _, _ in stub.requests)
+    assert len(arrivals) == 4
+    # Both queries' fetch threads share the source's limiter
+    assert min(b - a for a, b in zip(arrivals, arrivals[1:])) >= 0.18
@@ -0,0 +1,182 @@
+"""
+test_summarizer.py — Summary cache, streaming and concurrency, against a local fake model
+"""
+
+import asyncio
+import re
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from src import metrics, summarizer
+from src.cache import DiskCache
+
+
+class FakeModel:
+    """
+    Stands in for `genai.GenerativeModel`: answers with the prompt's topic, can
+    stream the answer in word-sized chunks, and records how many calls were in
+    flight at once.
+    """
+
+    model_name = "fake-gemini"
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    @staticmethod
+    def answer(prompt: str) -> str:
+        topic = re.search(r"\*\*Query / Topic:\*\* (.*)", prompt).group(1)
+        return f"Summary of {topic}."
+
+    def generate_content(self, prompt, generation_config=None, stream=False):
+        self.calls += 1
+        text = self.answer(prompt)
+        if stream:
+            return [SimpleNamespace(text=word) for word in re.findall(r"\S+\s*", text)]
+        return SimpleNamespace(text=text)
+
+    async def generate_content_async(self, prompt, generation_config=None):
+        self.calls += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+            return SimpleNamespace(text=self.answer(prompt))
+        finally:
+            self.in_flight -= 1
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.delenv("SUMMARY_CACHE", raising=False)
+    store = DiskCache(tmp_path / "summaries.sqlite3", max_entries=3, max_bytes=1000, ttl=60, name="summary")
+    monkeypatch.setattr(summarizer, "_summary_cache", store)
+    return store
+
+
+def cache_key(model, topic: str, max_tokens: int = 1000) -> str:
+    return summarizer.summary_cache_key(model, summarizer.make_summary_prompt(topic, "ctx"), max_tokens)
+
+
+def test_summary_cache_hit_and_miss(cache):
+    model = FakeModel()
+    first = summarizer.summarize_topic("graph neural networks", "ctx", model=model)
+    again = summarizer.summarize_topic("graph neural networks", "ctx", model=model)
+    assert first == again == "Summary of graph neural networks."
+    assert model.calls == 1
+
+    summarizer.summarize_topic("graph neural networks", "other ctx", model=model)
+    summarizer.summarize_topic("graph neural networks", "ctx", max_tokens=50, model=model)
+    assert model.calls == 3
+    assert cache.hits == 1
+
+
+def test_summary_cache_disabled(cache, monkeypatch):
+    monkeypatch.setenv("SUMMARY_CACHE", "0")
+    model = FakeModel()
+    summarizer.summarize_topic("diffusion", "ctx", model=model)
+    summarizer.summarize_topic("diffusion", "ctx", model=model)
+    assert model.calls == 2
+    assert len(cache) == 0
+
+
+def test_summary_cache_ttl_expiry(cache, monkeypatch):
+    model = FakeModel()
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now)
+    summarizer.summarize_topic("diffusion", "ctx", model=model)
+    monkeypatch.setattr(time, "time", lambda: now + 59)
+    summarizer.summarize_topic("diffusion", "ctx", model=model)
+    assert model.calls == 1
+
+    monkeypatch.setattr(time, "time", lambda: now + 61)
+    summarizer.summarize_topic("diffusion", "ctx", model=model)
+    assert model.calls == 2
+
+
+def test_summary_cache_evicts_by_entries_and_bytes(cache):
+    model = FakeModel()
+    for topic in ("a", "b", "c", "d"):
+        summarizer.summarize_topic(topic, "ctx", model=model)
+    assert len(cache) == 3
+    # The least recently used summary ("a") was evicted
+    summarizer.summarize_topic("a", "ctx", model=model)
+    assert model.calls == 5
+
+    # Two ~600-byte summaries exceed max_bytes: the older one goes
+    summarizer.summarize_topic("x" * 600, "ctx", model=model)
+    summarizer.summarize_topic("y" * 600, "ctx", model=model)
+    assert cache.get(cache_key(model, "x" * 600)) is None
+    assert cache.get(cache_key(model, "y" * 600)) is not None
+
+
+def test_stream_summary_yields_partial_chunks_and_caches(cache):
+    model = FakeModel()
+    chunks = list(summarizer.stream_summary("sparse attention", "ctx", model=model))
+    assert chunks == ["Summary ", "of ", "sparse ", "attention."]
+    assert cache.get(cache_key(model, "sparse attention")) == b"Summary of sparse attention."
+
+    cached = list(summarizer.stream_summary("sparse attention", "ctx", model=model))
+    assert cached == ["Summary of sparse attention."]
+    assert model.calls == 1
+
+
+def test_stream_summary_reports_errors_without_caching(cache):
+    class FailingModel(FakeModel):
+        def generate_content(self, prompt, generation_config=None, stream=False):
+            def chunks():
+                yield SimpleNamespace(text="Partial ")
+                raise RuntimeError("quota exceeded")
+            return chunks()
+
+    model = FailingModel()
+    chunks = list(summarizer.stream_summary("topic", "ctx", model=model))
+    assert chunks == ["Partial ", "[Gemini API Error] quota exceeded"]
+    assert len(cache) == 0
+
+
+def summarize_errors() -> float:
+    return metrics.to_dict()["counters"].get("summarize_topic_errors_total", {}).get("_", 0.0)
+
+
+def test_summarize_topic_counts_errors_without_caching(cache):
+    class FailingModel(FakeModel):
+        def generate_content(self, prompt, generation_config=None, stream=False):
+            raise RuntimeError("quota exceeded")
+
+    before = summarize_errors()
+    assert summarizer.summarize_topic("topic", "ctx", model=FailingModel()) == "[Gemini API Error] quota exceeded"
+    assert summarize_errors() == before + 1
+    assert len(cache) == 0
+
+
+def test_summarize_many_runs_concurrently(cache):
+    cache.max_entries = None
+    model = FakeModel(delay=0.05)
+    topics = [f"topic {i}" for i in range(8)]
+    started = time.perf_counter()
+    results = asyncio.run(summarizer.summarize_many([(t, "ctx") for t in topics], concurrency=4, model=model))
+    elapsed = time.perf_counter() - started
+    assert results == [f"Summary of {t}." for t in topics]
+    assert model.max_in_flight == 4
+    assert elapsed < 8 * 0.05
+
+    # All cached now: no further model calls
+    asyncio.run(summarizer.summarize_many([(t, "ctx") for t in topics], model=model))
+    assert model.calls == 8
+
+
+def test_summarize_many_without_async_api(cache):
+    class SyncModel:
+        model_name = "fake-sync"
+
+        def generate_content(self, prompt, generation_config=None):
+            return SimpleNamespace(text=FakeModel.answer(prompt))
+
+    results = asyncio.run(summarizer.summarize_many([("a", "ctx"), ("b", "ctx")], model=SyncModel()))
+    assert results == ["Summary of a.", "Summary of b."]